@@ -1,24 +1,120 @@
 
-from matplotlib import pyplot
-from matplotlib.patches import Rectangle
+import collections
+import io
+import itertools
+import math
+import re
+import sys
+import time
+import zlib
+from array import array
 
 import imageIO.png
 
 
-def createInitializedGreyscalePixelArray(image_width, image_height, initValue = 0):
+# Pixel arrays are stored as a single flat array.array in row-major order instead of a list of lists.
+# A PixelArray knows its width, height, stride (the number of elements between the start of two consecutive rows)
+# and typecode (the array.array element type, e.g. 'B' for 8 bit greyscale, 'd' for floats, 'i' for labels).
+# Indexing a PixelArray with a row index returns a writable memoryview of that row, so the old
+# pixel_array[y][x] access pattern keeps working for code that has not been ported to flat indexing.
+class PixelArray:
+    def __init__(self, image_width, image_height, typecode = 'd', data = None, stride = None):
+        if stride is None:
+            stride = image_width
+        if data is None:
+            data = array(typecode, [0]) * (stride * image_height)
+        self.width = image_width
+        self.height = image_height
+        self.stride = stride
+        self.typecode = typecode
+        self.data = data
+        self.view = memoryview(data)
 
-    new_array = [[initValue for x in range(image_width)] for y in range(image_height)]
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, y):
+        if y < 0:
+            y += self.height
+        if y < 0 or y >= self.height:
+            raise IndexError("row index out of range")
+        start = y * self.stride
+        return self.view[start:start + self.width]
+
+    def __iter__(self):
+        for y in range(self.height):
+            start = y * self.stride
+            yield self.view[start:start + self.width]
+
+    # returns a copy of row y as a flat array, which is much faster to iterate over than the memoryview row
+    def getRow(self, y):
+        start = y * self.stride
+        return self.data[start:start + self.width]
+
+    # overwrites the pixels of row y starting at column x_start with the given sequence of values
+    def setRow(self, y, values, x_start = 0):
+        if len(values) == 0:
+            return
+        start = y * self.stride + x_start
+        self.data[start:start + len(values)] = array(self.typecode, values)
+
+    # pixel arrays are pickled as their flat array (the memoryview cannot be), e.g. to pass them to worker processes
+    def __reduce__(self):
+        return (PixelArray, (self.width, self.height, self.typecode, self.data, self.stride))
+
+    def isContiguous(self):
+        return self.stride == self.width
+
+    def toListOfLists(self):
+        return [row.tolist() for row in self]
+
+
+# picks the smallest array typecode that can hold all values of an old style list-of-lists pixel array
+def inferTypecode(values):
+    if all(isinstance(v, int) for v in values):
+        if len(values) == 0 or (min(values) >= 0 and max(values) <= 255):
+            return 'B'
+        return 'q'
+    return 'd'
+
+# compatibility adapter: accepts either a PixelArray or a list of lists and returns a PixelArray
+def asPixelArray(pixel_array, image_width, image_height, typecode = None):
+    if isinstance(pixel_array, PixelArray):
+        return pixel_array
+    values = [v for row in pixel_array[:image_height] for v in row[:image_width]]
+    if typecode is None:
+        typecode = inferTypecode(values)
+    return PixelArray(image_width, image_height, typecode, array(typecode, values))
+
+
+def createInitializedGreyscalePixelArray(image_width, image_height, initValue = 0, typecode = 'd'):
+
+    new_array = PixelArray(image_width, image_height, typecode, array(typecode, [initValue]) * (image_width * image_height))
     return new_array
 
+# A set of named pixel arrays that are reused as the outputs of the pipeline stages from one image to the next (see
+# computeQRCodeMask), so that a long running process does not allocate a new set of full size arrays for every image.
+# An array is only replaced when an image of a different size (or a different typecode) comes in.
+class ScratchBuffers:
+    def __init__(self):
+        self.arrays = {}
+
+    def get(self, name, image_width, image_height, typecode = 'd'):
+        pixel_array = self.arrays.get(name)
+        if pixel_array is None or (pixel_array.width, pixel_array.height, pixel_array.typecode) != (image_width, image_height, typecode):
+            pixel_array = createInitializedGreyscalePixelArray(image_width, image_height, typecode=typecode)
+            self.arrays[name] = pixel_array
+        return pixel_array
+
 class Queue:
     def __init__(self):
-        self.items = []
+        self.items = collections.deque()
 
     def isEmpty(self):
-        return self.items == []
+        return len(self.items) == 0
 
     def enqueue(self, item):
-        self.items.insert(0,item)
+        self.items.appendleft(item)
 
     def dequeue(self):
         return self.items.pop()
@@ -26,78 +122,184 @@ class Queue:
     def size(self):
         return len(self.items)
 
-# this function reads an RGB color png file and returns width, height, as well as pixel arrays for r,g,b
+# opens a png reader on a file name, or on the contents of a png file (bytes, bytearray or memoryview, parsed in place
+# without a copy, so it must not change while the reader is used), so the image reading functions below can also be
+# used on uploaded data that never touches the disk; files are memory mapped, so use the reader in a with block (or
+# close it) to release the file
+def openPNGReader(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return imageIO.png.Reader(bytes=source)
+    return imageIO.png.Reader(filename=source, memory_map=True)
+
+# splits the rows given by imageIO.png.Reader.asDirect into channels, one row at a time: yields a tuple with one
+# array per channel (r, g, b for colour images, or just the grey value for greyscale images), the alpha channel is
+# dropped and low bit depths (e.g. 1 bit black and white scans) are stretched to 8 bit values
+def iterRGBImageRows(image_rows, image_info):
+    planes = image_info['planes']
+    bitdepth = image_info['bitdepth']
+    channels = 1 if image_info['greyscale'] else 3
+    typecode = 'BH'[bitdepth > 8]
+
+    table = None
+    if bitdepth < 8:
+        maxval = 2 ** bitdepth - 1
+        table = bytes(round(v * 255 / maxval) if v <= maxval else 0 for v in range(256))
+
+    for row in image_rows:
+        # the values of one channel are stored every planes values in the row, so a strided slice picks them out
+        channel_rows = tuple(array(typecode, row[c::planes]) for c in range(channels))
+        if table is not None:
+            channel_rows = tuple(array('B', channel.tobytes().translate(table)) for channel in channel_rows)
+        yield channel_rows
+
+# this function reads a png file (file name or bytes) and returns width, height, as well as pixel arrays for r,g,b
+# besides RGB images, RGBA, greyscale (with or without alpha) and palette images are supported; the alpha channel is
+# dropped, and for greyscale images r, g and b are the same pixel array
 def readRGBImageToSeparatePixelArrays(input_filename):
 
-    image_reader = imageIO.png.Reader(filename=input_filename)
-    # png reader gives us width and height, as well as RGB data in image_rows (a list of rows of RGB triplets)
-    (image_width, image_height, rgb_image_rows, rgb_image_info) = image_reader.read()
+    with openPNGReader(input_filename) as image_reader:
+        # png reader gives us width and height, as well as the pixel data in image_rows (a list of rows of RGB
+        # triplets, or L, LA or RGBA values); asDirect already resolves palettes and transparency into plain channel
+        # values
+        (image_width, image_height, image_rows, image_info) = image_reader.asDirect()
 
-    print("read image width={}, height={}".format(image_width, image_height))
+        return readRGBImageRowsToSeparatePixelArrays(image_width, image_height, image_rows, image_info)
+
+# the same as readRGBImageToSeparatePixelArrays, for rows that have already been read, e.g. the result of asDirect on
+# an imageIO.png.Decoder that was fed the png data as it arrived
+def readRGBImageRowsToSeparatePixelArrays(image_width, image_height, image_rows, image_info):
+    typecode = 'BH'[image_info['bitdepth'] > 8]
+    channels = 1 if image_info['greyscale'] else 3
 
-    # our pixel arrays are lists of lists, where each inner list stores one row of greyscale pixels
-    pixel_array_r = []
-    pixel_array_g = []
-    pixel_array_b = []
-
-    for row in rgb_image_rows:
-        pixel_row_r = []
-        pixel_row_g = []
-        pixel_row_b = []
-        r = 0
-        g = 0
-        b = 0
-        for elem in range(len(row)):
-            # RGB triplets are stored consecutively in image_rows
-            if elem % 3 == 0:
-                r = row[elem]
-            elif elem % 3 == 1:
-                g = row[elem]
-            else:
-                b = row[elem]
-                pixel_row_r.append(r)
-                pixel_row_g.append(g)
-                pixel_row_b.append(b)
-
-        pixel_array_r.append(pixel_row_r)
-        pixel_array_g.append(pixel_row_g)
-        pixel_array_b.append(pixel_row_b)
-
-    return (image_width, image_height, pixel_array_r, pixel_array_g, pixel_array_b)
+    # our pixel arrays are flat arrays, where each row of greyscale pixels is stored after the previous one
+    channel_arrays = [array(typecode) for c in range(channels)]
+    for channel_rows in iterRGBImageRows(image_rows, image_info):
+        for c in range(channels):
+            channel_arrays[c].extend(channel_rows[c])
+
+    pixel_arrays = [PixelArray(image_width, image_height, typecode, channel) for channel in channel_arrays]
+    if channels == 1:
+        pixel_arrays = pixel_arrays * 3
+
+    return (image_width, image_height, pixel_arrays[0], pixel_arrays[1], pixel_arrays[2])
+
+# this function reads a png file straight into a single 8 bit greyscale pixel array, without ever creating the
+# r, g and b pixel arrays; the conversion is approximate: it uses 16 bit fixed-point weights (see
+# imageIO.png.Reader.asLuma8), so a pixel can differ by 1 from computeRGBToSingleGreyscale when the weighted sum is
+# within 0.001 of a half (9443 of the 2 ** 24 colours, not only the sums that are exactly a half); 16 bit images are
+# scaled to 8 bits, while computeRGBToSingleGreyscale keeps 16 bit values
+def readGreyscaleImageToPixelArray(input_filename):
+
+    with openPNGReader(input_filename) as image_reader:
+        (image_width, image_height, luma_rows, luma_info) = image_reader.asLuma8()
+
+        pixel_array = array('B')
+        for row in luma_rows:
+            pixel_array.frombytes(row)
+
+    return (image_width, image_height, PixelArray(image_width, image_height, 'B', pixel_array))
 
 # This method packs together three individual pixel arrays for r, g and b values into a single array that is fit for
 # use in matplotlib's imshow method
 def prepareRGBImageForImshowFromIndividualArrays(r,g,b,w,h):
     rgbImage = []
     for y in range(h):
-        row = []
-        for x in range(w):
-            triple = []
-            triple.append(r[y][x])
-            triple.append(g[y][x])
-            triple.append(b[y][x])
-            row.append(triple)
+        row = [[rv, gv, bv] for rv, gv, bv in zip(r[y], g[y], b[y])]
         rgbImage.append(row)
     return rgbImage
     
 
 # This method takes a greyscale pixel array and writes it into a png file
-def writeGreyscalePixelArraytoPNG(output_filename, pixel_array, image_width, image_height):
-    # now write the pixel array as a greyscale png
+# filtering selects a png filter for every row (see imageIO.png.Writer): None (the default) writes the rows
+# unfiltered, while "fast", "balanced" or "small" make greyscale debug images with large flat areas much smaller
+# binary images (every pixel 0 or 1, or 0 or 255, like the threshold, morphology and connected component masks) are
+# written as 1 bit greyscale pngs: binary = None detects them, True requires the image to be binary (a ValueError is
+# raised otherwise) and False always writes 8 bit pixels
+# a 1 bit png only holds black and white, so the foreground of a 0/1 mask written as 1 bit is read back as 255 by
+# readGreyscaleImageToPixelArray, while with binary = False the values are written unchanged and read back as 0/1
+# compression is the zlib level and strategy the zlib strategy (e.g. zlib.Z_RLE, see imageIO.png.Writer); binary
+# images use Z_RLE, whatever the level, unless a strategy is given
+def writeGreyscalePixelArraytoPNG(output_filename, pixel_array, image_width, image_height, filtering = None,
+                                  binary = None, compression = None, strategy = None):
     file = open(output_filename, 'wb')  # binary mode is important
-    writer = imageIO.png.Writer(image_width, image_height, greyscale=True)
-    writer.write(file, pixel_array)
+    writeGreyscalePixelArrayToPNGFile(file, pixel_array, image_width, image_height, filtering, binary, compression,
+                                      strategy)
     file.close()
 
+# the same as writeGreyscalePixelArraytoPNG, for a file object opened in binary mode (or e.g. an io.BytesIO)
+def writeGreyscalePixelArrayToPNGFile(file, pixel_array, image_width, image_height, filtering = None,
+                                      binary = None, compression = None, strategy = None):
+    pixel_array = asPixelArray(pixel_array, image_width, image_height)
+    on_value = findBinaryOnValue(pixel_array) if binary is not False else None
+    if binary is True and on_value is None:
+        raise ValueError("binary = True needs an image whose pixels are all 0 or 1, or all 0 or 255")
+    if on_value is not None:
+        # 1 bit pixels: every foreground pixel becomes 1 (white), read back as 255 by readGreyscaleImageToPixelArray
+        if pixel_array.typecode == 'B':
+            table = bytes(1 if v == on_value else 0 for v in range(256))
+            rows = (row.tobytes().translate(table) for row in pixel_array)
+        else:
+            rows = (bytes(1 if v else 0 for v in row) for row in pixel_array)
+        if strategy is None:
+            strategy = zlib.Z_RLE
+        writer = imageIO.png.Writer(image_width, image_height, greyscale=True, bitdepth=1, compression=compression,
+                                    strategy=strategy)
+        writer.write(file, rows)
+        return
+    if pixel_array.typecode == 'B':
+        rows = pixel_array
+    elif pixel_array.typecode == 'd':
+        # float pixel arrays (e.g. edge or smoothing results) are rounded to the nearest integer
+        rows = (array('B', map(round, row)) for row in pixel_array)
+    else:
+        rows = (array('B', row) for row in pixel_array)
+    # now write the pixel array as a greyscale png
+    writer = imageIO.png.Writer(image_width, image_height, greyscale=True, filtering=filtering,
+                                compression=compression, strategy=strategy)
+    writer.write(file, rows)
+
+# the value of the foreground pixels when every pixel of pixel_array is 0 or that value (1 or 255), otherwise None
+# (an image that is all 0 counts as binary, with foreground value 255)
+def findBinaryOnValue(pixel_array):
+    values = set()
+    for row in pixel_array:
+        values.update(row)
+        if len(values) > 2:
+            return None
+    values.discard(0)
+    if not values:
+        return 255
+    if len(values) == 1 and values <= {1, 255}:
+        return values.pop()
+    return None
+
 # EXTRA CODE
 
-def computeRGBToSingleGreyscale(pixel_array_r, pixel_array_g, pixel_array_b, image_width, image_height):
+# the greyscale values of one row of r, g and b values
+def computeRGBRowToGreyscale(row_r, row_g, row_b):
+    return [round(0.299 * r + 0.587 * g + 0.114 * b) for r, g, b in zip(row_r, row_g, row_b)]
+
+# the typecode of the greyscale pixel array computeRGBToSingleGreyscale creates for the given r, g and b pixel arrays:
+# 8 bit (or 16 bit) input gives greyscale values of the same range
+def greyscaleTypecode(pixel_array_r, pixel_array_g, pixel_array_b):
+    typecode = pixel_array_r.typecode
+    if typecode not in ('B', 'H') or pixel_array_g.typecode != typecode or pixel_array_b.typecode != typecode:
+        return 'd'
+    return typecode
+
+# the result is written into out when given (a PixelArray of the same size and typecode, e.g. from ScratchBuffers)
+def computeRGBToSingleGreyscale(pixel_array_r, pixel_array_g, pixel_array_b, image_width, image_height, out = None):
+    pixel_array_r = asPixelArray(pixel_array_r, image_width, image_height)
+    pixel_array_g = asPixelArray(pixel_array_g, image_width, image_height)
+    pixel_array_b = asPixelArray(pixel_array_b, image_width, image_height)
     
-    greyscale_pixel_array = createInitializedGreyscalePixelArray(image_width, image_height)
+    greyscale_pixel_array = out
+    if greyscale_pixel_array is None:
+        typecode = greyscaleTypecode(pixel_array_r, pixel_array_g, pixel_array_b)
+        greyscale_pixel_array = createInitializedGreyscalePixelArray(image_width, image_height, typecode=typecode)
     
     for row in range(image_height):
-        for column in range(image_width):
-            greyscale_pixel_array[row][column] = round(0.299 * pixel_array_r[row][column] + 0.587 * pixel_array_g[row][column] + 0.114 * pixel_array_b[row][column])
+        greyscale_pixel_array.setRow(row, computeRGBRowToGreyscale(pixel_array_r.getRow(row), pixel_array_g.getRow(row), pixel_array_b.getRow(row)))
     
     return greyscale_pixel_array
 
@@ -121,174 +323,601 @@ def computeRGBToGreyscale(pixel_array_r, pixel_array_g, pixel_array_b, image_wid
 # contrast stretching
 def computeMinAndMaxValues(pixel_array, image_width, image_height):
     if image_width > 0 and image_height > 0:
-        pMin = pixel_array[0][0]
-        pMax = pixel_array[0][0]
+        pixel_array = asPixelArray(pixel_array, image_width, image_height)
     else:
         return [0,0]
     
+    data = pixel_array.data
+    if pixel_array.isContiguous():
+        return [min(data), max(data)]
+    
+    pMin = data[0]
+    pMax = data[0]
     for y in range(image_height):
-        for x in range(image_width):
-            c_val = pixel_array[y][x]
-            if c_val > pMax:
-                pMax = c_val
-            elif c_val < pMin:
-                pMin = c_val
+        start = y * pixel_array.stride
+        row = data[start:start + image_width]
+        pMin = min(pMin, min(row))
+        pMax = max(pMax, max(row))
             
     return [pMin,pMax]
     
 
-def scaleTo0And255AndQuantize(pixel_array, image_width, image_height):
-    tmp = createInitializedGreyscalePixelArray(image_width, image_height)
-    minMax = computeMinAndMaxValues(pixel_array, image_width, image_height)
+# the range [min, max] can be given as minMax when pixel_array is only a part of the image that is stretched
+# the result is written into out when given (an 8 bit PixelArray of the same size)
+def scaleTo0And255AndQuantize(pixel_array, image_width, image_height, minMax = None, out = None):
+    pixel_array = asPixelArray(pixel_array, image_width, image_height)
+    tmp = out
+    if tmp is None:
+        tmp = createInitializedGreyscalePixelArray(image_width, image_height, typecode='B')
+    if minMax is None:
+        minMax = computeMinAndMaxValues(pixel_array, image_width, image_height)
     
     #print(minMax)
     
     if minMax[0] == minMax[1]:
+        if out is not None:
+            zeros = [0] * image_width
+            for y in range(image_height):
+                tmp.setRow(y, zeros)
         return tmp
     
+    pMin = minMax[0]
+    factor = 255/(minMax[1]-minMax[0])
     for y in range(image_height):
-        for x in range(image_width):
-            tmp[y][x] = round(((pixel_array[y][x] - minMax[0]) * (255/(minMax[1]-minMax[0]))))
+        tmp.setRow(y, [round(((v - pMin) * factor)) for v in pixel_array.getRow(y)])
     
     return tmp
 
+# column sums (top + 2 * middle + bottom) of the vertical Sobel kernel, for every column of row y
+def sobelColumnSums(pixel_array, y):
+    return [t + (2 * m) + b for t, m, b in zip(pixel_array.getRow(y-1), pixel_array.getRow(y), pixel_array.getRow(y+1))]
+
+# row sums (left + 2 * middle + right) of the horizontal Sobel kernel, for every interior column of row y
+def sobelRowSums(pixel_array, y):
+    row = pixel_array.getRow(y)
+    return [l + (2 * m) + r for l, m, r in zip(row, row[1:], row[2:])]
+
+# the row sums of rows 0 and 1, the start of a window over the row sums that the horizontal Sobel kernels slide down
+# the image: the rows above and below output row y have the same parity, so the row sums of row y + 1 replace those of
+# row y - 1 in window[(y + 1) % 2] once they are used, and every row sum is computed once
+def sobelRowSumsWindow(pixel_array):
+    return [sobelRowSums(pixel_array, 0), sobelRowSums(pixel_array, 1)]
+
 def computeVerticalEdgesSobelAbsolute(pixel_array, image_width, image_height):
+    pixel_array = asPixelArray(pixel_array, image_width, image_height)
     tmp = createInitializedGreyscalePixelArray(image_width, image_height)
     
     for y in range(1,image_height-1):
-        for x in range(1,image_width-1):
-            left = pixel_array[y-1][x-1] + (2 * pixel_array[y][x-1]) + pixel_array[y+1][x-1]
-            right = pixel_array[y-1][x+1] + (2 * pixel_array[y][x+1]) + pixel_array[y+1][x+1]
-            val = (right - left)/8
-            tmp[y][x] = abs(val)
+        columns = sobelColumnSums(pixel_array, y)
+        # val = (right - left)/8
+        tmp.setRow(y, [abs((right - left)/8) for left, right in zip(columns, columns[2:])], 1)
             
     return tmp
 
 def computeHorizontalEdgesSobelAbsolute(pixel_array, image_width, image_height):
+    pixel_array = asPixelArray(pixel_array, image_width, image_height)
     tmp = createInitializedGreyscalePixelArray(image_width, image_height)
     
+    if image_height < 3:
+        return tmp
+    # row sums of the rows above and below output row y, see sobelRowSumsWindow
+    row_sums = sobelRowSumsWindow(pixel_array)
     for y in range(1,image_height-1):
-        for x in range(1,image_width-1):
-            top = pixel_array[y-1][x-1] + (2 * pixel_array[y-1][x]) + pixel_array[y-1][x+1]
-            bot = pixel_array[y+1][x-1] + (2 * pixel_array[y+1][x]) + pixel_array[y+1][x+1]
-            
-            val = (top - bot)/8
-            tmp[y][x] = abs(val)
+        top = row_sums[(y - 1) % 2]
+        bot = row_sums[(y + 1) % 2] = sobelRowSums(pixel_array, y+1)
+        # val = (top - bot)/8
+        tmp.setRow(y, [abs((t - b)/8) for t, b in zip(top, bot)], 1)
             
     return tmp
 
+# computes computeVerticalEdgesSobelAbsolute + computeHorizontalEdgesSobelAbsolute in a single pass: the three rows
+# around every output row are read once and give both the column sums (for the vertical edges) and the row sums (for
+# the horizontal edges); the result is written into out, a preallocated float PixelArray that can be reused between
+# calls (a new one is created when out is None), and is bit-identical to adding the two separate results
+def computeEdgesSobelAbsoluteSum(pixel_array, image_width, image_height, out = None):
+    pixel_array = asPixelArray(pixel_array, image_width, image_height)
+    if out is None:
+        out = createInitializedGreyscalePixelArray(image_width, image_height)
+    
+    zeros = [0] * image_width
+    if image_height < 3 or image_width < 3:
+        for y in range(image_height):
+            out.setRow(y, zeros)
+        return out
+    
+    out.setRow(0, zeros)
+    out.setRow(image_height - 1, zeros)
+    # row sums of the rows above and below the current output row, see sobelRowSumsWindow
+    row_sums = sobelRowSumsWindow(pixel_array)
+    for y in range(1, image_height - 1):
+        top = row_sums[(y - 1) % 2]
+        bot = row_sums[(y + 1) % 2] = sobelRowSums(pixel_array, y + 1)
+        columns = sobelColumnSums(pixel_array, y)
+        out.setRow(y, [0] + [abs((right - left)/8) + abs((t - b)/8)
+                             for left, right, t, b in zip(columns, columns[2:], top, bot)] + [0])
+    
+    return out
+
+# the signed Sobel gradients of every pixel, with the same scaling and direction as the two absolute edge functions:
+# gx = (right - left) / 8 and gy = (top - bottom) / 8; the border pixels are 0
+# returns a dictionary of PixelArrays with the entries "gx" and "gy", plus "magnitude" (the L2 norm
+# sqrt(gx * gx + gy * gy)) and "orientation" (atan2(gy, gx) in radians) when asked for; all of them are filled in the
+# same pass over the image
+def computeSobelGradients(pixel_array, image_width, image_height, magnitude = False, orientation = False):
+    pixel_array = asPixelArray(pixel_array, image_width, image_height)
+    gradients = {"gx": createInitializedGreyscalePixelArray(image_width, image_height),
+                 "gy": createInitializedGreyscalePixelArray(image_width, image_height)}
+    if magnitude:
+        gradients["magnitude"] = createInitializedGreyscalePixelArray(image_width, image_height)
+    if orientation:
+        gradients["orientation"] = createInitializedGreyscalePixelArray(image_width, image_height)
+    
+    if image_height < 3 or image_width < 3:
+        return gradients
+    
+    row_sums = sobelRowSumsWindow(pixel_array)
+    for y in range(1, image_height - 1):
+        top = row_sums[(y - 1) % 2]
+        bot = row_sums[(y + 1) % 2] = sobelRowSums(pixel_array, y + 1)
+        columns = sobelColumnSums(pixel_array, y)
+        gx = [(right - left)/8 for left, right in zip(columns, columns[2:])]
+        gy = [(t - b)/8 for t, b in zip(top, bot)]
+        gradients["gx"].setRow(y, gx, 1)
+        gradients["gy"].setRow(y, gy, 1)
+        if magnitude:
+            gradients["magnitude"].setRow(y, [math.hypot(dx, dy) for dx, dy in zip(gx, gy)], 1)
+        if orientation:
+            gradients["orientation"].setRow(y, [math.atan2(dy, dx) for dx, dy in zip(gx, gy)], 1)
+    
+    return gradients
+
+# sums of three horizontally neighbouring pixels, for every interior column of row y
+def boxRowSums(pixel_array, y):
+    row = pixel_array.getRow(y)
+    return [l + m + r for l, m, r in zip(row, row[1:], row[2:])]
+
 def computeBoxAveraging3x3(pixel_array, image_width, image_height):
+    pixel_array = asPixelArray(pixel_array, image_width, image_height)
     tmp = createInitializedGreyscalePixelArray(image_width, image_height)
     
+    if image_height < 3:
+        return tmp
+    # each row sum is reused by the three output rows it contributes to
+    top = boxRowSums(pixel_array, 0)
+    lr = boxRowSums(pixel_array, 1)
     for y in range(1,image_height-1):
-        for x in range(1,image_width-1):
-            top = pixel_array[y-1][x-1] + pixel_array[y-1][x] + pixel_array[y-1][x+1]
-            bot = pixel_array[y+1][x-1] + pixel_array[y+1][x] + pixel_array[y+1][x+1]
-            lr = pixel_array[y][x-1] + pixel_array[y][x] + pixel_array[y][x+1]
-            val = (top + bot + lr)/9
-            tmp[y][x] = val
+        bot = boxRowSums(pixel_array, y+1)
+        tmp.setRow(y, [(t + b + m)/9 for t, b, m in zip(top, bot, lr)], 1)
+        top, lr = lr, bot
             
     return tmp
 
-def computeThresholdGE(pixel_array, threshold_value, image_width, image_height):
+# box averaging with an arbitrary (2 * radius + 1) x (2 * radius + 1) kernel; like computeBoxAveraging3x3, the pixels
+# closer than radius to the image border are set to 0
+# the box kernel is separable: every row is summed with a sliding window first (using prefix sums), and the columns
+# of those row sums are kept as running sums (add the row entering the window, subtract the row leaving it), so the
+# cost per pixel does not depend on the radius
+# for float input the running sums can differ from computeBoxAveraging3x3 in the last bits; integer input is exact
+# an IntegralImage of pixel_array can be passed in when it is already available, and is then used instead
+def computeBoxAveraging(pixel_array, image_width, image_height, radius = 1, integral_image = None):
+    if integral_image is not None:
+        return integral_image.computeBoxAveraging(radius)
+    pixel_array = asPixelArray(pixel_array, image_width, image_height)
     tmp = createInitializedGreyscalePixelArray(image_width, image_height)
+    size = 2 * radius + 1
+    area = size * size
+    
+    if image_width < size or image_height < size:
+        return tmp
+    
+    # window sums of row y, for the columns radius to image_width - radius - 1
+    def rowWindowSums(y):
+        prefix = [0]
+        prefix.extend(itertools.accumulate(pixel_array.getRow(y)))
+        return [right - left for left, right in zip(prefix, prefix[size:])]
+    
+    window = collections.deque(rowWindowSums(y) for y in range(size))
+    column_sums = [sum(column) for column in zip(*window)]
+    for y in range(radius, image_height - radius):
+        tmp.setRow(y, [c / area for c in column_sums], radius)
+        if y + radius + 1 < image_height:
+            entering = rowWindowSums(y + radius + 1)
+            leaving = window.popleft()
+            window.append(entering)
+            column_sums = [c + e - l for c, e, l in zip(column_sums, entering, leaving)]
+    
+    return tmp
+
+# A summed-area table (integral image): entry (x, y) holds the sum of all pixels in the rectangle [0, x) x [0, y),
+# so the sum over any rectangle needs only four lookups, whatever its size. A second table holds the sums of the
+# squared pixel values, which gives the variance of any rectangle in constant time as well.
+# Both tables are PixelArrays of size (image_width + 1) x (image_height + 1) whose first row and column are 0.
+# Building the tables is a single pass over the image; after that every windowed statistic (box averages, local
+# means and deviations for adaptive thresholding, region scores for connected components) can be read from them.
+class IntegralImage:
+    def __init__(self, pixel_array, image_width, image_height, squares = True):
+        pixel_array = asPixelArray(pixel_array, image_width, image_height)
+        # integer pixels give exact integer sums, float pixels give float sums
+        typecode = 'd' if pixel_array.typecode in ('f', 'd') else 'q'
+        
+        self.width = image_width
+        self.height = image_height
+        self.sums = PixelArray(image_width + 1, image_height + 1, typecode)
+        self.squares = PixelArray(image_width + 1, image_height + 1, typecode) if squares else None
+        
+        above = [0] * (image_width + 1)
+        above_squares = [0] * (image_width + 1)
+        for y in range(image_height):
+            row = pixel_array.getRow(y)
+            above = [0] + [a + s for a, s in zip(above[1:], itertools.accumulate(row))]
+            self.sums.setRow(y + 1, above)
+            if squares:
+                above_squares = [0] + [a + s for a, s in zip(above_squares[1:], itertools.accumulate(v * v for v in row))]
+                self.squares.setRow(y + 1, above_squares)
+    
+    # sum of the table values over the rectangle [x0, x1) x [y0, y1)
+    def tableSum(self, table, x0, y0, x1, y1):
+        data = table.data
+        top = y0 * table.stride
+        bottom = y1 * table.stride
+        return data[bottom + x1] - data[bottom + x0] - data[top + x1] + data[top + x0]
+    
+    # sum of the pixels in the rectangle [x0, x1) x [y0, y1)
+    def rectangleSum(self, x0, y0, x1, y1):
+        return self.tableSum(self.sums, x0, y0, x1, y1)
+    
+    # sum of the squared pixels in the rectangle [x0, x1) x [y0, y1)
+    def rectangleSumOfSquares(self, x0, y0, x1, y1):
+        if self.squares is None:
+            raise ValueError("integral image was built without squares")
+        return self.tableSum(self.squares, x0, y0, x1, y1)
     
+    def rectangleMean(self, x0, y0, x1, y1):
+        return self.rectangleSum(x0, y0, x1, y1) / ((x1 - x0) * (y1 - y0))
+    
+    # population variance of the pixels in the rectangle [x0, x1) x [y0, y1)
+    def rectangleVariance(self, x0, y0, x1, y1):
+        area = (x1 - x0) * (y1 - y0)
+        mean = self.rectangleSum(x0, y0, x1, y1) / area
+        return max(self.rectangleSumOfSquares(x0, y0, x1, y1) / area - mean * mean, 0)
+    
+    # window sums of one table for output row y, over the windows [x0s[i], x1s[i]) x [y0, y1)
+    def rowWindowSums(self, table, y0, y1, x0s, x1s):
+        top = table.getRow(y0)
+        bottom = table.getRow(y1)
+        return [bottom[b] - bottom[a] - top[b] + top[a] for a, b in zip(x0s, x1s)]
+    
+    # same result as computeBoxAveraging (and, for radius 1, computeBoxAveraging3x3) on the image the table was built
+    # from: the mean of the (2 * radius + 1) x (2 * radius + 1) box, 0 closer than radius to the border
+    def computeBoxAveraging(self, radius = 1):
+        tmp = createInitializedGreyscalePixelArray(self.width, self.height)
+        size = 2 * radius + 1
+        area = size * size
+        if self.width < size or self.height < size:
+            return tmp
+        x0s = range(0, self.width - size + 1)
+        x1s = range(size, self.width + 1)
+        for y in range(radius, self.height - radius):
+            sums = self.rowWindowSums(self.sums, y - radius, y + radius + 1, x0s, x1s)
+            tmp.setRow(y, [s / area for s in sums], radius)
+        return tmp
+    
+    # local mean and standard deviation over the (2 * radius + 1) x (2 * radius + 1) window around every pixel of row
+    # y; near the border the window is clipped to the image
+    def rowWindowMeanAndDeviation(self, y, radius):
+        y0 = max(y - radius, 0)
+        y1 = min(y + radius + 1, self.height)
+        x0s = [max(x - radius, 0) for x in range(self.width)]
+        x1s = [min(x + radius + 1, self.width) for x in range(self.width)]
+        areas = [(b - a) * (y1 - y0) for a, b in zip(x0s, x1s)]
+        means = [s / area for s, area in zip(self.rowWindowSums(self.sums, y0, y1, x0s, x1s), areas)]
+        squares = self.rowWindowSums(self.squares, y0, y1, x0s, x1s)
+        deviations = [math.sqrt(max(q / area - m * m, 0)) for q, area, m in zip(squares, areas, means)]
+        return means, deviations
+
+# mean and variance of the pixels inside a candidate region, e.g. the bounding box of a connected component, given as
+# inclusive corners like the ones of computeConnectedComponentLabelingWithStatistics; QR codes show up as regions of
+# high variance in the greyscale image (and high mean in the edge image), see detectQRCodeInPixelArrays
+def computeRegionStatistics(integral_image, min_x, min_y, max_x, max_y):
+    return (integral_image.rectangleMean(min_x, min_y, max_x + 1, max_y + 1),
+            integral_image.rectangleVariance(min_x, min_y, max_x + 1, max_y + 1))
+
+# one 3 tap sum along a line, with the first and last value set to 0 (the 1D part of computeBoxAveraging3x3)
+def sum3AndClearEnds(line):
+    if len(line) < 3:
+        return [0] * len(line)
+    return [0] + [a + b + c for a, b, c in zip(line, line[1:], line[2:])] + [0]
+
+# computes the same result as calling computeBoxAveraging3x3 passes times in a row
+# a 3x3 pass (including the zeroed border) is a 3 tap sum along the rows followed by a 3 tap sum along the columns,
+# and row and column steps can be reordered freely, so all row passes are done first on one row at a time and then
+# all column passes on the whole image, with a single division by 9 ** passes at the end; this touches every
+# pixel once per 1D pass instead of nine times per 3x3 pass
+# the result matches computeBoxAveraging3x3 up to float rounding in the last bits; with exact = True the 3x3 passes
+# are run one after the other instead, which gives bit-identical results for regression comparisons
+# without exact, the result is written into out when given (a float PixelArray of the same size)
+def computeRepeatedBoxAveraging3x3(pixel_array, image_width, image_height, passes, exact = False, out = None):
+    pixel_array = asPixelArray(pixel_array, image_width, image_height)
+    
+    if exact:
+        mean_array = pixel_array
+        for i in range(passes):
+            mean_array = computeBoxAveraging3x3(mean_array, image_width, image_height)
+        return mean_array
+    
+    rows = []
     for y in range(image_height):
-        for x in range(image_width):
-            if pixel_array[y][x] < threshold_value:
-                tmp[y][x] = 0
-            else:
-                tmp[y][x] = 255
-                
+        row = pixel_array.getRow(y).tolist()
+        for i in range(passes):
+            row = sum3AndClearEnds(row)
+        rows.append(row)
+    
+    for i in range(passes):
+        if image_height < 3:
+            rows = [[0] * image_width for y in range(image_height)]
+            break
+        zeros = [0] * image_width
+        rows = [zeros] + [[a + b + c for a, b, c in zip(top, mid, bot)] for top, mid, bot in zip(rows, rows[1:], rows[2:])] + [zeros]
+    
+    tmp = out
+    if tmp is None:
+        tmp = createInitializedGreyscalePixelArray(image_width, image_height)
+    divisor = 9 ** passes
+    for y in range(image_height):
+        tmp.setRow(y, [v / divisor for v in rows[y]])
     
     return tmp
 
-def computeErosion8Nbh3x3FlatSE(pixel_array, image_width, image_height):
-    tmp = createInitializedGreyscalePixelArray(image_width, image_height)
+def computeThresholdGE(pixel_array, threshold_value, image_width, image_height):
+    pixel_array = asPixelArray(pixel_array, image_width, image_height)
+    tmp = createInitializedGreyscalePixelArray(image_width, image_height, typecode='B')
     
     for y in range(image_height):
-        for x in range(image_width):
-            if y == 0 or y == (image_height - 1) or x == 0 or x == (image_width - 1):
-                #tmp[y][x] = 0
-                pass
-            elif pixel_array[y][x] > 0:
-                t1 = [pixel_array[y-1][x-1], pixel_array[y-1][x], pixel_array[y-1][x+1]]
-                t2 = [pixel_array[y][x-1], pixel_array[y][x+1]]
-                t3 = [pixel_array[y+1][x-1], pixel_array[y+1][x], pixel_array[y+1][x+1]]
-                #total = t1 + t2 + t3
-                if 0 not in t1 and 0 not in t2 and 0 not in t3:
-                    tmp[y][x] = 1
-                    
+        tmp.setRow(y, [0 if v < threshold_value else 255 for v in pixel_array.getRow(y)])
+    
     return tmp
 
-def computeDilation8Nbh3x3FlatSE(pixel_array, image_width, image_height):
-    tmp = createInitializedGreyscalePixelArray(image_width, image_height)
+# adaptive (Sauvola) thresholding: a pixel is set to 255 when it is at least
+#   mean * (1 + k * (deviation / dynamic_range - 1))
+# where mean and deviation are taken over the (2 * radius + 1) x (2 * radius + 1) window around it; this copes with
+# uneven lighting across the image much better than one global threshold
+# an IntegralImage of pixel_array (built with squares) can be passed in when it is already available
+def computeAdaptiveThresholdGE(pixel_array, image_width, image_height, radius = 7, k = 0.2, dynamic_range = 128, integral_image = None):
+    pixel_array = asPixelArray(pixel_array, image_width, image_height)
+    if integral_image is None:
+        integral_image = IntegralImage(pixel_array, image_width, image_height)
+    tmp = createInitializedGreyscalePixelArray(image_width, image_height, typecode='B')
     
     for y in range(image_height):
-        for x in range(image_width):
-            grid = [[y,x]]
-            grid.append([y-1,x-1])
-            grid.append([y-1,x])
-            grid.append([y-1,x+1])
-            grid.append([y,x-1])
-            grid.append([y,x+1])
-            grid.append([y+1,x-1])
-            grid.append([y+1,x])
-            grid.append([y+1,x+1])
-            
-            for coord in grid:
-                if coord[0] < 0 or coord[1] < 0 or coord[0] > (image_height - 1) or coord[1] > (image_width - 1):
-                    pass
-                elif pixel_array[coord[0]][coord[1]] >= 1:
-                    tmp[y][x] = 1
+        means, deviations = integral_image.rowWindowMeanAndDeviation(y, radius)
+        tmp.setRow(y, [0 if v < m * (1 + k * (d / dynamic_range - 1)) else 255
+                       for v, m, d in zip(pixel_array.getRow(y), means, deviations)])
+    
+    return tmp
 
+def computeErosion8Nbh3x3FlatSE(pixel_array, image_width, image_height):
+    pixel_array = asPixelArray(pixel_array, image_width, image_height)
+    tmp = createInitializedGreyscalePixelArray(image_width, image_height, typecode='B')
+    
+    if image_height < 3:
+        return tmp
+    
+    # for every interior column: are the pixel and both of its horizontal neighbours non-zero?
+    def rowAllNonZero(y):
+        nz = [v != 0 for v in pixel_array.getRow(y)]
+        return [l and m and r for l, m, r in zip(nz, nz[1:], nz[2:])]
+    
+    # the border pixels stay 0, so we only visit the interior
+    top = rowAllNonZero(0)
+    mid = rowAllNonZero(1)
+    for y in range(1, image_height - 1):
+        bot = rowAllNonZero(y + 1)
+        centre = pixel_array.getRow(y)[1:-1]
+        tmp.setRow(y, [1 if c > 0 and t and m and b else 0 for c, t, m, b in zip(centre, top, mid, bot)], 1)
+        top, mid = mid, bot
                     
     return tmp
 
-def computeConnectedComponentLabeling(pixel_array, image_width, image_height):
-    tmp = createInitializedGreyscalePixelArray(image_width, image_height)
-    label = 1
-    label_dict = {}
-    q = Queue()
+def computeDilation8Nbh3x3FlatSE(pixel_array, image_width, image_height):
+    pixel_array = asPixelArray(pixel_array, image_width, image_height)
+    tmp = createInitializedGreyscalePixelArray(image_width, image_height, typecode='B')
+    
+    # for every column: is the pixel or one of its horizontal neighbours (inside the image) set?
+    def rowAnySet(y):
+        ge = [False] + [v >= 1 for v in pixel_array.getRow(y)] + [False]
+        return [l or m or r for l, m, r in zip(ge, ge[1:], ge[2:])]
     
+    empty = [False] * image_width
+    top = empty
+    mid = rowAnySet(0) if image_height > 0 else empty
     for y in range(image_height):
-        for x in range(image_width):
-            if pixel_array[y][x] == 0 or tmp[y][x] != 0:
-                pass
-            else:
-                q.enqueue([y,x])
-                label_dict[label] = 0
-                while q.size() > 0:
-                    c = q.dequeue()
-                    tmp[c[0]][c[1]] = label
-                    label_dict[label] += 1
+        bot = rowAnySet(y + 1) if y < image_height - 1 else empty
+        tmp.setRow(y, [1 if t or m or b else 0 for t, m, b in zip(top, mid, bot)])
+        top, mid = mid, bot
                     
-                    # left
-                    if c[1] > 0:
-                        if pixel_array[c[0]][c[1]-1] > 0 and tmp[c[0]][c[1]-1] == 0: 
-                            q.enqueue([c[0],c[1]-1])
-                            tmp[c[0]][c[1]-1] = -1
-                        
-                    # right    
-                    if c[1] < image_width - 1:
-                        if pixel_array[c[0]][c[1] + 1] > 0 and tmp[c[0]][c[1] + 1] == 0: 
-                            q.enqueue([c[0],c[1]+1])
-                            tmp[c[0]][c[1] + 1] = -1
-                        
-                    # top 
-                    if c[0] > 0:
-                        if pixel_array[c[0]-1][c[1]] > 0 and tmp[c[0]-1][c[1]] == 0: 
-                            q.enqueue([c[0]-1,c[1]])
-                            tmp[c[0]-1][c[1]] = -1
-                        
-                    # bottom
-                    if c[0] < image_height - 1:
-                        if pixel_array[c[0]+1][c[1]] > 0 and tmp[c[0]+1][c[1]] == 0: 
-                            q.enqueue([c[0]+1,c[1]])
-                            tmp[c[0]+1][c[1]] = -1
-                            
-                label += 1
+    return tmp
+
+# A bit-packed binary image: every row is stored as a single Python int in which bit x is pixel x of the row, so one
+# pixel takes one bit, and shifting, ANDing and ORing a whole row is a single (word-parallel) integer operation.
+class BinaryImage:
+    def __init__(self, image_width, image_height, rows = None):
+        if rows is None:
+            rows = [0] * image_height
+        self.width = image_width
+        self.height = image_height
+        self.rows = rows
+
+    # the bits of all pixels of a row (used to drop bits that were shifted past the right border)
+    def rowMask(self):
+        return (1 << self.width) - 1
+
+    def countSetPixels(self):
+        return sum(bin(row).count("1") for row in self.rows)
+
+# packs a pixel array into a BinaryImage; pixels with a value >= threshold are set, so with the default threshold of 1
+# the non-zero pixels of a 0/1 or 0/255 image are set, and with a grey level as threshold this is a fused
+# computeThresholdGE and pack
+def packBinaryImage(pixel_array, image_width, image_height, threshold = 1):
+    pixel_array = asPixelArray(pixel_array, image_width, image_height)
+    rows = []
+    if image_width == 0:
+        return BinaryImage(image_width, image_height, [0] * image_height)
+    if pixel_array.typecode == 'B':
+        # a lookup table turns every byte into the character '0' or '1'; reversed, the row is the binary
+        # representation of the packed int (pixel 0 is the least significant bit)
+        table = bytes(ord('1') if v >= threshold else ord('0') for v in range(256))
+        for y in range(image_height):
+            rows.append(int(pixel_array.getRow(y).tobytes().translate(table)[::-1], 2))
+    else:
+        for y in range(image_height):
+            rows.append(int("".join("1" if v >= threshold else "0" for v in reversed(pixel_array.getRow(y))), 2))
+    return BinaryImage(image_width, image_height, rows)
+
+# unpacks a BinaryImage into an 8 bit PixelArray in which set pixels have the value on_value and the others are 0
+def unpackBinaryImage(binary_image, on_value = 1):
+    image_width = binary_image.width
+    tmp = createInitializedGreyscalePixelArray(image_width, binary_image.height, typecode='B')
+    table = bytearray(range(256))
+    table[ord('0')] = 0
+    table[ord('1')] = on_value
+    for y, row in enumerate(binary_image.rows):
+        if row:
+            bits = bin(row)[2:].zfill(image_width)[::-1]
+            tmp.setRow(y, bits.encode("ascii").translate(table))
+    return tmp
+
+# same result as computeDilation8Nbh3x3FlatSE, on a bit-packed image: a row ORed with itself shifted one pixel left
+# and right is the horizontal dilation, and ORing three neighbouring horizontally dilated rows gives the 3x3 dilation
+def computeDilation8Nbh3x3FlatSEPacked(binary_image):
+    mask = binary_image.rowMask()
+    horizontal = [(row | (row << 1) | (row >> 1)) & mask for row in binary_image.rows]
+    padded = [0] + horizontal + [0]
+    rows = [top | mid | bot for top, mid, bot in zip(padded, padded[1:], padded[2:])]
+    return BinaryImage(binary_image.width, binary_image.height, rows)
+
+# same result as computeErosion8Nbh3x3FlatSE, on a bit-packed image: a row ANDed with itself shifted one pixel left
+# and right is the horizontal erosion (which already clears the first and last column), and ANDing three neighbouring
+# horizontally eroded rows gives the 3x3 erosion; the first and last row stay 0
+def computeErosion8Nbh3x3FlatSEPacked(binary_image):
+    image_height = binary_image.height
+    horizontal = [row & (row << 1) & (row >> 1) for row in binary_image.rows]
+    rows = [0] * image_height
+    if image_height >= 3:
+        rows[1:-1] = [top & mid & bot for top, mid, bot in zip(horizontal, horizontal[1:], horizontal[2:])]
+    return BinaryImage(binary_image.width, image_height, rows)
+
+# yields (start, end) for every run of consecutive foreground (non-zero) pixels in row y, end being exclusive;
+# a BinaryImage is accepted as well as a pixel array
+def findForegroundRuns(image, y):
+    if isinstance(image, BinaryImage):
+        bits = bin(image.rows[y])[:1:-1]
+        for run in re.finditer("1+", bits):
+            yield run.start(), run.end()
+        return
+    row = image.getRow(y)
+    if image.typecode == 'B':
+        row = row.tobytes()
+    else:
+        row = bytes(v != 0 for v in row)
+    for run in re.finditer(b"[^\x00]+", row):
+        yield run.start(), run.end()
+
+# two-pass connected component labeling (4-neighbourhood) on runs of foreground pixels
+# the first pass gives every run a provisional label and merges it (union-find) with the overlapping runs of the
+# previous row; the second pass resolves the provisional labels, writes the final labels into the label image one run
+# at a time and collects the size, bounding box and coordinate sums of every component from its runs
+# the labels are numbered in the order in which the components first appear in a row by row scan, which is the same
+# numbering as the breadth first search labeling used before
+# returns the label image, a dictionary label -> number of pixels, a dictionary label -> bounding box
+# (min_x, min_y, max_x, max_y) and a dictionary label -> centroid (x, y)
+def computeConnectedComponentLabelingWithStatistics(pixel_array, image_width, image_height):
+    if not isinstance(pixel_array, BinaryImage):
+        pixel_array = asPixelArray(pixel_array, image_width, image_height)
+    
+    # union-find forest over the provisional labels (the index of a run in runs); the root of a tree is always its
+    # smallest provisional label, which belongs to the run that comes first in the row by row scan
+    parent = []
+    
+    def find(label):
+        root = label
+        while parent[root] != root:
+            root = parent[root]
+        # path compression
+        while parent[label] != root:
+            parent[label], label = root, parent[label]
+        return root
+    
+    runs = []
+    previous_runs = []
+    for y in range(image_height):
+        current_runs = []
+        j = 0
+        for start, end in findForegroundRuns(pixel_array, y):
+            label = len(runs)
+            parent.append(label)
+            runs.append((y, start, end))
+            current_runs.append((start, end, label))
             
+            # runs of the previous row that end before this run starts cannot touch this run or any later one
+            while j < len(previous_runs) and previous_runs[j][1] <= start:
+                j += 1
+            root = label
+            k = j
+            while k < len(previous_runs) and previous_runs[k][0] < end:
+                root_above = find(previous_runs[k][2])
+                if root_above < root:
+                    parent[root] = root_above
+                    root = root_above
+                elif root < root_above:
+                    parent[root_above] = root
+                k += 1
+        previous_runs = current_runs
+    
+    # number the components (roots are visited before the rest of their tree), then go over the runs to fill in the
+    # label image and the statistics
+    final_labels = [0] * len(runs)
+    next_label = 1
+    for label in range(len(runs)):
+        root = find(label)
+        if root == label:
+            final_labels[label] = next_label
+            next_label += 1
+        else:
+            final_labels[label] = final_labels[root]
+    
+    tmp = createInitializedGreyscalePixelArray(image_width, image_height, typecode='i')
+    labels = tmp.data
+    label_dict = {label: 0 for label in range(1, next_label)}
+    bounding_boxes = {}
+    sum_dict = {}
+    for (y, start, end), label in zip(runs, final_labels):
+        length = end - start
+        offset = y * image_width
+        labels[offset + start:offset + end] = array('i', [label]) * length
+        label_dict[label] += length
+        box = bounding_boxes.get(label)
+        if box is None:
+            bounding_boxes[label] = [start, y, end - 1, y]
+            sum_dict[label] = [(start + end - 1) * length / 2, y * length]
+        else:
+            if start < box[0]:
+                box[0] = start
+            if end - 1 > box[2]:
+                box[2] = end - 1
+            box[3] = y
+            sums = sum_dict[label]
+            sums[0] += (start + end - 1) * length / 2
+            sums[1] += y * length
+    
+    bounding_boxes = {label: tuple(box) for label, box in bounding_boxes.items()}
+    centroids = {label: (sum_dict[label][0] / label_dict[label], sum_dict[label][1] / label_dict[label])
+                 for label in label_dict}
+    
+    return tmp, label_dict, bounding_boxes, centroids
+
+# returns the label image and a dictionary label -> number of pixels, see computeConnectedComponentLabelingWithStatistics
+def computeConnectedComponentLabeling(pixel_array, image_width, image_height):
+    (tmp, label_dict, bounding_boxes, centroids) = computeConnectedComponentLabelingWithStatistics(pixel_array, image_width, image_height)
     return tmp, label_dict
 
 # borrowed from stackoverflow LOL!
@@ -299,102 +928,300 @@ def keyWithMaxVal(d):
      k=list(d.keys())
      return k[v.index(max(v))]
 
-def main():
-    filename = "./images/covid19QRCode/poster1small.png"
-    # filename = "./images/covid19QRCode/challenging/connecticut.png"
+# the available implementations of the per-pixel stages of the QR code detection pipeline;
+# "numpy" runs the whole-array version from QRCodeDetectionNumPy.py and requires numpy to be installed;
+# "parallel" runs the python stages on horizontal tiles in worker processes (QRCodeDetectionParallel.py), which are
+# started by the first detection and reused by the later ones
+BACKENDS = ["python", "numpy", "parallel"]
 
-    # we read in the png file, and receive three pixel arrays for red, green and blue components, respectively
-    # each pixel array contains 8 bit integer values between 0 and 255 encoding the color values
-    (image_width, image_height, px_array_r, px_array_g, px_array_b) = readRGBImageToSeparatePixelArrays(filename)
+# runs every per-pixel stage of the pipeline (greyscale conversion up to the closing) and returns the binary mask
+# whose largest connected component is the QR code
+# exact = True runs the smoothing as seven separate 3x3 passes (see computeRepeatedBoxAveraging3x3); the numpy backend
+# always gives the same result as exact = True
+# with the python backend, the intermediate images are written into the arrays of scratch (a ScratchBuffers) when given
+def computeQRCodeMask(px_array_r, px_array_g, px_array_b, image_width, image_height, backend = "python", exact = False, scratch = None):
+    if backend not in BACKENDS:
+        raise ValueError("unknown backend {}, expected one of {}".format(backend, BACKENDS))
+
+    if backend == "numpy":
+        import QRCodeDetectionNumPy
+        mask = QRCodeDetectionNumPy.computeQRCodeMask(px_array_r, px_array_g, px_array_b, image_width, image_height)
+        return PixelArray(image_width, image_height, 'B', array('B', mask.tobytes()))
+
+    if backend == "parallel":
+        import QRCodeDetectionParallel
+        return QRCodeDetectionParallel.computeQRCodeMaskAndComponents(px_array_r, px_array_g, px_array_b, image_width, image_height, exact=exact)[0]
 
     # Convert to grayscale
-    pixel_array = computeRGBToSingleGreyscale(px_array_r, px_array_g, px_array_b, image_width, image_height)
+    greyscale = None
+    if scratch is not None:
+        px_array_r = asPixelArray(px_array_r, image_width, image_height)
+        px_array_g = asPixelArray(px_array_g, image_width, image_height)
+        px_array_b = asPixelArray(px_array_b, image_width, image_height)
+        greyscale = scratch.get("greyscale", image_width, image_height, greyscaleTypecode(px_array_r, px_array_g, px_array_b))
+    pixel_array = computeRGBToSingleGreyscale(px_array_r, px_array_g, px_array_b, image_width, image_height, greyscale)
+
+    return computeQRCodeMaskFromGreyscale(pixel_array, image_width, image_height, backend, exact, scratch)
+
+# computeQRCodeMask, and the component statistics (the dictionaries label -> number of pixels, label -> bounding box
+# and label -> centroid, see computeConnectedComponentLabelingWithStatistics) when the backend computes them anyway:
+# the parallel backend labels its tiles and merges their components; None for the other backends
+def computeQRCodeMaskAndComponents(px_array_r, px_array_g, px_array_b, image_width, image_height, backend = "python", exact = False, scratch = None):
+    if backend == "parallel":
+        import QRCodeDetectionParallel
+        result = QRCodeDetectionParallel.computeQRCodeMaskAndComponents(px_array_r, px_array_g, px_array_b, image_width, image_height, exact=exact)
+        return result[0], result[1:]
+    return computeQRCodeMask(px_array_r, px_array_g, px_array_b, image_width, image_height, backend, exact, scratch), None
+
+# same as computeQRCodeMaskAndComponents, for a single greyscale pixel array
+def computeQRCodeMaskAndComponentsFromGreyscale(pixel_array, image_width, image_height, backend = "python", exact = False, scratch = None):
+    if backend == "parallel":
+        import QRCodeDetectionParallel
+        result = QRCodeDetectionParallel.computeQRCodeMaskAndComponentsFromGreyscale(pixel_array, image_width, image_height, exact=exact)
+        return result[0], result[1:]
+    return computeQRCodeMaskFromGreyscale(pixel_array, image_width, image_height, backend, exact, scratch), None
+
+# same as computeQRCodeMask, for an image that is already a single greyscale pixel array
+# (e.g. from readGreyscaleImageToPixelArray)
+def computeQRCodeMaskFromGreyscale(pixel_array, image_width, image_height, backend = "python", exact = False, scratch = None):
+    if backend not in BACKENDS:
+        raise ValueError("unknown backend {}, expected one of {}".format(backend, BACKENDS))
+
+    if backend == "numpy":
+        import QRCodeDetectionNumPy
+        mask = QRCodeDetectionNumPy.computeQRCodeMaskFromGreyscale(pixel_array, image_width, image_height)
+        return PixelArray(image_width, image_height, 'B', array('B', mask.tobytes()))
+
+    if backend == "parallel":
+        import QRCodeDetectionParallel
+        return QRCodeDetectionParallel.computeQRCodeMaskAndComponentsFromGreyscale(pixel_array, image_width, image_height, exact=exact)[0]
+
+    outputs = {}
+    if scratch is not None:
+        for name, typecode in [("scaled", 'B'), ("combined", 'd'), ("mean", 'd'), ("scaled2", 'B')]:
+            outputs[name] = scratch.get(name, image_width, image_height, typecode)
 
     # Contrast Streching
-    scaled_pixel_array = scaleTo0And255AndQuantize(pixel_array, image_width, image_height)
+    scaled_pixel_array = scaleTo0And255AndQuantize(pixel_array, image_width, image_height, out=outputs.get("scaled"))
     
-    # Edge computataion
-    vertical_edges_array = computeVerticalEdgesSobelAbsolute(scaled_pixel_array, image_width, image_height)
-    horizontal_edges_array = computeHorizontalEdgesSobelAbsolute(scaled_pixel_array, image_width, image_height)
-    combined = createInitializedGreyscalePixelArray(image_width, image_height)
-    for y in range(image_height):
-        for x in range(image_width):
-            combined[y][x] = vertical_edges_array[y][x] + horizontal_edges_array[y][x]
+    # Edge computataion (vertical plus horizontal edges)
+    combined = computeEdgesSobelAbsoluteSum(scaled_pixel_array, image_width, image_height, outputs.get("combined"))
 
     # Smoothing
-    mean_array = computeBoxAveraging3x3(combined, image_width, image_height)
-    for i in range(6):
-        mean_array = computeBoxAveraging3x3(mean_array, image_width, image_height)
+    mean_array = computeRepeatedBoxAveraging3x3(combined, image_width, image_height, 7, exact, outputs.get("mean"))
     
     # Contrast Streching
-    scaled_pixel_array2 = scaleTo0And255AndQuantize(mean_array, image_width, image_height)
+    scaled_pixel_array2 = scaleTo0And255AndQuantize(mean_array, image_width, image_height, out=outputs.get("scaled2"))
 
-    # Threshold operation
-    threshold_array = computeThresholdGE(scaled_pixel_array2, 70, image_width, image_height)
+    # Threshold operation, straight into a bit-packed binary image
+    threshold_image = packBinaryImage(scaled_pixel_array2, image_width, image_height, 70)
 
     # Closing
-    dialated_array = computeDilation8Nbh3x3FlatSE(threshold_array,image_width, image_height)
-    dialated_array2 = computeDilation8Nbh3x3FlatSE(dialated_array,image_width, image_height)
+    dialated_image = computeDilation8Nbh3x3FlatSEPacked(threshold_image)
+    dialated_image2 = computeDilation8Nbh3x3FlatSEPacked(dialated_image)
 
-    eroded_array = computeErosion8Nbh3x3FlatSE(dialated_array2,image_width, image_height)
-    eroded_array2 = computeErosion8Nbh3x3FlatSE(eroded_array,image_width, image_height)
-    
-    # CC
-    
-    (ccimg,ccsizes) = computeConnectedComponentLabeling(eroded_array2,image_width,image_height)
-    largest_key = keyWithMaxVal(ccsizes)
-    print("largest key: " + str(largest_key))
+    eroded_image = computeErosion8Nbh3x3FlatSEPacked(dialated_image2)
+    eroded_image2 = computeErosion8Nbh3x3FlatSEPacked(eroded_image)
 
-    largest_cc_array = createInitializedGreyscalePixelArray(image_width,image_height)
+    return unpackBinaryImage(eroded_image2)
 
-    for y in range(image_height):
-        for x in range(image_width):
-            if ccimg[y][x] == largest_key:
-                largest_cc_array[y][x] = 70
+# the headless detection API: finds the QR code in the r, g and b pixel arrays of an image, without printing or showing
+# anything, and returns a dictionary with the entries
+#   "bounding_box": (min_x, min_y, max_x, max_y) of the largest connected component of the mask, None if there is none
+#   "width", "height": the size of the image
+#   "components": the number of connected components of the mask
+#   "component_sizes": a dictionary label -> number of pixels of every component
+#   "largest_component": a dictionary with the "label", "pixels" and "centroid" (x, y) of the largest component
+#   "timings": the seconds spent on computing the "mask" and on the "labeling"
+# scratch is passed on to computeQRCodeMask
+# with region_statistics = True, the candidate regions are scored as well: the entry "region_statistics" is a
+# dictionary label -> (mean, variance) of the greyscale pixels in the bounding box of every component, all read from
+# one IntegralImage of the greyscale image (see computeRegionStatistics), and "timings" has the seconds spent on the
+# "statistics"; the greyscale image is then computed here and shared with the mask computation
+def detectQRCodeInPixelArrays(px_array_r, px_array_g, px_array_b, image_width, image_height, backend = "python", exact = False, scratch = None,
+                              region_statistics = False):
+    start = time.perf_counter()
+    greyscale = None
+    if region_statistics:
+        greyscale = computeRGBToSingleGreyscale(px_array_r, px_array_g, px_array_b, image_width, image_height)
+        (mask, components) = computeQRCodeMaskAndComponentsFromGreyscale(greyscale, image_width, image_height, backend, exact, scratch)
+    else:
+        (mask, components) = computeQRCodeMaskAndComponents(px_array_r, px_array_g, px_array_b, image_width, image_height, backend, exact, scratch)
+    return summarizeQRCodeMask(mask, image_width, image_height, start, greyscale, components)
 
-    # corners
+# same as detectQRCodeInPixelArrays, for an image that is already a single greyscale pixel array (e.g. from
+# readGreyscaleImageToPixelArray)
+def detectQRCodeInGreyscalePixelArray(pixel_array, image_width, image_height, backend = "python", exact = False, scratch = None,
+                                      region_statistics = False):
+    start = time.perf_counter()
+    (mask, components) = computeQRCodeMaskAndComponentsFromGreyscale(pixel_array, image_width, image_height, backend, exact, scratch)
+    return summarizeQRCodeMask(mask, image_width, image_height, start, pixel_array if region_statistics else None, components)
 
-    min_y = image_height
-    min_x = image_width
-    max_y = 0
-    max_x = 0
+# labels the mask and returns the dictionary of detectQRCodeInPixelArrays, whose mask computation began at start; the
+# region statistics are computed when the greyscale image is given
+# the component statistics of computeQRCodeMaskAndComponents are used when given, instead of labeling the mask again
+def summarizeQRCodeMask(mask, image_width, image_height, start, greyscale = None, components = None):
+    mask_done = time.perf_counter()
+    if components is None:
+        (ccimg, ccsizes, ccboxes, cccentroids) = computeConnectedComponentLabelingWithStatistics(mask, image_width, image_height)
+    else:
+        (ccsizes, ccboxes, cccentroids) = components
+    labeling_done = time.perf_counter()
 
-    for y in range(image_height):
-        for x in range(image_width):
-            if largest_cc_array[y][x] != 0:
-                if y < min_y:
-                    min_y = y
-                
-                if x < min_x:
-                    min_x = x
-                
-                if y > max_y:
-                    max_y = y
-                
-                if x > max_x:
-                    max_x = x
+    detection = {"bounding_box": None, "width": image_width, "height": image_height, "components": len(ccsizes),
+                 "component_sizes": ccsizes, "largest_component": None}
+    if ccsizes:
+        largest_key = keyWithMaxVal(ccsizes)
+        detection["bounding_box"] = ccboxes[largest_key]
+        detection["largest_component"] = {"label": largest_key, "pixels": ccsizes[largest_key],
+                                          "centroid": cccentroids[largest_key]}
+    detection["timings"] = {"mask": mask_done - start, "labeling": labeling_done - mask_done}
+    if greyscale is not None:
+        integral_image = IntegralImage(greyscale, image_width, image_height)
+        detection["region_statistics"] = {label: computeRegionStatistics(integral_image, *ccboxes[label]) for label in ccsizes}
+        detection["timings"]["statistics"] = time.perf_counter() - labeling_done
+    return detection
 
-    # Display
-    pyplot.imshow(prepareRGBImageForImshowFromIndividualArrays(px_array_r, px_array_g, px_array_b, image_width, image_height))
-    # Debugging
-    print("label: nr_pixels")
-    for sz in ccsizes.keys():
-        print("{}: {}".format(sz, ccsizes[sz]))
+# detectQRCodeInPixelArrays for a png file, given as a file name or as the contents of the file (bytes); the timings
+# also include the time spent on "read" and the "total"
+# the png file is read straight into one greyscale pixel array (readGreyscaleImageToPixelArray), so the r, g and b
+# pixel arrays are never created, which needs about a third of the memory; that greyscale conversion is approximate,
+# so exact = True reads the r, g and b pixel arrays instead and converts them like the reference pipeline
+# matplotlib is never imported by the detection, so worker processes that only detect do not pay for it
+def detectQRCode(source, backend = "python", exact = False, scratch = None, region_statistics = False):
+    start = time.perf_counter()
+    if exact:
+        (image_width, image_height, px_array_r, px_array_g, px_array_b) = readRGBImageToSeparatePixelArrays(source)
+        read_done = time.perf_counter()
+        detection = detectQRCodeInPixelArrays(px_array_r, px_array_g, px_array_b, image_width, image_height, backend, exact,
+                                              scratch, region_statistics)
+    else:
+        (image_width, image_height, pixel_array) = readGreyscaleImageToPixelArray(source)
+        read_done = time.perf_counter()
+        detection = detectQRCodeInGreyscalePixelArray(pixel_array, image_width, image_height, backend, exact, scratch,
+                                                      region_statistics)
+    detection["timings"]["read"] = read_done - start
+    detection["timings"]["total"] = time.perf_counter() - start
+    return detection
 
-    # pyplot.imshow(largest_cc_array, cmap='gray')
+# shows the image with the bounding box of the QR code painted over it (nothing is painted when bounding_box is None)
+# matplotlib is only imported here, when something is actually shown
+def showDetection(px_array_r, px_array_g, px_array_b, image_width, image_height, bounding_box):
+    from matplotlib import pyplot
+    from matplotlib.patches import Rectangle
 
-    # get access to the current pyplot figure
-    axes = pyplot.gca()
-    # create a 70x50 rectangle that starts at location 10,30, with a line width of 3
-    # rect = Rectangle( (10, 30), 70, 50, linewidth=3, edgecolor='g', facecolor='none' )
-    rect = Rectangle( (min_x, min_y), max_x - min_x, max_y - min_y, linewidth=3, edgecolor='g', facecolor='none' )
-    # paint the rectangle over the current plot
-    axes.add_patch(rect)
+    pyplot.imshow(prepareRGBImageForImshowFromIndividualArrays(px_array_r, px_array_g, px_array_b, image_width, image_height))
+
+    if bounding_box is not None:
+        (min_x, min_y, max_x, max_y) = bounding_box
+        # get access to the current pyplot figure
+        axes = pyplot.gca()
+        # create a 70x50 rectangle that starts at location 10,30, with a line width of 3
+        # rect = Rectangle( (10, 30), 70, 50, linewidth=3, edgecolor='g', facecolor='none' )
+        rect = Rectangle( (min_x, min_y), max_x - min_x, max_y - min_y, linewidth=3, edgecolor='g', facecolor='none' )
+        # paint the rectangle over the current plot
+        axes.add_patch(rect)
 
     # plot the current figure
     pyplot.show()
 
+# writes the greyscale image and the QR code mask of every image below the given directory with every png filtering
+# preset (see writeGreyscalePixelArraytoPNG) and prints the size of the png data and the time it took to encode;
+# returns the results as a list of (filename, image, filtering, size in bytes, seconds)
+def benchmarkPNGWriting(directory = "./images/covid19QRCode", presets = (None, "fast", "balanced", "small")):
+    import glob
+
+    results = []
+    for filename in sorted(glob.glob(directory + "/**/*.png", recursive=True)):
+        (image_width, image_height, px_array_r, px_array_g, px_array_b) = readRGBImageToSeparatePixelArrays(filename)
+        images = [("greyscale", computeRGBToSingleGreyscale(px_array_r, px_array_g, px_array_b, image_width, image_height)),
+                  ("mask", computeQRCodeMask(px_array_r, px_array_g, px_array_b, image_width, image_height))]
+        for (name, pixel_array) in images:
+            for filtering in presets:
+                file = io.BytesIO()
+                start = time.perf_counter()
+                writeGreyscalePixelArrayToPNGFile(file, pixel_array, image_width, image_height, filtering)
+                seconds = time.perf_counter() - start
+                results.append((filename, name, filtering, len(file.getvalue()), seconds))
+                print("{} {} {}: {} bytes in {:.3f}s".format(filename, name, filtering, len(file.getvalue()), seconds))
+    return results
+
+# the results of one backend for a png file, to compare the backends with each other: a dictionary with the bit-packed
+# rows of the "mask" (see packBinaryImage), the "component_sizes", "bounding_boxes" and "centroids" of its connected
+# components and the "bounding_box" of the largest one (None when the mask is empty)
+# backend is one of BACKENDS or "streaming" (QRCodeDetectionStreaming.py, which never holds the whole image); the
+# parallel backend returns the component statistics merged from its tiles, and runs on the given number of workers
+def computeBackendResults(filename, backend = "python", exact = False, workers = None):
+    if backend == "streaming":
+        import QRCodeDetectionStreaming
+        (image_width, image_height, mask_rows) = QRCodeDetectionStreaming.streamQRCodeMaskRows(filename)
+        mask_rows = list(mask_rows)
+        (ccsizes, ccboxes, cccentroids) = QRCodeDetectionStreaming.computeConnectedComponentStatisticsOfRows(mask_rows)
+    else:
+        (image_width, image_height, px_array_r, px_array_g, px_array_b) = readRGBImageToSeparatePixelArrays(filename)
+        if backend == "parallel":
+            import QRCodeDetectionParallel
+            (mask, ccsizes, ccboxes, cccentroids) = QRCodeDetectionParallel.computeQRCodeMaskAndComponents(
+                px_array_r, px_array_g, px_array_b, image_width, image_height, workers, exact)
+        else:
+            mask = computeQRCodeMask(px_array_r, px_array_g, px_array_b, image_width, image_height, backend, exact)
+            (ccimg, ccsizes, ccboxes, cccentroids) = computeConnectedComponentLabelingWithStatistics(mask, image_width, image_height)
+        mask_rows = packBinaryImage(mask, image_width, image_height).rows
+
+    bounding_box = ccboxes[keyWithMaxVal(ccsizes)] if ccsizes else None
+    return {"mask": mask_rows, "component_sizes": ccsizes, "bounding_boxes": ccboxes, "centroids": cccentroids,
+            "bounding_box": bounding_box}
+
+# the names of the results (see computeBackendResults) in which a backend differs from the pure python backend with
+# exact = True, which every other backend reproduces exactly; an empty list when all of them are identical
+# reference can be given when the python results for the file have already been computed
+def findBackendDifferences(filename, backend, workers = None, reference = None):
+    if reference is None:
+        reference = computeBackendResults(filename, "python", True)
+    results = computeBackendResults(filename, backend, True, workers)
+    return [name for name in reference if results[name] != reference[name]]
+
+# runs the given backends on every image below the given directory, prints for every image and backend whether its
+# results are identical to the pure python backend, and returns True when all of them are
+def compareBackends(backends = ("numpy", "streaming", "parallel"), directory = "./images/covid19QRCode", workers = None):
+    import glob
+
+    all_identical = True
+    for filename in sorted(glob.glob(directory + "/**/*.png", recursive=True)):
+        reference = computeBackendResults(filename, "python", True)
+        for backend in backends:
+            differences = findBackendDifferences(filename, backend, workers, reference)
+            all_identical = all_identical and not differences
+            print("{} {}: {}".format(filename, backend, "DIFFERENT " + ", ".join(differences) if differences else "identical"))
+    return all_identical
+
+def main(backend = "python"):
+    filename = "./images/covid19QRCode/poster1small.png"
+    # filename = "./images/covid19QRCode/challenging/connecticut.png"
+
+    # we read in the png file, and receive three pixel arrays for red, green and blue components, respectively
+    # each pixel array contains 8 bit integer values between 0 and 255 encoding the color values
+    (image_width, image_height, px_array_r, px_array_g, px_array_b) = readRGBImageToSeparatePixelArrays(filename)
+    print("read image width={}, height={}".format(image_width, image_height))
+
+    # Greyscale conversion, edge detection, smoothing, thresholding and closing, CC and corners
+    detection = detectQRCodeInPixelArrays(px_array_r, px_array_g, px_array_b, image_width, image_height, backend,
+                                          region_statistics=True)
+
+    if detection["largest_component"] is not None:
+        print("largest key: " + str(detection["largest_component"]["label"]))
+    # Debugging
+    print("label: nr_pixels, greyscale mean and variance in the bounding box")
+    ccsizes = detection["component_sizes"]
+    for sz in ccsizes.keys():
+        (mean, variance) = detection["region_statistics"][sz]
+        print("{}: {}, {:.1f} {:.1f}".format(sz, ccsizes[sz], mean, variance))
+
+    # Display
+    showDetection(px_array_r, px_array_g, px_array_b, image_width, image_height, detection["bounding_box"])
+
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # the backend can be selected on the command line, e.g. python QRCodeDetection.py numpy
+    main(*sys.argv[1:2])
@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import json
+import sys
+import time
+from array import array
+
+import QRCodeDetection
+import imageIO.png
+
+# asyncio front-end of the QR code detection pipeline: the png data of an upload is read from an asyncio stream
+# without blocking the event loop and decoded while it arrives (every chunk is fed to an imageIO.png.Decoder, and the
+# rows it completes are converted to greyscale at once, so neither the png data nor the rows of r, g and b values of the
+# whole image are ever kept), and only the CPU bound stages of the detection (the mask and the connected component
+# labeling) run in an executor, so one event loop can keep many uploads in flight while slow clients are still sending,
+# e.g.
+#   detection = await QRCodeDetectionAsync.detect(reader, executor)
+# A small TCP server is included: a client sends the bytes of a png file, closes its side of the connection, and
+# receives the result of QRCodeDetection.detectQRCode as one JSON line.
+#   python QRCodeDetectionAsync.py --listen 127.0.0.1:8374 --workers 4
+
+# bytes requested from the stream at a time
+CHUNK_SIZE = 64 * 1024
+# uploads larger than this are rejected
+MAX_SIZE = 64 * 1024 * 1024
+
+
+# yields the chunks of bytes of stream until the end of the data; stream can be an asyncio.StreamReader (or anything
+# else with an async read(n)) or an async iterator of bytes
+async def iterStream(stream, chunk_size = CHUNK_SIZE):
+    if hasattr(stream, "read"):
+        while True:
+            chunk = await stream.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        async for chunk in stream:
+            yield chunk
+
+
+# Decodes a png file one chunk of data at a time into a single greyscale pixel array, the same one
+# QRCodeDetection.detectQRCode computes for the whole file: the approximate 8 bit greyscale of
+# QRCodeDetection.readGreyscaleImageToPixelArray, or with exact = True the greyscale values of
+# QRCodeDetection.computeRGBToSingleGreyscale. Only the greyscale values are kept; the png rows of every chunk are
+# dropped once they are converted.
+class GreyscaleImageDecoder:
+    def __init__(self, exact = False):
+        self.decoder = imageIO.png.Decoder()
+        self.exact = exact
+        self.pixel_array = None
+
+    # decodes the next chunk of png data, and appends the greyscale values of the rows it completes
+    def feed(self, chunk):
+        rows = self.decoder.feed(chunk)
+        if not rows:
+            return
+        if self.exact:
+            (rows, info) = self.decoder.convert_rows(imageIO.png.Reader.asDirect, rows)
+            typecode = 'BH'[info['bitdepth'] > 8]
+        else:
+            (rows, info) = self.decoder.convert_rows(imageIO.png.Reader.asLuma8, rows)
+            typecode = 'B'
+        if self.pixel_array is None:
+            self.pixel_array = array(typecode)
+
+        if not self.exact:
+            for row in rows:
+                self.pixel_array.frombytes(row)
+            return
+        for channel_rows in QRCodeDetection.iterRGBImageRows(rows, info):
+            # greyscale images are converted like r, g and b arrays that are the same pixel array
+            if len(channel_rows) == 1:
+                channel_rows = channel_rows * 3
+            self.pixel_array.extend(QRCodeDetection.computeRGBRowToGreyscale(*channel_rows))
+
+    # checks that the whole png file has been fed, and returns width, height and the greyscale pixel array
+    def close(self):
+        self.decoder.close()
+        (image_width, image_height) = (self.decoder.width, self.decoder.height)
+        return (image_width, image_height, QRCodeDetection.PixelArray(image_width, image_height,
+                                                                      self.pixel_array.typecode, self.pixel_array))
+
+
+# reads a png file from stream (see iterStream) and decodes it while it arrives (see GreyscaleImageDecoder), raising a
+# ValueError when there are more than max_size bytes of png data; returns width, height and the greyscale pixel array
+# every chunk is decoded in the default executor of the event loop, so the loop keeps serving the other connections
+async def readGreyscaleImageFromStream(stream, exact = False, max_size = MAX_SIZE):
+    loop = asyncio.get_running_loop()
+    decoder = GreyscaleImageDecoder(exact)
+    size = 0
+    async for chunk in iterStream(stream):
+        size += len(chunk)
+        if size > max_size:
+            raise ValueError("png data larger than {} bytes".format(max_size))
+        await loop.run_in_executor(None, decoder.feed, chunk)
+    return decoder.close()
+
+
+# reads a png file from stream and detects the QR code in it, with the same result as QRCodeDetection.detectQRCode;
+# the mask and labeling stages run in executor, by default the default executor of the event loop (a thread pool). The
+# python stages hold the GIL, so a concurrent.futures.ProcessPoolExecutor lets the detections of several uploads run at
+# the same time; only the greyscale pixel array is sent to it
+# the "read" timing is the time from the start of the upload to its last byte, including the decoding
+async def detect(stream, executor = None, backend = "python", exact = False, max_size = MAX_SIZE):
+    start = time.perf_counter()
+    (image_width, image_height, pixel_array) = await readGreyscaleImageFromStream(stream, exact, max_size)
+    read_done = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    detection = await loop.run_in_executor(executor, functools.partial(QRCodeDetection.detectQRCodeInGreyscalePixelArray,
+                                                                       pixel_array, image_width, image_height, backend,
+                                                                       exact))
+    detection["timings"]["read"] = read_done - start
+    detection["timings"]["total"] = time.perf_counter() - start
+    return detection
+
+
+# handles one connection of the TCP server: reads a png file until the client closes its side, then writes the
+# detection result (or the error) as one JSON line
+async def handleConnection(reader, writer, executor, backend = "python", exact = False):
+    try:
+        try:
+            detection = await detect(reader, executor, backend, exact)
+            del detection["component_sizes"]
+            response = detection
+        except Exception as error:
+            response = {"error": str(error)}
+        writer.write(json.dumps(response).encode("utf-8") + b"\n")
+        await writer.drain()
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def serve(host, port, executor, backend = "python", exact = False):
+    server = await asyncio.start_server(functools.partial(handleConnection, executor=executor, backend=backend,
+                                                          exact=exact), host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Detects QR codes in png files sent over TCP connections.")
+    parser.add_argument("--listen", default="127.0.0.1:8374", help="host:port (default: 127.0.0.1:8374)")
+    parser.add_argument("--workers", type=int, default=None, help="number of detection processes "
+                                                                  "(default: number of cpus)")
+    # the parallel backend starts its own worker processes, so it is not offered inside the pool
+    parser.add_argument("--backend", choices=["python", "numpy"], default="python")
+    parser.add_argument("--exact", action="store_true", help="bit-identical smoothing, see computeQRCodeMask")
+    args = parser.parse_args(argv)
+
+    (host, separator, port) = args.listen.rpartition(":")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+        try:
+            asyncio.run(serve(host or "127.0.0.1", int(port), executor, args.backend, args.exact))
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
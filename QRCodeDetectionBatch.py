@@ -0,0 +1,153 @@
+import argparse
+import concurrent.futures
+import glob
+import importlib
+import json
+import os
+import sys
+
+import QRCodeDetection
+
+# Batch version of QRCodeDetection.main: detects the QR code in every png file of a directory (or glob pattern), using
+# a pool of worker processes, and writes one JSON line per image to the output file, e.g.
+#   python QRCodeDetectionBatch.py ./uploads -o results.jsonl
+#   python QRCodeDetectionBatch.py "./uploads/2021-*/*.png" -o results.jsonl --workers 8 --backend numpy
+# Every line holds the path of the image, its size, the bounding box of the largest connected component, the
+# statistics of that component and the time spent on reading, the mask and the labeling (in seconds), or the error
+# message when the image could not be processed. When the output file exists, the images it already lists without an
+# error are skipped and the new lines are appended, so an interrupted run can be restarted with the same command, and
+# the images that failed are tried again.
+
+# the settings of a worker process, set once per process by initializeWorker
+worker_settings = {}
+
+
+# runs once in every worker process, before it processes its first image: stores the settings, creates the scratch
+# buffers of the pipeline, which the worker reuses for all its images (as the service does), and imports the modules
+# the backend needs, so that is not paid for by the first image of every worker
+def initializeWorker(backend, exact):
+    worker_settings["backend"] = backend
+    worker_settings["exact"] = exact
+    worker_settings["scratch"] = QRCodeDetection.ScratchBuffers()
+    if backend == "numpy":
+        try:
+            importlib.import_module("QRCodeDetectionNumPy")
+        except ImportError:
+            # numpy is missing: every image reports the error in its JSON line
+            pass
+
+
+# the png files given by a list of directories (searched recursively), glob patterns and file names, sorted and without
+# duplicates
+def findImageFiles(inputs):
+    filenames = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            filenames.update(glob.glob(os.path.join(glob.escape(pattern), "**", "*.png"), recursive=True))
+        elif os.path.isfile(pattern):
+            filenames.add(pattern)
+        else:
+            filenames.update(glob.glob(pattern, recursive=True))
+    return sorted(filenames)
+
+
+# the paths of the images already processed successfully according to an existing output file; lines with an error
+# and lines that cannot be parsed (e.g. a line cut off by an interrupted run) are ignored, so those images are
+# processed again
+def readProcessedPaths(output_filename):
+    paths = set()
+    if not os.path.exists(output_filename):
+        return paths
+    with open(output_filename) as output_file:
+        for line in output_file:
+            try:
+                result = json.loads(line)
+                if "error" not in result:
+                    paths.add(result["path"])
+            except (ValueError, KeyError, TypeError):
+                pass
+    return paths
+
+
+# detects the QR code in one png file (runs in a worker process) and returns the dictionary written as its JSON line
+# (see QRCodeDetection.detectQRCode; the sizes of all components are left out to keep the lines short)
+def processImageFile(filename):
+    result = {"path": filename}
+    try:
+        detection = QRCodeDetection.detectQRCode(filename, worker_settings.get("backend", "python"),
+                                                 worker_settings.get("exact", False), worker_settings.get("scratch"))
+    except Exception as error:
+        # the png reader errors already start with their type
+        message = str(error)
+        if not message.startswith(type(error).__name__):
+            message = "{}: {}".format(type(error).__name__, message)
+        result["error"] = message
+        return result
+
+    del detection["component_sizes"]
+    result.update(detection)
+    return result
+
+
+# processes the given png files with a pool of workers processes and writes one JSON line per image to output_file
+# as soon as it is done (so the lines are not in input order); at most twice as many images as there are workers are
+# in flight at any time, so the pending results stay small for long lists of files
+# returns the number of images that could not be processed
+def processImageFiles(filenames, output_file, workers = None, backend = "python", exact = False):
+    workers = workers or os.cpu_count() or 1
+    failed = 0
+    remaining = iter(filenames)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=initializeWorker,
+                                                initargs=(backend, exact)) as pool:
+        pending = set()
+        while True:
+            for filename in remaining:
+                pending.add(pool.submit(processImageFile, filename))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                break
+            (done, pending) = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if "error" in result:
+                    failed += 1
+                output_file.write(json.dumps(result) + "\n")
+                output_file.flush()
+    return failed
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Detects QR codes in a batch of png files and writes one JSON line "
+                                                 "per image.")
+    parser.add_argument("inputs", nargs="+", help="directories, glob patterns or png files")
+    parser.add_argument("-o", "--output", help="JSON lines file to append to; images already in it are skipped "
+                                               "(default: standard output)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes "
+                                                                        "(default: number of cpus)")
+    # the parallel backend starts its own worker processes, so it is not offered inside the pool
+    parser.add_argument("--backend", choices=["python", "numpy"], default="python")
+    parser.add_argument("--exact", action="store_true", help="bit-identical smoothing, see computeQRCodeMask")
+    args = parser.parse_args(argv)
+
+    filenames = findImageFiles(args.inputs)
+    if args.output is None:
+        return 1 if processImageFiles(filenames, sys.stdout, args.workers, args.backend, args.exact) else 0
+
+    processed = readProcessedPaths(args.output)
+    filenames = [filename for filename in filenames if filename not in processed]
+    print("{} images to process, {} already in {}".format(len(filenames), len(processed), args.output),
+          file=sys.stderr)
+
+    with open(args.output, "a+") as output_file:
+        # an interrupted run can leave a line without its newline
+        if output_file.tell() > 0:
+            output_file.seek(output_file.tell() - 1)
+            if output_file.read(1) != "\n":
+                output_file.write("\n")
+        failed = processImageFiles(filenames, output_file, args.workers, args.backend, args.exact)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
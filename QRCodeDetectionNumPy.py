@@ -0,0 +1,144 @@
+import numpy
+
+# Vectorized versions of the per-pixel stages in QRCodeDetection.py.
+# Every function works on whole 2D numpy arrays (indexed [y, x]) using slicing based stencils and boolean masks,
+# and performs exactly the same floating point operations in the same order as the pure Python reference,
+# so the resulting masks (and therefore the bounding boxes) are bit-identical.
+
+
+# converts a PixelArray (or an old style list of lists) into a 2D numpy array without copying when possible
+def toNumPyArray(pixel_array, image_width, image_height):
+    if hasattr(pixel_array, 'stride'):
+        flat = numpy.frombuffer(pixel_array.data, dtype=numpy.dtype(pixel_array.typecode))
+        return flat[:pixel_array.stride * image_height].reshape(image_height, pixel_array.stride)[:, :image_width]
+    return numpy.array(pixel_array)[:image_height, :image_width]
+
+
+def computeRGBToSingleGreyscale(pixel_array_r, pixel_array_g, pixel_array_b):
+    r = pixel_array_r.astype(numpy.float64)
+    g = pixel_array_g.astype(numpy.float64)
+    b = pixel_array_b.astype(numpy.float64)
+    return numpy.round(0.299 * r + 0.587 * g + 0.114 * b)
+
+
+def scaleTo0And255AndQuantize(pixel_array):
+    pixel_array = pixel_array.astype(numpy.float64)
+    if pixel_array.size == 0:
+        return numpy.zeros(pixel_array.shape)
+    pMin = pixel_array.min()
+    pMax = pixel_array.max()
+    if pMin == pMax:
+        return numpy.zeros(pixel_array.shape)
+    factor = 255 / (float(pMax) - float(pMin))
+    return numpy.round((pixel_array - pMin) * factor)
+
+
+def computeVerticalEdgesSobelAbsolute(pixel_array):
+    pixel_array = pixel_array.astype(numpy.float64)
+    tmp = numpy.zeros(pixel_array.shape)
+    if pixel_array.shape[0] < 3 or pixel_array.shape[1] < 3:
+        return tmp
+    columns = pixel_array[:-2] + (2 * pixel_array[1:-1]) + pixel_array[2:]
+    tmp[1:-1, 1:-1] = numpy.abs((columns[:, 2:] - columns[:, :-2]) / 8)
+    return tmp
+
+
+def computeHorizontalEdgesSobelAbsolute(pixel_array):
+    pixel_array = pixel_array.astype(numpy.float64)
+    tmp = numpy.zeros(pixel_array.shape)
+    if pixel_array.shape[0] < 3 or pixel_array.shape[1] < 3:
+        return tmp
+    rows = pixel_array[:, :-2] + (2 * pixel_array[:, 1:-1]) + pixel_array[:, 2:]
+    tmp[1:-1, 1:-1] = numpy.abs((rows[:-2] - rows[2:]) / 8)
+    return tmp
+
+
+# computeVerticalEdgesSobelAbsolute + computeHorizontalEdgesSobelAbsolute, computed from one float copy of the input
+def computeEdgesSobelAbsoluteSum(pixel_array):
+    pixel_array = pixel_array.astype(numpy.float64)
+    tmp = numpy.zeros(pixel_array.shape)
+    if pixel_array.shape[0] < 3 or pixel_array.shape[1] < 3:
+        return tmp
+    columns = pixel_array[:-2] + (2 * pixel_array[1:-1]) + pixel_array[2:]
+    rows = pixel_array[:, :-2] + (2 * pixel_array[:, 1:-1]) + pixel_array[:, 2:]
+    tmp[1:-1, 1:-1] = numpy.abs((columns[:, 2:] - columns[:, :-2]) / 8)
+    tmp[1:-1, 1:-1] += numpy.abs((rows[:-2] - rows[2:]) / 8)
+    return tmp
+
+
+def computeBoxAveraging3x3(pixel_array):
+    pixel_array = pixel_array.astype(numpy.float64)
+    tmp = numpy.zeros(pixel_array.shape)
+    if pixel_array.shape[0] < 3 or pixel_array.shape[1] < 3:
+        return tmp
+    rows = pixel_array[:, :-2] + pixel_array[:, 1:-1] + pixel_array[:, 2:]
+    # (top + bot + lr) / 9, in the same order as the reference implementation
+    tmp[1:-1, 1:-1] = (rows[:-2] + rows[2:] + rows[1:-1]) / 9
+    return tmp
+
+
+def computeThresholdGE(pixel_array, threshold_value):
+    return numpy.where(pixel_array < threshold_value, 0, 255).astype(numpy.uint8)
+
+
+def computeErosion8Nbh3x3FlatSE(pixel_array):
+    tmp = numpy.zeros(pixel_array.shape, dtype=numpy.uint8)
+    if pixel_array.shape[0] < 3 or pixel_array.shape[1] < 3:
+        return tmp
+    nz = pixel_array != 0
+    interior = pixel_array[1:-1, 1:-1] > 0
+    for dy in (0, 1, 2):
+        for dx in (0, 1, 2):
+            interior &= nz[dy:dy + nz.shape[0] - 2, dx:dx + nz.shape[1] - 2]
+    tmp[1:-1, 1:-1] = interior
+    return tmp
+
+
+def computeDilation8Nbh3x3FlatSE(pixel_array):
+    image_height, image_width = pixel_array.shape
+    padded = numpy.zeros((image_height + 2, image_width + 2), dtype=bool)
+    padded[1:-1, 1:-1] = pixel_array >= 1
+    result = numpy.zeros(pixel_array.shape, dtype=bool)
+    for dy in (0, 1, 2):
+        for dx in (0, 1, 2):
+            result |= padded[dy:dy + image_height, dx:dx + image_width]
+    return result.astype(numpy.uint8)
+
+
+# runs the same stages as QRCodeDetection.computeQRCodeMask and returns the closed binary mask (values 0 and 1)
+# as a contiguous uint8 numpy array of shape (image_height, image_width)
+def computeQRCodeMask(px_array_r, px_array_g, px_array_b, image_width, image_height):
+    r = toNumPyArray(px_array_r, image_width, image_height)
+    g = toNumPyArray(px_array_g, image_width, image_height)
+    b = toNumPyArray(px_array_b, image_width, image_height)
+
+    pixel_array = computeRGBToSingleGreyscale(r, g, b)
+    return computeQRCodeMaskFromGreyscale(pixel_array, image_width, image_height)
+
+
+# same as computeQRCodeMask, for an image that is already a single greyscale pixel array
+def computeQRCodeMaskFromGreyscale(pixel_array, image_width, image_height):
+    if not isinstance(pixel_array, numpy.ndarray):
+        pixel_array = toNumPyArray(pixel_array, image_width, image_height)
+
+    scaled_pixel_array = scaleTo0And255AndQuantize(pixel_array)
+
+    combined = computeEdgesSobelAbsoluteSum(scaled_pixel_array)
+
+    mean_array = combined
+    for i in range(7):
+        mean_array = computeBoxAveraging3x3(mean_array)
+
+    scaled_pixel_array2 = scaleTo0And255AndQuantize(mean_array)
+    threshold_array = computeThresholdGE(scaled_pixel_array2, 70)
+
+    dialated_array = computeDilation8Nbh3x3FlatSE(computeDilation8Nbh3x3FlatSE(threshold_array))
+    eroded_array = computeErosion8Nbh3x3FlatSE(computeErosion8Nbh3x3FlatSE(dialated_array))
+    return numpy.ascontiguousarray(eroded_array)
+
+
+if __name__ == "__main__":
+    # checks that the masks and bounding boxes are identical to the pure python backend (see
+    # QRCodeDetection.compareBackends)
+    import QRCodeDetection
+    QRCodeDetection.compareBackends(["numpy"])
@@ -0,0 +1,314 @@
+import concurrent.futures
+import os
+from array import array
+from multiprocessing import shared_memory
+
+import QRCodeDetection
+import QRCodeDetectionStreaming
+
+# Multi-process version of the QR code detection pipeline in QRCodeDetection.py.
+# The image is split into horizontal tiles, and every tile is processed by a worker process of a
+# concurrent.futures.ProcessPoolExecutor. The images that pass between the stages live in shared memory blocks that
+# the workers attach to by name, so only the tile bounds and a few numbers are pickled.
+# A tile is read together with a halo of rows above and below it. Every 3x3 stencil computes wrong values in the first
+# and last row of what it is given, and each further stencil moves the damage one row inwards, so the halo is the
+# number of stencils run in a row: 1 (Sobel) + 7 (box averaging) before the second contrast stretch, and
+# 2 + 2 (closing) after it. The two contrast stretches need the range of the whole image, so the pipeline runs in
+# three steps with the range collected from the tiles in between:
+#   1. greyscale conversion of every tile, returning the range of its greyscale values
+#   2. contrast stretching, Sobel and smoothing of every tile, returning the range of its smoothed values
+#   3. contrast stretching, thresholding, closing and connected component labeling of every tile
+# The components of neighbouring tiles are merged where runs of the last row of one tile touch runs of the first row
+# of the next one, so the mask, the component sizes, bounding boxes and centroids are identical to the serial version.
+
+# rows of halo needed by the stencils before and after the second contrast stretch
+SMOOTHING_HALO = 8
+CLOSING_HALO = 4
+
+
+# A pixel array in a shared memory block, which worker processes can attach to by name.
+class SharedPixelArray:
+    def __init__(self, image_width, image_height, typecode, name = None):
+        self.width = image_width
+        self.height = image_height
+        self.typecode = typecode
+        self.itemsize = array(typecode).itemsize
+        if name is None:
+            # a shared memory block cannot be empty
+            size = max(1, image_width * image_height * self.itemsize)
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+    # what a worker process needs to attach to this pixel array, see attach
+    def spec(self):
+        return (self.width, self.height, self.typecode, self.shm.name)
+
+    @classmethod
+    def attach(cls, spec):
+        (image_width, image_height, typecode, name) = spec
+        return cls(image_width, image_height, typecode, name)
+
+    # copies rows y0 to y1 (exclusive) into a new PixelArray
+    def readRows(self, y0, y1):
+        row_bytes = self.width * self.itemsize
+        data = array(self.typecode)
+        data.frombytes(self.shm.buf[y0 * row_bytes:y1 * row_bytes])
+        return QRCodeDetection.PixelArray(self.width, y1 - y0, self.typecode, data)
+
+    # copies the rows of pixel_array (converted to the typecode of this array), starting at row y
+    def writeRows(self, y, pixel_array):
+        row_bytes = self.width * self.itemsize
+        if pixel_array.isContiguous():
+            data = pixel_array.data[:self.width * pixel_array.height]
+        else:
+            data = array(pixel_array.typecode)
+            for row in range(pixel_array.height):
+                data.extend(pixel_array.getRow(row))
+        if pixel_array.typecode != self.typecode:
+            data = array(self.typecode, data)
+        self.shm.buf[y * row_bytes:(y + pixel_array.height) * row_bytes] = memoryview(data).cast('B')
+
+    def close(self):
+        self.shm.close()
+
+    # frees the shared memory block, called once by the process that created it
+    def unlink(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+# splits image_height rows into at most tiles horizontal tiles of (nearly) the same height, as (y0, y1) row ranges
+def computeTileBounds(image_height, tiles):
+    tiles = max(1, min(tiles, image_height))
+    return [(image_height * i // tiles, image_height * (i + 1) // tiles) for i in range(tiles)]
+
+
+# the rows a tile from y0 to y1 has to read to compute its rows with a stencil chain of the given halo
+def expandTileBounds(y0, y1, halo, image_height):
+    return max(0, y0 - halo), min(image_height, y1 + halo)
+
+
+# the range of rows y0 to y1 (exclusive) of pixel_array, None when there are no pixels
+def computeMinAndMaxValuesOfRows(pixel_array, y0, y1):
+    if y0 == y1 or pixel_array.width == 0:
+        return None
+    data = pixel_array.data[y0 * pixel_array.width:y1 * pixel_array.width]
+    return [min(data), max(data)]
+
+
+# combines the ranges of all tiles into the range of the whole image ([0, 0] for an empty image)
+def combineMinAndMaxValues(ranges):
+    ranges = [minMax for minMax in ranges if minMax is not None]
+    if not ranges:
+        return [0, 0]
+    return [min(minMax[0] for minMax in ranges), max(minMax[1] for minMax in ranges)]
+
+
+# step 1 (worker process): greyscale conversion of rows y0 to y1
+def greyscaleTile(r_spec, g_spec, b_spec, greyscale_spec, y0, y1):
+    arrays = {}
+    for spec in (r_spec, g_spec, b_spec, greyscale_spec):
+        if spec not in arrays:
+            arrays[spec] = SharedPixelArray.attach(spec)
+    try:
+        image_width = arrays[greyscale_spec].width
+        r = arrays[r_spec].readRows(y0, y1)
+        g = arrays[g_spec].readRows(y0, y1) if g_spec != r_spec else r
+        b = arrays[b_spec].readRows(y0, y1) if b_spec != r_spec else r
+        greyscale = QRCodeDetection.computeRGBToSingleGreyscale(r, g, b, image_width, y1 - y0)
+        arrays[greyscale_spec].writeRows(y0, greyscale)
+        return computeMinAndMaxValuesOfRows(greyscale, 0, y1 - y0)
+    finally:
+        for shared_array in arrays.values():
+            shared_array.close()
+
+
+# step 2 (worker process): contrast stretching, edge computation and smoothing of rows y0 to y1
+def smoothTile(greyscale_spec, smoothed_spec, y0, y1, minMax, exact):
+    greyscale = SharedPixelArray.attach(greyscale_spec)
+    smoothed = SharedPixelArray.attach(smoothed_spec)
+    try:
+        image_width = greyscale.width
+        (read_y0, read_y1) = expandTileBounds(y0, y1, SMOOTHING_HALO, greyscale.height)
+        tile_height = read_y1 - read_y0
+
+        pixel_array = greyscale.readRows(read_y0, read_y1)
+        scaled_pixel_array = QRCodeDetection.scaleTo0And255AndQuantize(pixel_array, image_width, tile_height, minMax)
+        combined = QRCodeDetection.computeEdgesSobelAbsoluteSum(scaled_pixel_array, image_width, tile_height)
+        mean_array = QRCodeDetection.computeRepeatedBoxAveraging3x3(combined, image_width, tile_height, 7, exact)
+
+        # only the rows of the tile itself are correct, the halo rows are dropped
+        interior = QRCodeDetection.PixelArray(image_width, y1 - y0, mean_array.typecode,
+                                              mean_array.data[(y0 - read_y0) * image_width:(y1 - read_y0) * image_width])
+        smoothed.writeRows(y0, interior)
+        return computeMinAndMaxValuesOfRows(interior, 0, y1 - y0)
+    finally:
+        greyscale.close()
+        smoothed.close()
+
+
+# step 3 (worker process): contrast stretching, thresholding, closing and connected component labeling of rows y0
+# to y1; returns the component statistics and the runs of the first and last row of the tile
+# (see QRCodeDetectionStreaming.collectComponentStatisticsOfRows)
+def closeAndLabelTile(smoothed_spec, mask_spec, y0, y1, minMax):
+    smoothed = SharedPixelArray.attach(smoothed_spec)
+    mask = SharedPixelArray.attach(mask_spec)
+    try:
+        image_width = smoothed.width
+        (read_y0, read_y1) = expandTileBounds(y0, y1, CLOSING_HALO, smoothed.height)
+        tile_height = read_y1 - read_y0
+
+        mean_array = smoothed.readRows(read_y0, read_y1)
+        scaled_pixel_array2 = QRCodeDetection.scaleTo0And255AndQuantize(mean_array, image_width, tile_height, minMax)
+        threshold_image = QRCodeDetection.packBinaryImage(scaled_pixel_array2, image_width, tile_height, 70)
+
+        dialated_image = QRCodeDetection.computeDilation8Nbh3x3FlatSEPacked(threshold_image)
+        dialated_image2 = QRCodeDetection.computeDilation8Nbh3x3FlatSEPacked(dialated_image)
+        eroded_image = QRCodeDetection.computeErosion8Nbh3x3FlatSEPacked(dialated_image2)
+        eroded_image2 = QRCodeDetection.computeErosion8Nbh3x3FlatSEPacked(eroded_image)
+
+        rows = eroded_image2.rows[y0 - read_y0:y1 - read_y0]
+        mask.writeRows(y0, QRCodeDetection.unpackBinaryImage(QRCodeDetection.BinaryImage(image_width, y1 - y0, rows)))
+        return QRCodeDetectionStreaming.collectComponentStatisticsOfRows(rows, y0)
+    finally:
+        smoothed.close()
+        mask.close()
+
+
+# merges the component statistics of the tiles (in tile order) into the statistics of the whole image: the components
+# of one tile that touch a component of the next tile across the seam between them are joined with union-find
+# the components are kept in the order of their first pixel in a row by row scan, so the labels are the same as the
+# ones of a labeling of the whole image
+def mergeTileComponentStatistics(tile_results):
+    statistics = []
+    parent = []
+    seams = []
+    for (tile_statistics, first_runs, last_runs) in tile_results:
+        offset = len(statistics)
+        statistics.extend(tile_statistics)
+        parent.extend(range(offset, len(statistics)))
+        seams.append(([(start, end, offset + label) for start, end, label in first_runs],
+                      [(start, end, offset + label) for start, end, label in last_runs]))
+
+    def find(label):
+        root = label
+        while parent[root] != root:
+            root = parent[root]
+        while parent[label] != root:
+            parent[label], label = root, parent[label]
+        return root
+
+    for (above, below) in zip(seams, seams[1:]):
+        last_runs = above[1]
+        first_runs = below[0]
+        j = 0
+        for start, end, label in first_runs:
+            while j < len(last_runs) and last_runs[j][1] <= start:
+                j += 1
+            k = j
+            while k < len(last_runs) and last_runs[k][0] < end:
+                root = find(label)
+                root_above = find(last_runs[k][2])
+                if root != root_above:
+                    # the smaller index is the component that comes first in the scan
+                    root, other = min(root, root_above), max(root, root_above)
+                    parent[other] = root
+                    QRCodeDetectionStreaming.mergeComponentStatistics(statistics[root], statistics[other])
+                k += 1
+
+    return [stats for label, stats in enumerate(statistics) if find(label) == label]
+
+
+# the process pools used when no executor is passed in, by number of workers: they are created on first use and kept
+# for all later images, so the worker processes are only started once
+shared_executors = {}
+
+
+# the shared process pool with the given number of workers (by default the number of cpus), see shared_executors
+def getSharedExecutor(workers = None):
+    workers = workers or os.cpu_count() or 1
+    executor = shared_executors.get(workers)
+    if executor is None:
+        executor = shared_executors[workers] = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    return executor
+
+
+# runs computeQRCodeMask on tiles of the image in worker processes and labels the mask
+# workers is the number of processes (and tiles), by default the number of cpus; the worker processes are those of
+# executor, or of the shared process pool with that many workers (see getSharedExecutor)
+# returns the mask (as computeQRCodeMask) and the component dictionaries label -> number of pixels,
+# label -> bounding box (min_x, min_y, max_x, max_y) and label -> centroid (x, y), numbered like
+# QRCodeDetection.computeConnectedComponentLabelingWithStatistics
+def computeQRCodeMaskAndComponents(px_array_r, px_array_g, px_array_b, image_width, image_height, workers = None,
+                                   exact = False, executor = None):
+    px_arrays = (px_array_r, px_array_g, px_array_b)
+    return runTiledPipeline(px_arrays, image_width, image_height, workers, exact, executor)
+
+
+# same as computeQRCodeMaskAndComponents, for an image that is already a single greyscale pixel array
+def computeQRCodeMaskAndComponentsFromGreyscale(pixel_array, image_width, image_height, workers = None, exact = False,
+                                                executor = None):
+    return runTiledPipeline((pixel_array,), image_width, image_height, workers, exact, executor)
+
+
+# copies the r, g, b (or greyscale) pixel arrays into shared memory and runs the three steps on the tiles
+def runTiledPipeline(px_arrays, image_width, image_height, workers, exact, executor):
+    px_arrays = [QRCodeDetection.asPixelArray(pixel_array, image_width, image_height) for pixel_array in px_arrays]
+    tiles = computeTileBounds(image_height, workers or os.cpu_count() or 1)
+    y0s = [y0 for y0, y1 in tiles]
+    y1s = [y1 for y0, y1 in tiles]
+    count = len(tiles)
+
+    if executor is None:
+        executor = getSharedExecutor(workers)
+    shared_arrays = []
+    try:
+        # greyscale images give the same pixel array for r, g and b, which is only copied once
+        copies = {}
+        for pixel_array in px_arrays:
+            if id(pixel_array) not in copies:
+                shared_array = SharedPixelArray(image_width, image_height, pixel_array.typecode)
+                shared_arrays.append(shared_array)
+                shared_array.writeRows(0, pixel_array)
+                copies[id(pixel_array)] = shared_array
+        specs = [copies[id(pixel_array)].spec() for pixel_array in px_arrays]
+
+        if len(px_arrays) == 1:
+            greyscale = copies[id(px_arrays[0])]
+            minMax = QRCodeDetection.computeMinAndMaxValues(px_arrays[0], image_width, image_height)
+        else:
+            greyscale = SharedPixelArray(image_width, image_height, QRCodeDetection.greyscaleTypecode(*px_arrays))
+            shared_arrays.append(greyscale)
+            ranges = executor.map(greyscaleTile, [specs[0]] * count, [specs[1]] * count, [specs[2]] * count,
+                                  [greyscale.spec()] * count, y0s, y1s)
+            minMax = combineMinAndMaxValues(ranges)
+
+        smoothed = SharedPixelArray(image_width, image_height, 'd')
+        shared_arrays.append(smoothed)
+        ranges = executor.map(smoothTile, [greyscale.spec()] * count, [smoothed.spec()] * count, y0s, y1s,
+                              [minMax] * count, [exact] * count)
+        minMax2 = combineMinAndMaxValues(ranges)
+
+        mask = SharedPixelArray(image_width, image_height, 'B')
+        shared_arrays.append(mask)
+        tile_results = list(executor.map(closeAndLabelTile, [smoothed.spec()] * count, [mask.spec()] * count, y0s, y1s,
+                                         [minMax2] * count))
+        statistics = mergeTileComponentStatistics(tile_results)
+
+        return (mask.readRows(0, image_height),) + QRCodeDetectionStreaming.formatComponentStatistics(statistics)
+    except concurrent.futures.process.BrokenProcessPool:
+        # a worker process died, and the pool cannot be used any more; the next image starts a new one
+        for key, shared_executor in list(shared_executors.items()):
+            if shared_executor is executor:
+                del shared_executors[key]
+        raise
+    finally:
+        for shared_array in shared_arrays:
+            shared_array.unlink()
+
+
+if __name__ == "__main__":
+    # checks that the masks and component statistics are identical to the pure python backend (see
+    # QRCodeDetection.compareBackends)
+    QRCodeDetection.compareBackends(["parallel"])
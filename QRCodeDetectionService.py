@@ -0,0 +1,222 @@
+import argparse
+import http.server
+import json
+import os
+import queue
+import socketserver
+import sys
+import threading
+import time
+
+import QRCodeDetection
+import imageIO.png
+
+# Long running QR code detection service: a local HTTP server (on a TCP port or a Unix socket) that keeps the
+# interpreter, the imported modules and the scratch buffers of the pipeline warm between images, e.g.
+#   python QRCodeDetectionService.py --listen 127.0.0.1:8373
+#   curl --data-binary @image.png http://127.0.0.1:8373/detect
+#   python QRCodeDetectionService.py --listen unix:/tmp/qrdetect.sock
+#   curl --unix-socket /tmp/qrdetect.sock --data-binary @image.png http://localhost/detect
+# POST /detect takes the bytes of a png file as request body and answers with the JSON result of
+# QRCodeDetection.detectQRCode, plus the "latency" of the request (seconds waiting in the queue, in the detection and
+# in total); malformed png data (including truncated files and corrupt compressed data) is answered with 400, any other
+# failure with 500. GET /stats answers with the number of requests served, rejected, invalid (400) and failed (500) and
+# their latencies.
+# The requests are put into a bounded queue that a fixed number of detection threads work on; when the queue is full,
+# the request is rejected right away with 503 Service Unavailable (and a Retry-After header), so a burst of uploads
+# cannot pile up unbounded work and memory in the service.
+
+
+# one request waiting for (or done with) its detection
+class DetectionJob:
+    def __init__(self, data):
+        self.data = data
+        self.enqueued = time.perf_counter()
+        self.started = None
+        self.finished = None
+        self.detection = None
+        self.error = None
+        self.done = threading.Event()
+
+
+# The bounded request queue and the detection threads working on it; every thread keeps its own
+# QRCodeDetection.ScratchBuffers, which are reused for all the images it processes. The python stages hold the GIL,
+# so more than one thread mostly helps with the numpy backend (or to overlap reading requests with detections).
+class DetectionService:
+    def __init__(self, workers = 1, queue_size = 8, backend = "python", exact = False):
+        self.backend = backend
+        self.exact = exact
+        self.jobs = queue.Queue(queue_size)
+        self.lock = threading.Lock()
+        self.statistics = {"served": 0, "rejected": 0, "invalid": 0, "failed": 0, "total_latency": 0.0, "max_latency": 0.0}
+        self.threads = [threading.Thread(target=self.work, daemon=True) for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    # queues the png data and returns its DetectionJob, or None when the queue is full
+    def submit(self, data):
+        job = DetectionJob(data)
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            with self.lock:
+                self.statistics["rejected"] += 1
+            return None
+        return job
+
+    def work(self):
+        scratch = QRCodeDetection.ScratchBuffers()
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            job.started = time.perf_counter()
+            try:
+                job.detection = QRCodeDetection.detectQRCode(job.data, self.backend, self.exact, scratch)
+            except Exception as error:
+                job.error = error
+            job.finished = time.perf_counter()
+            job.data = None
+
+            with self.lock:
+                latency = job.finished - job.enqueued
+                self.statistics["served"] += 1
+                self.statistics["invalid"] += isInvalidPNGError(job.error)
+                self.statistics["failed"] += job.error is not None and not isInvalidPNGError(job.error)
+                self.statistics["total_latency"] += latency
+                self.statistics["max_latency"] = max(self.statistics["max_latency"], latency)
+            job.done.set()
+
+    def getStatistics(self):
+        with self.lock:
+            statistics = dict(self.statistics)
+        statistics["queued"] = self.jobs.qsize()
+        statistics["mean_latency"] = statistics["total_latency"] / statistics["served"] if statistics["served"] else 0.0
+        return statistics
+
+    # stops the detection threads once the queued requests are done
+    def close(self):
+        for thread in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+# whether the error of a detection is caused by broken png data (the png reader raises FormatError for malformed,
+# truncated and corrupt compressed data)
+def isInvalidPNGError(error):
+    return isinstance(error, imageIO.png.FormatError)
+
+
+class DetectionRequestHandler(http.server.BaseHTTPRequestHandler):
+    # larger request bodies are rejected with 413 before they are read
+    max_body_size = 64 * 1024 * 1024
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.sendJSON(200, self.server.service.getStatistics())
+        else:
+            self.sendJSON(404, {"error": "unknown path {}".format(self.path)})
+
+    def do_POST(self):
+        if self.path != "/detect":
+            self.sendJSON(404, {"error": "unknown path {}".format(self.path)})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self.sendJSON(411, {"error": "Content-Length required"})
+            return
+        # rfile.read(-1) would read until the client closes the connection, past max_body_size
+        if length < 0:
+            self.sendJSON(400, {"error": "invalid Content-Length {}".format(length)})
+            self.close_connection = True
+            return
+        if length > self.max_body_size:
+            self.sendJSON(413, {"error": "png data larger than {} bytes".format(self.max_body_size)})
+            self.close_connection = True
+            return
+        data = self.rfile.read(length)
+
+        job = self.server.service.submit(data)
+        if job is None:
+            self.sendJSON(503, {"error": "too many requests queued"}, {"Retry-After": "1"})
+            return
+        job.done.wait()
+
+        latency = {"queue": job.started - job.enqueued, "detection": job.finished - job.started,
+                   "total": job.finished - job.enqueued}
+        if job.error is not None:
+            # broken png data is the client's fault, anything else is a failure of the service
+            status = 400 if isInvalidPNGError(job.error) else 500
+            self.sendJSON(status, {"error": str(job.error), "latency": latency})
+            return
+        detection = dict(job.detection)
+        # the sizes of all components can be long for noisy images, the number of components is kept
+        del detection["component_sizes"]
+        detection["latency"] = latency
+        self.sendJSON(200, detection)
+
+    def sendJSON(self, status, content, headers = None):
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Unix socket clients have no address
+    def address_string(self):
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+# the server for a listen address "host:port" or "unix:/path/to/socket"; the requests are passed on to service
+def createServer(listen, service):
+    if listen.startswith("unix:"):
+        path = listen[len("unix:"):]
+        if os.path.exists(path):
+            os.unlink(path)
+        server = ThreadingUnixHTTPServer(path, DetectionRequestHandler)
+    else:
+        (host, separator, port) = listen.rpartition(":")
+        server = http.server.ThreadingHTTPServer((host or "127.0.0.1", int(port)), DetectionRequestHandler)
+    server.service = service
+    return server
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Serves QR code detection on png files over HTTP.")
+    parser.add_argument("--listen", default="127.0.0.1:8373", help="host:port or unix:/path/to/socket "
+                                                                   "(default: 127.0.0.1:8373)")
+    parser.add_argument("--workers", type=int, default=1, help="number of detection threads (default: 1)")
+    parser.add_argument("--queue-size", type=int, default=8, help="number of requests that can wait for a "
+                                                                  "detection thread before requests are rejected "
+                                                                  "(default: 8)")
+    # the parallel backend would fork its process pool from this multi-threaded server, so it is not offered
+    parser.add_argument("--backend", choices=["python", "numpy"], default="python")
+    parser.add_argument("--exact", action="store_true", help="bit-identical smoothing, see computeQRCodeMask")
+    args = parser.parse_args(argv)
+
+    service = DetectionService(args.workers, args.queue_size, args.backend, args.exact)
+    server = createServer(args.listen, service)
+    print("listening on {}".format(args.listen), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
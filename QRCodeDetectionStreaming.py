@@ -0,0 +1,321 @@
+import re
+
+import QRCodeDetection
+
+# Streaming version of the QR code detection pipeline in QRCodeDetection.py.
+# The rows of the png file are pushed one at a time through greyscale conversion, contrast stretching, Sobel, the
+# seven box averaging passes, thresholding, the closing and the connected component labeling; every 3x3 stencil
+# stage only keeps the window of three rows it needs (the row above and the row below as halo), so the memory used
+# does not depend on the image height, and no full size intermediate image is ever created.
+# The two contrast stretches need the minimum and maximum of a whole image, which are only known once the last row has
+# been seen; instead of keeping that image, the png file is decoded again: the first pass finds the range of the
+# greyscale values, the second pass runs up to the smoothing to find the range of the smoothed edges, and the third
+# pass runs the whole pipeline. This trades three decodes for bounded memory.
+# All stages perform the same floating point operations in the same order as the in-memory version with
+# exact = True, so the resulting bounding box is identical.
+
+
+# returns width, height and a generator of the greyscale rows of the png image
+# for straightlaced images the rows are decoded on demand (imageIO.png.Reader._iter_straight_packed); interlaced
+# images are stored in passes across the whole image, and are deinterlaced in memory by the png reader first
+# the size is read from the png header by a reader that is closed right away; the rows are decoded by a reader that
+# the generator opens when it is first iterated and closes (releasing the memory mapped file) once the rows are used
+# up, or the generator is closed, so a generator that is never iterated holds no file
+def streamGreyscaleRows(source):
+    with QRCodeDetection.openPNGReader(source) as image_reader:
+        image_reader.preamble()
+        (image_width, image_height) = (image_reader.width, image_reader.height)
+
+    def rows():
+        with QRCodeDetection.openPNGReader(source) as image_reader:
+            (image_width, image_height, image_rows, image_info) = image_reader.asDirect()
+            for channel_rows in QRCodeDetection.iterRGBImageRows(image_rows, image_info):
+                if len(channel_rows) == 1:
+                    channel_rows = channel_rows * 3
+                yield QRCodeDetection.computeRGBRowToGreyscale(*channel_rows)
+
+    return image_width, image_height, rows()
+
+
+# the smallest and largest value of a stream of rows, [0, 0] for an empty image (like computeMinAndMaxValues)
+def computeMinAndMaxValuesOfRows(rows):
+    pMin = None
+    pMax = None
+    for row in rows:
+        if len(row) == 0:
+            continue
+        rowMin = min(row)
+        rowMax = max(row)
+        if pMin is None or rowMin < pMin:
+            pMin = rowMin
+        if pMax is None or rowMax > pMax:
+            pMax = rowMax
+    if pMin is None:
+        return [0, 0]
+    return [pMin, pMax]
+
+
+# scaleTo0And255AndQuantize on a stream of rows, with the range of the whole image given as minMax
+def streamScaleTo0And255AndQuantize(rows, minMax):
+    if minMax[0] == minMax[1]:
+        for row in rows:
+            yield [0] * len(row)
+        return
+
+    pMin = minMax[0]
+    factor = 255/(minMax[1]-minMax[0])
+    for row in rows:
+        yield [round(((v - pMin) * factor)) for v in row]
+
+
+# slides a window of three rows over a stream of rows and yields kernel(top, mid, bot) for every row; top is None for
+# the first row and bot is None for the last row, so the kernel decides what happens at the image border
+# prepare is applied once to every row when it enters the window (e.g. to compute horizontal sums that are used by
+# all three output rows the row contributes to)
+def stream3x3(rows, kernel, prepare = None):
+    if prepare is not None:
+        rows = map(prepare, rows)
+    rows = iter(rows)
+    top = None
+    mid = next(rows, None)
+    if mid is None:
+        return
+    for bot in rows:
+        yield kernel(top, mid, bot)
+        top, mid = mid, bot
+    yield kernel(top, mid, None)
+
+
+# computeEdgesSobelAbsoluteSum on a stream of rows
+def streamEdgesSobelAbsoluteSum(rows, image_width):
+    zeros = [0] * image_width
+
+    def prepare(row):
+        return row, [l + (2 * m) + r for l, m, r in zip(row, row[1:], row[2:])]
+
+    def kernel(top, mid, bot):
+        if top is None or bot is None or image_width < 3:
+            return zeros
+        columns = [t + (2 * m) + b for t, m, b in zip(top[0], mid[0], bot[0])]
+        return [0] + [abs((right - left)/8) + abs((t - b)/8)
+                      for left, right, t, b in zip(columns, columns[2:], top[1], bot[1])] + [0]
+
+    return stream3x3(rows, kernel, prepare)
+
+
+# computeBoxAveraging3x3 on a stream of rows
+def streamBoxAveraging3x3(rows, image_width):
+    zeros = [0] * image_width
+
+    def prepare(row):
+        return [l + m + r for l, m, r in zip(row, row[1:], row[2:])]
+
+    def kernel(top, lr, bot):
+        if top is None or bot is None or image_width < 3:
+            return zeros
+        return [0] + [(t + b + m)/9 for t, b, m in zip(top, bot, lr)] + [0]
+
+    return stream3x3(rows, kernel, prepare)
+
+
+# the smoothed edge rows: contrast stretching of the greyscale rows, Sobel and seven box averaging passes
+def streamSmoothedEdgeRows(rows, image_width, minMax):
+    scaled_rows = streamScaleTo0And255AndQuantize(rows, minMax)
+    mean_rows = streamEdgesSobelAbsoluteSum(scaled_rows, image_width)
+    for i in range(7):
+        mean_rows = streamBoxAveraging3x3(mean_rows, image_width)
+    return mean_rows
+
+
+# contrast stretching and computeThresholdGE on a stream of rows, yielding the rows bit-packed like the rows of a
+# QRCodeDetection.BinaryImage (see packBinaryImage)
+def streamThresholdGEPacked(rows, minMax, threshold_value):
+    table = bytes(ord('1') if v >= threshold_value else ord('0') for v in range(256))
+    for row in streamScaleTo0And255AndQuantize(rows, minMax):
+        yield int(bytes(row).translate(table)[::-1], 2) if row else 0
+
+
+# computeDilation8Nbh3x3FlatSEPacked on a stream of bit-packed rows
+def streamDilation8Nbh3x3FlatSEPacked(rows, image_width):
+    mask = (1 << image_width) - 1
+
+    def prepare(row):
+        return (row | (row << 1) | (row >> 1)) & mask
+
+    def kernel(top, mid, bot):
+        return (top or 0) | mid | (bot or 0)
+
+    return stream3x3(rows, kernel, prepare)
+
+
+# computeErosion8Nbh3x3FlatSEPacked on a stream of bit-packed rows
+def streamErosion8Nbh3x3FlatSEPacked(rows):
+
+    def prepare(row):
+        return row & (row << 1) & (row >> 1)
+
+    def kernel(top, mid, bot):
+        if top is None or bot is None:
+            return 0
+        return top & mid & bot
+
+    return stream3x3(rows, kernel, prepare)
+
+
+# the streaming executor: returns width, height and a generator of the bit-packed rows of the same mask as
+# QRCodeDetection.computeQRCodeMask (with exact = True); the first two decodes of the png file happen here, the third
+# one while the rows are consumed
+# the passes cannot share their work without keeping a whole image: the first pass only decodes and converts to
+# greyscale, and its range is kept for the other two; the second pass repeats that and runs Sobel and the smoothing
+# for their range, and the third pass repeats them again, because keeping the smoothed image for the third pass would
+# need 8 bytes per pixel, the very memory the streaming executor avoids. On bch.png the passes take about 13%, 40%
+# and 47% of the time, so the extra decodes cost far less than the repeated stencils.
+def streamQRCodeMaskRows(source):
+    (image_width, image_height, rows) = streamGreyscaleRows(source)
+    minMax = computeMinAndMaxValuesOfRows(rows)
+
+    (image_width, image_height, rows) = streamGreyscaleRows(source)
+    minMax2 = computeMinAndMaxValuesOfRows(streamSmoothedEdgeRows(rows, image_width, minMax))
+
+    (image_width, image_height, rows) = streamGreyscaleRows(source)
+    mean_rows = streamSmoothedEdgeRows(rows, image_width, minMax)
+    mask_rows = streamThresholdGEPacked(mean_rows, minMax2, 70)
+    for i in range(2):
+        mask_rows = streamDilation8Nbh3x3FlatSEPacked(mask_rows, image_width)
+    for i in range(2):
+        mask_rows = streamErosion8Nbh3x3FlatSEPacked(mask_rows)
+    return image_width, image_height, mask_rows
+
+
+# connected component labeling (4-neighbourhood) on a stream of bit-packed rows, without a label image: like
+# QRCodeDetection.computeConnectedComponentLabelingWithStatistics, runs are merged (union-find) with the overlapping
+# runs of the previous row, but the statistics are collected in the same pass and merged when two components meet, so
+# only the runs of the previous row and one entry per component are kept
+# the labels are numbered in the same order as computeConnectedComponentLabelingWithStatistics
+# returns a dictionary label -> number of pixels, a dictionary label -> bounding box (min_x, min_y, max_x, max_y)
+# and a dictionary label -> centroid (x, y)
+def computeConnectedComponentStatisticsOfRows(rows):
+    (statistics, first_runs, last_runs) = collectComponentStatisticsOfRows(rows)
+    return formatComponentStatistics(statistics)
+
+
+# the labeling pass of computeConnectedComponentStatisticsOfRows, for rows that start at row y_offset of the image
+# returns the statistics [number of pixels, min_x, min_y, max_x, max_y, sum of x, sum of y] of every component in
+# label order, and the runs (start, end, index into the statistics) of the first and of the last row, which is what is
+# needed to merge the components of two neighbouring horizontal strips of an image
+def collectComponentStatisticsOfRows(rows, y_offset = 0):
+    # union-find forest over the components; a component gets an id when one of its runs does not touch any run of
+    # the previous row, and the root of a tree is always its smallest id, which belongs to the run that comes first
+    # in the row by row scan
+    parent = []
+    # the statistics of every root (None for ids that have been merged into another component)
+    statistics = []
+
+    def find(label):
+        root = label
+        while parent[root] != root:
+            root = parent[root]
+        # path compression
+        while parent[label] != root:
+            parent[label], label = root, parent[label]
+        return root
+
+    def union(root, other):
+        if other < root:
+            root, other = other, root
+        parent[other] = root
+        mergeComponentStatistics(statistics[root], statistics[other])
+        statistics[other] = None
+        return root
+
+    first_runs = []
+    previous_runs = []
+    for y, row in enumerate(rows, y_offset):
+        current_runs = []
+        j = 0
+        for run in re.finditer("1+", bin(row)[:1:-1]):
+            (start, end) = run.span()
+
+            # runs of the previous row that end before this run starts cannot touch this run or any later one
+            while j < len(previous_runs) and previous_runs[j][1] <= start:
+                j += 1
+            root = None
+            k = j
+            while k < len(previous_runs) and previous_runs[k][0] < end:
+                root_above = find(previous_runs[k][2])
+                if root is None:
+                    root = root_above
+                elif root_above != root:
+                    root = union(root, root_above)
+                k += 1
+            if root is None:
+                root = len(parent)
+                parent.append(root)
+                statistics.append([0, start, y, end - 1, y, 0, 0])
+
+            length = end - start
+            stats = statistics[root]
+            stats[0] += length
+            if start < stats[1]:
+                stats[1] = start
+            if end - 1 > stats[3]:
+                stats[3] = end - 1
+            stats[4] = y
+            stats[5] += (start + end - 1) * length / 2
+            stats[6] += y * length
+            current_runs.append((start, end, root))
+        if y == y_offset:
+            first_runs = current_runs
+        previous_runs = current_runs
+
+    # number the remaining roots in order and point the runs of the first and last row at them
+    indices = {}
+    for label, stats in enumerate(statistics):
+        if stats is not None:
+            indices[label] = len(indices)
+    first_runs = [(start, end, indices[find(label)]) for start, end, label in first_runs]
+    last_runs = [(start, end, indices[find(label)]) for start, end, label in previous_runs]
+    statistics = [stats for stats in statistics if stats is not None]
+
+    return statistics, first_runs, last_runs
+
+
+# adds the statistics of component other to the statistics of component stats
+def mergeComponentStatistics(stats, other):
+    stats[0] += other[0]
+    stats[1] = min(stats[1], other[1])
+    stats[2] = min(stats[2], other[2])
+    stats[3] = max(stats[3], other[3])
+    stats[4] = max(stats[4], other[4])
+    stats[5] += other[5]
+    stats[6] += other[6]
+
+
+# turns a list of component statistics (see collectComponentStatisticsOfRows) into the dictionaries label -> number of
+# pixels, label -> bounding box and label -> centroid, with the labels numbered from 1 in list order
+def formatComponentStatistics(statistics):
+    label_dict = {}
+    bounding_boxes = {}
+    centroids = {}
+    for label, stats in enumerate(statistics, 1):
+        label_dict[label] = stats[0]
+        bounding_boxes[label] = tuple(stats[1:5])
+        centroids[label] = (stats[5] / stats[0], stats[6] / stats[0])
+
+    return label_dict, bounding_boxes, centroids
+
+
+# the bounding box (min_x, min_y, max_x, max_y) of the QR code in a png file (file name or bytes), computed without
+# ever holding the whole image in memory; None when the mask is empty
+def computeQRCodeBoundingBox(source):
+    (image_width, image_height, mask_rows) = streamQRCodeMaskRows(source)
+    (ccsizes, ccboxes, cccentroids) = computeConnectedComponentStatisticsOfRows(mask_rows)
+    if not ccsizes:
+        return None
+    return ccboxes[QRCodeDetection.keyWithMaxVal(ccsizes)]
+
+
+if __name__ == "__main__":
+    # checks that the masks and component statistics are identical to the pure python backend (see
+    # QRCodeDetection.compareBackends)
+    QRCodeDetection.compareBackends(["streaming"])
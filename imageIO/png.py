@@ -174,11 +174,13 @@ from __future__ import print_function
 __version__ = "0.0.20"
 
 import collections
-import io   # For io.BytesIO
+import concurrent.futures
 import itertools
 import math
+import mmap
 # http://www.python.org/doc/2.4.4/lib/module-operator.html
 import operator
+import os
 import re
 import struct
 import sys
@@ -189,7 +191,7 @@ import zlib
 from array import array
 
 
-__all__ = ['Image', 'Reader', 'Writer', 'write_chunks', 'from_array']
+__all__ = ['Image', 'Reader', 'Decoder', 'Writer', 'write_chunks', 'from_array']
 
 
 # The PNG signature.
@@ -373,7 +375,10 @@ class Writer:
                  chunk_limit=2**20,
                  x_pixels_per_unit=None,
                  y_pixels_per_unit=None,
-                 unit_is_meter=False):
+                 unit_is_meter=False,
+                 filtering=None,
+                 workers=1,
+                 strategy=None):
         """
         Create a PNG encoder object.
 
@@ -414,6 +419,14 @@ class Writer:
         unit_is_meter
           `True` to indicate that the unit (for the `pHYs`
           chunk) is metre.
+        filtering
+          Choose a filter type for every row:
+          ``None`` (no filtering), ``'fast'``, ``'balanced'``
+          or ``'small'``.
+        workers
+          Number of threads compressing the image data.
+        strategy
+          zlib compression strategy, for example ``zlib.Z_RLE``.
 
         The image size (in pixels) can be specified either by using the
         `width` and `height` arguments, or with the single `size`
@@ -504,6 +517,12 @@ class Writer:
         -1 and ``None`` both mean that the ``zlib`` module uses
         the default level of compession (which is generally acceptable).
 
+        The `strategy` argument is passed to the ``zlib`` module as well:
+        ``zlib.Z_RLE`` is fast and compresses 1-bit masks and
+        other images with long runs of equal bytes well,
+        ``zlib.Z_FILTERED`` can suit filtered images.
+        ``None`` means ``zlib.Z_DEFAULT_STRATEGY``.
+
         If `interlace` is true then an interlaced image is created
         (using PNG's so far only interace method, *Adam7*).
         This does not affect how the pixels should be passed in,
@@ -522,6 +541,25 @@ class Writer:
         compressing the image.
         In order to avoid using large amounts of memory,
         multiple ``IDAT`` chunks may be created.
+
+        The `filtering` argument selects a filter type for each row
+        of a straightlaced image,
+        which often makes the image data compress much better
+        (interlaced images, colour mapped images and
+        images with a bit depth below 8 are never filtered).
+        For every row, the filtered scanline whose bytes,
+        taken as signed values, have the smallest sum of
+        absolute values is used.
+        ``'fast'`` tries the None, Sub, Up and Average filters;
+        ``'balanced'`` tries the Paeth filter as well;
+        ``'small'`` is ``'balanced'`` with
+        the highest compression level (unless `compression` is given).
+        ``None`` (the default) writes every row unfiltered.
+
+        When `workers` is more than 1, the image data is compressed
+        in blocks of `chunk_limit` bytes by that many threads at once,
+        see :class:`ParallelCompressor`.
+        ``None`` uses as many threads as there are CPUs.
         """
 
         # At the moment the `planes` argument is ignored;
@@ -545,6 +583,12 @@ class Writer:
             raise ProtocolError(
                 "transparent colour not allowed with alpha channel")
 
+        if filtering not in filter_presets:
+            raise ProtocolError(
+                "filtering must be one of %s" %
+                ", ".join(map(repr, filter_presets)))
+        workers = check_workers(workers)
+
         # bitdepth is either single integer, or tuple of integers.
         # Convert to tuple.
         try:
@@ -610,6 +654,9 @@ class Writer:
         self.x_pixels_per_unit = x_pixels_per_unit
         self.y_pixels_per_unit = y_pixels_per_unit
         self.unit_is_meter = bool(unit_is_meter)
+        self.filtering = filtering
+        self.workers = workers
+        self.strategy = strategy
 
         self.color_type = (4 * self.alpha +
                            2 * (not greyscale) +
@@ -723,26 +770,67 @@ class Writer:
 
         self.write_preamble(outfile)
 
+        compression = self.compression
+        if compression is None:
+            compression = -1
+        strategy = self.strategy
+        if strategy is None:
+            strategy = zlib.Z_DEFAULT_STRATEGY
+        filter_types = filter_presets[self.filtering]
+        if self.interlace:
+            # See below: the rows of interlaced images are not filtered.
+            filter_types = None
+        if self.bitdepth < 8 or self.colormap:
+            # Filtering rarely helps these, see
+            # http://www.w3.org/TR/PNG/#12Filter-selection
+            filter_types = None
+        if self.compression is None and self.filtering == 'small':
+            compression = 9
+
         # http://www.w3.org/TR/PNG/#11IDAT
-        if self.compression is not None:
-            compressor = zlib.compressobj(self.compression)
-        else:
-            compressor = zlib.compressobj()
+        if self.workers > 1:
+            compressor = ParallelCompressor(compression, self.workers,
+                                            strategy)
+            try:
+                return self.write_idat(outfile, rows, compressor,
+                                       filter_types)
+            finally:
+                # Stop the threads also when writing fails.
+                compressor.close()
+        compressor = zlib.compressobj(compression, zlib.DEFLATED,
+                                      zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL,
+                                      strategy)
+        return self.write_idat(outfile, rows, compressor, filter_types)
+
+    def write_idat(self, outfile, rows, compressor, filter_types):
+        """
+        Write the rows as ``IDAT`` chunks compressed by `compressor`,
+        and the ``IEND`` chunk; see :meth:`write_packed`.
+        """
+
+        if filter_types:
+            # Filter unit, see Reader.undo_filter.
+            fu = max(1, int(self.psize))
+            rows = filter_rows(rows, fu, filter_types)
 
         # data accumulates bytes to be compressed for the IDAT chunk;
         # it's compressed when sufficiently large.
         data = bytearray()
 
         for i, row in enumerate(rows):
-            # Add "None" filter type.
-            # Currently, it's essential that this filter type be used
-            # for every scanline as
-            # we do not mark the first row of a reduced pass image;
-            # that means we could accidentally compute
-            # the wrong filtered scanline if we used
-            # "up", "average", or "paeth" on such a line.
-            data.append(0)
-            data.extend(row)
+            if filter_types:
+                # The filter type is already prefixed.
+                data.extend(row)
+            else:
+                # Add "None" filter type.
+                # For interlaced images, it's essential that this
+                # filter type be used for every scanline as
+                # we do not mark the first row of a reduced pass image;
+                # that means we could accidentally compute
+                # the wrong filtered scanline if we used
+                # "up", "average", or "paeth" on such a line.
+                data.append(0)
+                data.extend(row)
             if len(data) > self.chunk_limit:
                 compressed = compressor.compress(data)
                 if len(compressed):
@@ -917,6 +1005,256 @@ def write_chunks(out, chunks):
         write_chunk(out, *chunk)
 
 
+class ParallelCompressor:
+    """
+    Compress data into one zlib stream, like a ``zlib.compressobj``,
+    using several threads.
+
+    Every piece of data passed to :meth:`compress` is a block that is
+    compressed in a thread of its own as a raw deflate stream
+    (``zlib`` releases the GIL while it compresses).
+    Its compressor is primed with the last 32 KiB of the data before it
+    as preset dictionary, so the block compresses about as well as
+    it would in a single stream,
+    and a ``Z_SYNC_FLUSH`` ends it on a byte boundary
+    without marking it as the last block.
+    The blocks are joined in order, between the zlib header and the
+    final (empty) block and Adler-32 checksum added by :meth:`flush`.
+    """
+
+    # The size of the deflate window, and so of the preset dictionary.
+    window = 2 ** 15
+
+    def __init__(self, level=None, workers=None, strategy=None):
+        if level is None:
+            level = -1
+        if strategy is None:
+            strategy = zlib.Z_DEFAULT_STRATEGY
+        self.level = level
+        self.strategy = strategy
+        self.workers = check_workers(workers)
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.workers)
+        # The blocks being compressed, in order.
+        self.pending = collections.deque()
+        self.dictionary = b''
+        self.checksum = zlib.adler32(b'')
+        self.header = zlib_header(level)
+
+    def compress(self, data):
+        """
+        Add a block of data;
+        return the compressed data of the blocks that are finished.
+        To limit memory, waits for the oldest block when
+        twice as many blocks as there are workers are pending.
+        """
+
+        data = bytes(data)
+        if data:
+            self.checksum = zlib.adler32(data, self.checksum)
+            self.pending.append(self.executor.submit(
+                compress_block, data, self.level, self.dictionary,
+                self.strategy))
+            self.dictionary = (self.dictionary + data)[-self.window:]
+        out = [self.header]
+        self.header = b''
+        while self.pending and (self.pending[0].done() or
+                                len(self.pending) > 2 * self.workers):
+            out.append(self.pending.popleft().result())
+        return b''.join(out)
+
+    def flush(self):
+        """
+        Wait for all blocks and return the rest of the zlib stream.
+        No more data can be added.
+        """
+
+        out = [self.header]
+        out.extend(future.result() for future in self.pending)
+        self.pending.clear()
+        self.executor.shutdown()
+        out.append(zlib.compressobj(self.level, zlib.DEFLATED, -15).flush())
+        out.append(struct.pack('!I', self.checksum & 0xffffffff))
+        return b''.join(out)
+
+    def close(self):
+        """
+        Drop the blocks not compressed yet and stop the threads,
+        for example when writing the data failed.
+        Does nothing after :meth:`flush`.
+        """
+
+        for future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.executor.shutdown()
+
+
+def check_workers(workers):
+    """
+    Check the number of compressing threads, see :class:`Writer`;
+    ``None`` is the number of CPUs.
+    """
+
+    if workers is None:
+        return os.cpu_count() or 1
+    if not is_natural(workers) or workers < 1:
+        raise ValueError("workers must be a positive integer")
+    return workers
+
+
+def compress_block(data, level, dictionary,
+                   strategy=zlib.Z_DEFAULT_STRATEGY):
+    """
+    Compress `data` as raw deflate blocks ending on a byte boundary,
+    using `dictionary` (the data before it) as preset dictionary.
+    See :class:`ParallelCompressor`.
+    """
+
+    if dictionary:
+        compressor = zlib.compressobj(
+            level, zlib.DEFLATED, -15, zlib.DEF_MEM_LEVEL,
+            strategy, dictionary)
+    else:
+        compressor = zlib.compressobj(
+            level, zlib.DEFLATED, -15, zlib.DEF_MEM_LEVEL, strategy)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def zlib_header(level):
+    """
+    The two byte header of a zlib stream (32 KiB window,
+    no preset dictionary) compressed with the given `level`.
+    """
+
+    # The compression level field, as zlib sets it.
+    if level == -1:
+        flevel = 2
+    elif level < 2:
+        flevel = 0
+    elif level < 6:
+        flevel = 1
+    elif level == 6:
+        flevel = 2
+    else:
+        flevel = 3
+    header = (0x78 << 8) | (flevel << 6)
+    # The check bits make the header a multiple of 31.
+    header += -header % 31
+    return struct.pack('!H', header)
+
+
+# The filter types that Writer(filtering=...) tries for every row.
+filter_presets = {
+    None: None,
+    'fast': (0, 1, 2, 3),
+    'balanced': (0, 1, 2, 3, 4),
+    'small': (0, 1, 2, 3, 4),
+}
+
+# For every byte value, its absolute value as a signed byte.
+_signed_abs = bytes(min(v, 256 - v) for v in range(256))
+
+
+def filter_rows(rows, filter_unit, filter_types):
+    """
+    Filter each packed row in `rows` with the one of `filter_types`
+    that gives the smallest sum of absolute (signed byte) values,
+    and yield it with its filter type byte prefixed.
+    `filter_unit` is the number of bytes per pixel (at least 1).
+
+    The filters work on all bytes of a row at once:
+    a row is taken as one (little endian) integer and
+    the bytes are added and subtracted modulo 256 by
+    handling the top bit of every byte separately,
+    so that no carry crosses a byte.
+    """
+
+    shift = 8 * filter_unit
+    previous = None
+    for row in rows:
+        row = bytes(row)
+        if previous is None:
+            # The first row, which has a previous row of zeros.
+            n = len(row)
+            previous = bytes(n)
+            everything = (1 << (8 * n)) - 1
+            # The top bit of every byte, the other bits,
+            # and all bits but the lowest.
+            high = int.from_bytes(b'\x80' * n, 'little')
+            low = high ^ everything
+            even = int.from_bytes(b'\xfe' * n, 'little')
+
+        x = int.from_bytes(row, 'little')
+        b = int.from_bytes(previous, 'little')
+        # The bytes to the left.
+        a = (x << shift) & everything
+
+        best = None
+        for filter_type in filter_types:
+            if filter_type == 0:
+                filtered = row
+            elif filter_type == 4:
+                filtered = filter_paeth(filter_unit, row, previous)
+            else:
+                # The prediction: the bytes to the left, above, or
+                # their average (rounded down).
+                if filter_type == 1:
+                    y = a
+                elif filter_type == 2:
+                    y = b
+                else:
+                    y = (a & b) + (((a ^ b) & even) >> 1)
+                # The bytes of x minus the bytes of y, modulo 256.
+                filtered = (((x | high) - (y & low)) ^
+                            ((x ^ ~y) & high)).to_bytes(n, 'little')
+            cost = sum(filtered.translate(_signed_abs))
+            if best is None or cost < best[0]:
+                best = (cost, filter_type, filtered)
+
+        yield bytes([best[1]]) + best[2]
+        previous = row
+
+
+def filter_paeth(filter_unit, scanline, previous):
+    """
+    Apply the Paeth filter to `scanline`
+    (`previous` is the previous scanline, which can be all zeros)
+    and return the filtered ``bytes``.
+    """
+
+    # The bytes to the left and the bytes above them.
+    left = bytes(filter_unit) + scanline[:-filter_unit]
+    upper_left = bytes(filter_unit) + previous[:-filter_unit]
+    numpy = import_numpy()
+    if numpy is not None:
+        x, a, b, c = (numpy.frombuffer(v, numpy.uint8).astype(numpy.int16)
+                      for v in (scanline, left, previous, upper_left))
+        pa = numpy.abs(b - c)
+        pb = numpy.abs(a - c)
+        pc = numpy.abs(a + b - 2 * c)
+        pr = numpy.where((pa <= pb) & (pa <= pc), a,
+                         numpy.where(pb <= pc, b, c))
+        return (x - pr).astype(numpy.uint8).tobytes()
+
+    out = bytearray(len(scanline))
+    i = 0
+    for x, a, b, c in zip(scanline, left, previous, upper_left):
+        pa = b - c
+        pb = a - c
+        pc = abs(pa + pb)
+        pa = abs(pa)
+        pb = abs(pb)
+        if pa <= pb and pa <= pc:
+            pr = a
+        elif pb <= pc:
+            pr = b
+        else:
+            pr = c
+        out[i] = (x - pr) & 0xff
+        i += 1
+    return bytes(out)
+
+
 def rescale_rows(rows, rescale):
     """
     Take each row in rows (an iterator) and yield
@@ -961,27 +1299,48 @@ def pack_rows(rows, bitdepth):
     # samples per byte
     spb = int(8 / bitdepth)
 
-    def make_byte(block):
-        """Take a block of (2, 4, or 8) values,
-        and pack them into a single byte.
-        """
-
-        res = 0
-        for v in block:
-            res = (res << bitdepth) + v
-        return res
+    # For each position of a sample in its byte, a table that
+    # moves a sample value to its bits in the byte.
+    mask = 2 ** bitdepth - 1
+    tables = [bytes((v & mask) << (bitdepth * (spb - 1 - i))
+                    for v in range(256))
+              for i in range(spb)]
 
     for row in rows:
         a = bytearray(row)
         # Adding padding bytes so we can group into a whole
         # number of spb-tuples.
-        n = float(len(a))
-        extra = math.ceil(n / spb) * spb - n
-        a.extend([0] * int(extra))
-        # Pack into bytes.
-        # Each block is the samples for one byte.
-        blocks = group(a, spb)
-        yield bytearray(make_byte(block) for block in blocks)
+        n = len(a)
+        a.extend(bytes(-n % spb))
+        # Pack into bytes: the samples at each position
+        # of all the bytes are moved to their bits at once,
+        # and the positions are combined as big integers
+        # (their bits do not overlap).
+        packed = 0
+        for i in range(spb):
+            packed |= int.from_bytes(a[i::spb].translate(tables[i]), 'big')
+        yield bytearray(packed.to_bytes(len(a) // spb, 'big'))
+
+
+def unpack_table(bitdepth):
+    """
+    The table, for a `bitdepth` smaller than 8,
+    that gives for every byte value the ``bytes`` of
+    the samples packed into it (most significant bits first).
+    """
+
+    table = _unpack_tables.get(bitdepth)
+    if table is None:
+        # samples per byte
+        spb = 8 // bitdepth
+        mask = 2 ** bitdepth - 1
+        shifts = [bitdepth * i for i in reversed(range(spb))]
+        table = [bytes(mask & (o >> i) for i in shifts) for o in range(256)]
+        _unpack_tables[bitdepth] = table
+    return table
+
+
+_unpack_tables = {}
 
 
 def unpack_rows(rows):
@@ -989,8 +1348,11 @@ def unpack_rows(rows):
     to being a sequence of bytes.
     """
     for row in rows:
-        fmt = '!%dH' % len(row)
-        yield bytearray(struct.pack(fmt, *row))
+        # The samples are written big endian.
+        values = array('H', row)
+        if _NATIVE_LITTLE_ENDIAN:
+            values.byteswap()
+        yield bytearray(values.tobytes())
 
 
 def make_palette_chunks(palette):
@@ -1301,7 +1663,16 @@ class Reader:
     Pure Python PNG decoder in pure Python.
     """
 
-    def __init__(self, _guess=None, filename=None, file=None, bytes=None):
+    # The PNG data when it is all in memory (see __init__);
+    # otherwise it is read from `file`.
+    _buffer = None
+    # The memory mapped file, if any.
+    _mmap = None
+    # True when `file` was opened by the reader (from `filename`).
+    _own_file = False
+
+    def __init__(self, _guess=None, filename=None, file=None, bytes=None,
+                 memory_map=False):
         """
         The constructor expects exactly one keyword argument.
         If you supply a positional argument instead,
@@ -1315,6 +1686,18 @@ class Reader:
         bytes
           ``bytes`` or ``bytearray`` with PNG data.
 
+        When `memory_map` is true, the file given by
+        `filename` is memory mapped instead of being read.
+        The PNG data of a memory mapped file, or of `bytes`,
+        is parsed in place
+        (so it must not change while the reader uses it):
+        the data of the ``IDAT`` chunks is
+        a ``memoryview`` of it (see :meth:`chunk`) that goes
+        to the decompressor without being copied,
+        and no system calls are made for every chunk.
+
+        A reader can be used as a context manager, which calls
+        :meth:`close` at the end of the ``with`` block.
         """
         keywords_supplied = (
             (_guess is not None) +
@@ -1332,6 +1715,8 @@ class Reader:
         # past the 4 bytes that specify the chunk type).
         # See preamble method for how this is used.
         self.atchunk = None
+        # The position in _buffer.
+        self._offset = 0
 
         if _guess is not None:
             if isarray(_guess):
@@ -1342,21 +1727,66 @@ class Reader:
                 file = _guess
 
         if bytes is not None:
-            self.file = io.BytesIO(bytes)
+            self.file = None
+            self._buffer = memoryview(bytes).cast('B')
+        elif filename is not None and memory_map:
+            self.file = None
+            with open(filename, "rb") as f:
+                if os.fstat(f.fileno()).st_size:
+                    self._mmap = mmap.mmap(
+                        f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._buffer = memoryview(self._mmap)
+                else:
+                    # An empty file cannot be mapped.
+                    self._buffer = memoryview(b'')
         elif filename is not None:
             self.file = open(filename, "rb")
+            self._own_file = True
         elif file is not None:
             self.file = file
         else:
             raise ProtocolError("expecting filename, file or bytes array")
 
+    def close(self):
+        """
+        Release the input: close the file opened from `filename`,
+        or unmap the memory mapped file.
+        While a ``memoryview`` of ``IDAT`` data returned by :meth:`chunk`
+        (or a row iterator that is not used up) is still alive,
+        the mapping is released when the last of them is.
+        The reader cannot read any more after this.
+        """
+
+        if self._buffer is not None:
+            self._buffer.release()
+            self._buffer = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass
+            self._mmap = None
+        if self._own_file:
+            self.file.close()
+            self._own_file = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # Reader.close, also for a Decoder,
+        # where close means the end of the data.
+        Reader.close(self)
+
     def chunk(self, lenient=False):
         """
         Read the next PNG chunk from the input file;
         returns a (*type*, *data*) tuple.
         *type* is the chunk's type as a byte string
         (all PNG chunk types are 4 bytes long).
-        *data* is the chunk's data content, as a byte string.
+        *data* is the chunk's data content, as a byte string
+        (for an ``IDAT`` chunk of PNG data in memory,
+        a ``memoryview`` of that data).
 
         If the optional `lenient` argument evaluates to `True`,
         checksum failures will raise warnings rather than exceptions.
@@ -1372,16 +1802,41 @@ class Reader:
         length, type = self.atchunk
         self.atchunk = None
 
-        data = self.file.read(length)
+        data = self._read(length, copy=type != b'IDAT')
         if len(data) != length:
             raise ChunkError(
                 'Chunk %s too short for required %i octets.'
                 % (type, length))
-        checksum = self.file.read(4)
+        checksum = self._read(4)
         if len(checksum) != 4:
             raise ChunkError('Chunk %s too short for checksum.' % type)
         verify = zlib.crc32(type)
         verify = zlib.crc32(data, verify)
+        self._check_crc(type, checksum, verify, lenient)
+        return type, data
+
+    def _read(self, n, copy=True):
+        """
+        Read up to `n` bytes of the input.
+        When the input is in memory, they are returned as
+        a ``memoryview`` of it unless `copy` is true.
+        """
+
+        if self._buffer is None:
+            return self.file.read(n)
+        start = self._offset
+        self._offset = min(start + n, len(self._buffer))
+        data = self._buffer[start:self._offset]
+        if copy:
+            return data.tobytes()
+        return data
+
+    def _check_crc(self, type, checksum, verify, lenient=False):
+        """
+        Compare the `checksum` read from the file (4 bytes)
+        with the CRC `verify` computed over the chunk's type and data.
+        """
+
         verify = struct.pack('!I', verify)
         if checksum != verify:
             (a, ) = struct.unpack('!I', checksum)
@@ -1392,7 +1847,6 @@ class Reader:
                 warnings.warn(message, RuntimeWarning)
             else:
                 raise ChunkError(message)
-        return type, data
 
     def chunks(self):
         """Return an iterator that will yield each chunk as a
@@ -1405,7 +1859,7 @@ class Reader:
             if t == b'IEND':
                 break
 
-    def undo_filter(self, filter_type, scanline, previous):
+    def undo_filter(self, filter_type, scanline, previous, result=None):
         """
         Undo the filter for a scanline.
         `scanline` is a sequence of bytes that
@@ -1420,14 +1874,20 @@ class Reader:
         or the first row in one of the passes in an interlaced image),
         then this argument should be ``None``.
 
-        The scanline will have the effects of filtering removed;
-        the result will be returned as a fresh sequence of bytes.
+        The scanline will have the effects of filtering removed,
+        in place, and is returned.
+        When `result` is given (a ``bytearray`` of the same length),
+        the unfiltered scanline is written to it instead,
+        `scanline` (which can then be a ``memoryview``) is not changed,
+        and `result` is returned.
         """
 
-        # :todo: Would it be better to update scanline in place?
-        result = scanline
+        if result is None:
+            result = scanline
 
         if filter_type == 0:
+            if result is not scanline:
+                result[:] = scanline
             return result
 
         if filter_type not in (1, 2, 3, 4):
@@ -1441,20 +1901,21 @@ class Reader:
         # byte is used instead.
         fu = max(1, self.psize)
 
-        # For the first line of a pass, synthesize a dummy previous
-        # line.  An alternative approach would be to observe that on the
-        # first line 'up' is the same as 'null', 'paeth' is the same
-        # as 'sub', with only 'average' requiring any special case.
+        # For the first line of a pass, 'up' is the same as 'null' and
+        # 'paeth' is the same as 'sub'; only 'average' needs
+        # a dummy previous line.
         if not previous:
-            previous = bytearray([0] * len(scanline))
+            if filter_type == 2:
+                if result is not scanline:
+                    result[:] = scanline
+                return result
+            if filter_type == 4:
+                filter_type = 1
+            previous = bytearray(len(scanline))
 
         # Call appropriate filter algorithm.  Note that 0 has already
         # been dealt with.
-        fn = (None,
-              undo_filter_sub,
-              undo_filter_up,
-              undo_filter_average,
-              undo_filter_paeth)[filter_type]
+        fn = get_undo_filters()[filter_type]
         fn(fu, scanline, previous, result)
         return result
 
@@ -1530,21 +1991,22 @@ class Reader:
         if self.bitdepth == 8:
             return bytearray(bs)
         if self.bitdepth == 16:
-            return array('H',
-                         struct.unpack('!%dH' % (len(bs) // 2), bs))
+            # The samples are big endian.
+            values = array('H')
+            values.frombytes(bs)
+            if _NATIVE_LITTLE_ENDIAN:
+                values.byteswap()
+            return values
 
         assert self.bitdepth < 8
         if width is None:
             width = self.width
-        # Samples per byte
-        spb = 8 // self.bitdepth
-        out = bytearray()
-        mask = 2**self.bitdepth - 1
-        shifts = [self.bitdepth * i
-                  for i in reversed(list(range(spb)))]
-        for o in bs:
-            out.extend([mask & (o >> i) for i in shifts])
-        return out[:width]
+        # Each byte is replaced by the samples packed into it,
+        # see unpack_table.
+        out = bytearray().join(
+            map(unpack_table(self.bitdepth).__getitem__, bs))
+        del out[width:]
+        return out
 
     def _iter_straight_packed(self, byte_blocks):
         """Iterator that undoes the effect of filtering;
@@ -1552,22 +2014,38 @@ class Reader:
         Assumes input is straightlaced.
         `byte_blocks` should be an iterable that yields the raw bytes
         in blocks of arbitrary size.
+
+        The rows are unfiltered into two row buffers in turn,
+        so a row is only valid until the next row is asked for
+        (it is read while that row is unfiltered,
+        and overwritten by the row after);
+        callers that keep rows must copy them.
         """
 
         # length of row, in bytes
         rb = self.row_bytes
+        # The bytes that do not make a complete scanline yet;
+        # reused for all blocks, so it never holds much more than
+        # one block and one scanline.
         a = bytearray()
-        # The previous (reconstructed) scanline.
-        # None indicates first line of image.
-        recon = None
+        # The reconstructed scanline and the previous one,
+        # swapped for every scanline.
+        # The previous scanline of the first line of image is all zeros.
+        recon = bytearray(rb)
+        previous = bytearray(rb)
         for some_bytes in byte_blocks:
             a.extend(some_bytes)
-            while len(a) >= rb + 1:
-                filter_type = a[0]
-                scanline = a[1: rb + 1]
-                del a[: rb + 1]
-                recon = self.undo_filter(filter_type, scanline, recon)
-                yield recon
+            # Unfilter the complete scanlines straight from the buffer,
+            # then drop them from it in one go.
+            start = 0
+            with memoryview(a) as view:
+                while len(a) - start >= rb + 1:
+                    recon, previous = previous, recon
+                    self.undo_filter(a[start], view[start + 1: start + rb + 1],
+                                     previous, recon)
+                    start += rb + 1
+                    yield recon
+            del a[:start]
         if len(a) != 0:
             # :file:format We get here with a file format error:
             # when the available bytes (after decompressing) do not
@@ -1583,7 +2061,7 @@ class Reader:
 
         if self.signature:
             return
-        self.signature = self.file.read(8)
+        self.signature = self._read(8)
         if self.signature != signature:
             raise FormatError("PNG file has invalid signature.")
 
@@ -1618,12 +2096,20 @@ class Reader:
         If there are no more chunks, ``None`` is returned.
         """
 
-        x = self.file.read(8)
+        x = self._read(8)
         if not x:
             return None
         if len(x) != 8:
             raise FormatError(
                 'End of file whilst reading chunk length and type.')
+        return self._unpack_chunk_len_type(x)
+
+    def _unpack_chunk_len_type(self, x):
+        """
+        Check and unpack the 8 bytes `x` that start a chunk;
+        return a (*length*, *type*) pair.
+        """
+
         length, type = struct.unpack('!I4s', x)
         if length > 2 ** 31 - 1:
             raise FormatError('Chunk %s is too large: %d.' % (type, length))
@@ -1774,6 +2260,87 @@ class Reader:
             struct.unpack(fmt, data)
         self.unit_is_meter = bool(unit)
 
+    def _iter_idat(self, lenient=False):
+        """Iterator that yields all the ``IDAT`` chunks as strings."""
+        while True:
+            type, data = self.chunk(lenient=lenient)
+            if type == b'IEND':
+                # http://www.w3.org/TR/PNG/#11IEND
+                break
+            if type != b'IDAT':
+                continue
+            # type == b'IDAT'
+            # http://www.w3.org/TR/PNG/#11IDAT
+            if self.colormap and not self.plte:
+                warnings.warn("PLTE chunk is required before IDAT chunk")
+            yield data
+
+    def _iter_packed_rows(self, lenient=False):
+        """
+        Iterator that yields the unfiltered scanlines of
+        a straightlaced image as packed bytes.
+        The preamble must have been read already.
+        """
+
+        return self._iter_straight_packed(self._decompress(
+            self._iter_idat(lenient=lenient)))
+
+    def _decompress(self, data_blocks):
+        """
+        :func:`decompress` the ``IDAT`` data in steps of
+        a few scanlines, and no further than the size of the image.
+        The preamble must have been read already.
+        """
+
+        return decompress(data_blocks, self._decompress_step(),
+                          self._raw_size())
+
+    def _decompress_step(self):
+        """
+        The number of bytes to decompress at a time:
+        a few scanlines, but not so little that the calls dominate.
+        """
+
+        return max(4 * (self.row_bytes + 1), 2 ** 14)
+
+    def _raw_size(self):
+        """
+        The size in bytes of the decompressed image data
+        (filter type bytes included), as given by the ``IHDR`` chunk.
+        """
+
+        if not self.interlace:
+            return self.height * (self.row_bytes + 1)
+        size = 0
+        for lines in adam7_generate(self.width, self.height):
+            for x, y, xstep in lines:
+                ppr = int(math.ceil((self.width - x) / float(xstep)))
+                size += int(math.ceil(self.psize * ppr)) + 1
+        return size
+
+    def _info(self):
+        """
+        The *info* dictionary describing the source image,
+        as returned by :meth:`read`.
+        The preamble must have been read already.
+        """
+
+        info = dict()
+        for attr in 'greyscale alpha planes bitdepth interlace'.split():
+            info[attr] = getattr(self, attr)
+        info['size'] = (self.width, self.height)
+        for attr in 'gamma transparent background'.split():
+            a = getattr(self, attr, None)
+            if a is not None:
+                info[attr] = a
+        if getattr(self, 'x_pixels_per_unit', None):
+            info['physical'] = Resolution(self.x_pixels_per_unit,
+                                          self.y_pixels_per_unit,
+                                          self.unit_is_meter)
+        if self.plte:
+            info['palette'] = self.palette()
+        return info
+
     def read(self, lenient=False):
         """
         Read the PNG file and decode it.
@@ -1788,23 +2355,8 @@ class Reader:
         checksum failures will raise warnings rather than exceptions.
         """
 
-        def iteridat():
-            """Iterator that yields all the ``IDAT`` chunks as strings."""
-            while True:
-                type, data = self.chunk(lenient=lenient)
-                if type == b'IEND':
-                    # http://www.w3.org/TR/PNG/#11IEND
-                    break
-                if type != b'IDAT':
-                    continue
-                # type == b'IDAT'
-                # http://www.w3.org/TR/PNG/#11IDAT
-                if self.colormap and not self.plte:
-                    warnings.warn("PLTE chunk is required before IDAT chunk")
-                yield data
-
         self.preamble(lenient=lenient)
-        raw = decompress(iteridat())
+        raw = self._decompress(self._iter_idat(lenient=lenient))
 
         if self.interlace:
             def rows_from_interlace():
@@ -1823,21 +2375,7 @@ class Reader:
             rows = rows_from_interlace()
         else:
             rows = self._iter_bytes_to_values(self._iter_straight_packed(raw))
-        info = dict()
-        for attr in 'greyscale alpha planes bitdepth interlace'.split():
-            info[attr] = getattr(self, attr)
-        info['size'] = (self.width, self.height)
-        for attr in 'gamma transparent background'.split():
-            a = getattr(self, attr, None)
-            if a is not None:
-                info[attr] = a
-        if getattr(self, 'x_pixels_per_unit', None):
-            info['physical'] = Resolution(self.x_pixels_per_unit,
-                                          self.y_pixels_per_unit,
-                                          self.unit_is_meter)
-        if self.plte:
-            info['palette'] = self.palette()
-        return self.width, self.height, rows, info
+        return self.width, self.height, rows, self._info()
 
     def read_flat(self):
         """
@@ -2006,10 +2544,26 @@ class Reader:
         targetmaxval = 2**targetbitdepth - 1
         factor = float(targetmaxval) / float(maxval)
         info['bitdepth'] = targetbitdepth
+        typecode = 'BH'[targetbitdepth > 8]
 
+        # Each value x becomes int(round(x * factor)).
+        # numpy.rint rounds halves to even as well,
+        # so both ways give exactly the same values.
         def iterscale():
+            numpy = import_numpy()
+            if numpy is not None:
+                dtype = (numpy.uint8, numpy.uint16)[targetbitdepth > 8]
+                for row in pixels:
+                    scaled = numpy.rint(
+                        numpy.asarray(row, numpy.float64) * factor)
+                    values = array(typecode)
+                    values.frombytes(scaled.astype(dtype).tobytes())
+                    yield values
+                return
+            # A table of the scaled value of every value.
+            table = [int(round(x * factor)) for x in range(maxval + 1)]
             for row in pixels:
-                yield [int(round(x * factor)) for x in row]
+                yield array(typecode, map(table.__getitem__, row))
         if maxval == targetmaxval:
             return width, height, pixels, info
         else:
@@ -2050,6 +2604,73 @@ class Reader:
 
         return self._as_rescale(self.asRGBA, 8)
 
+    def asLuma8(self):
+        """
+        Return the image data as a single plane of
+        8-bit greyscale (luma) values.
+
+        Colour pixels are converted using the weights
+        0.299 R + 0.587 G + 0.114 B,
+        evaluated in 16-bit fixed-point integer arithmetic.
+        The fixed-point weights are not exact, so the result is
+        approximate: it can differ by 1 from a rounded floating
+        point conversion when the weighted sum is within 0.001 of
+        a half (9443 of the 2**24 colours).
+        Greyscale images are passed through;
+        an alpha channel is ignored.
+
+        For straightlaced 8-bit RGB, RGBA and greyscale images
+        (the common case) the luma values are computed directly from
+        the unfiltered scanlines, so the R, G, B values of
+        the whole image are never held in memory;
+        other images are converted via :meth:`asDirect` first.
+
+        This function returns a 4-tuple:
+        (*width*, *height*, *rows*, *info*).
+        *rows* is a sequence of rows,
+        each row being a ``bytearray`` of *width* luma values.
+        *info* describes the returned pixels:
+        ``info['greyscale']`` will be ``True``,
+        ``info['planes']`` will be 1 and
+        ``info['bitdepth']`` will be 8.
+        """
+
+        self.preamble()
+
+        direct = (not self.interlace and self.bitdepth == 8 and
+                  not self.colormap and not self.trns and not self.sbit)
+        if direct:
+            # Unfiltered 8-bit scanlines already are the pixel values.
+            width, height = self.width, self.height
+            pixels = self._iter_packed_rows()
+            info = self._info()
+        else:
+            width, height, pixels, info = self._as_rescale(self.asDirect, 8)
+
+        planes = info['planes']
+        greyscale = info['greyscale']
+        for attr in 'alpha transparent background palette colormap'.split():
+            info.pop(attr, None)
+        info.update(greyscale=True, alpha=False, planes=1, bitdepth=8)
+
+        # Per-channel weights scaled by 2**16 (they sum to 2**16);
+        # the rounding offset is folded into the red table.
+        weight_r = [(19595 * v) + 32768 for v in range(256)]
+        weight_g = [38470 * v for v in range(256)]
+        weight_b = [7471 * v for v in range(256)]
+
+        def iterluma():
+            for row in pixels:
+                if greyscale:
+                    yield bytearray(row[0::planes])
+                    continue
+                yield bytearray(
+                    (weight_r[r] + weight_g[g] + weight_b[b]) >> 16
+                    for r, g, b in zip(row[0::planes],
+                                       row[1::planes],
+                                       row[2::planes]))
+        return width, height, iterluma(), info
+
     def asRGB(self):
         """
         Return image as RGB pixels.
@@ -2146,23 +2767,382 @@ class Reader:
         return width, height, convert(), info
 
 
-def decompress(data_blocks):
+class Decoder(Reader):
+    """
+    Push-style PNG decoder.
+
+    Where :class:`Reader` pulls the PNG data from a file,
+    a :class:`Decoder` is given the data as it arrives,
+    in pieces of any size, by calling :meth:`feed`.
+    Chunks are parsed as soon as they are complete;
+    ``IDAT`` data is decompressed and unfiltered as it arrives,
+    and :meth:`feed` returns the rows that were completed by
+    the data just fed, so that processing of the top of an image
+    can start while the bottom of it is still being received.
+    Rows are sequences of values, as returned by :meth:`Reader.read`.
+
+    Interlaced images are stored in passes across the whole image,
+    so their rows are only returned once all the
+    ``IDAT`` data has been received.
+
+    The metadata attributes (`width`, `height`, `bitdepth` and so on)
+    are available once the ``IHDR`` chunk has been fed;
+    all of the metadata in the chunks before the image data
+    is available once `rows_started` is true.
+
+    When `keep_rows` is true, the rows are kept,
+    and once all the data has been fed (see :meth:`close`)
+    :meth:`read`, :meth:`asDirect` and the other
+    conversion methods of :class:`Reader` can be used on them.
+    Without `keep_rows`, the rows returned by :meth:`feed` can be
+    converted as they arrive, see :meth:`convert_rows`.
+
+    If the optional `lenient` argument evaluates to `True`,
+    checksum failures will raise warnings rather than exceptions.
+    """
+
+    def __init__(self, keep_rows=False, lenient=False):
+        # There is no file; see feed.
+        self.file = None
+        self.signature = None
+        self.transparent = None
+        self.atchunk = None
+        self.keep_rows = keep_rows
+        self.lenient = lenient
+        self.rows = []
+        # The number of rows returned so far.
+        self.row_count = 0
+        # True once the first IDAT chunk has been reached.
+        self.rows_started = False
+        # True once the IEND chunk has been fed.
+        self.done = False
+        # Bytes fed but not parsed yet.
+        self._pending = bytearray()
+        # The data of the current (non IDAT) chunk,
+        # how many of its bytes are still to come,
+        # and the CRC of the bytes seen so far.
+        self._chunk_data = bytearray()
+        self._chunk_remaining = 0
+        self._chunk_crc = 0
+        self._decompressor = None
+        # Decompressed bytes that do not make a complete scanline yet
+        # (or all the decompressed bytes of an interlaced image).
+        self._scanlines = bytearray()
+        # The previous (reconstructed) scanline.
+        self._recon = None
+        self._previous = None
+        # The rows being converted by convert_rows.
+        self._converting = None
+
+    def feed(self, data):
+        """
+        Add the next piece of PNG data;
+        return a list of the rows that it completed
+        (which can be empty).
+        """
+
+        self._pending.extend(data)
+        pending = self._pending
+        rows = []
+        while True:
+            if self.signature is None:
+                if len(pending) < 8:
+                    break
+                self.signature = bytes(pending[:8])
+                del pending[:8]
+                if self.signature != signature:
+                    raise FormatError("PNG file has invalid signature.")
+                continue
+            if self.done:
+                # Anything after IEND is ignored, like Reader does.
+                del pending[:]
+                break
+            if self.atchunk is None:
+                if len(pending) < 8:
+                    break
+                self.atchunk = self._unpack_chunk_len_type(bytes(pending[:8]))
+                del pending[:8]
+                length, type = self.atchunk
+                self._chunk_remaining = length
+                self._chunk_crc = zlib.crc32(type)
+                self._chunk_data = bytearray()
+                if type == b'IDAT':
+                    self._start_rows()
+                continue
+            length, type = self.atchunk
+            if self._chunk_remaining:
+                if not pending:
+                    break
+                piece = bytes(pending[:self._chunk_remaining])
+                del pending[:len(piece)]
+                self._chunk_remaining -= len(piece)
+                self._chunk_crc = zlib.crc32(piece, self._chunk_crc)
+                if type == b'IDAT':
+                    # The rows are returned before the chunk's
+                    # checksum has been checked.
+                    rows.extend(self._inflate(piece))
+                else:
+                    self._chunk_data.extend(piece)
+                continue
+            if len(pending) < 4:
+                break
+            checksum = bytes(pending[:4])
+            del pending[:4]
+            self._check_crc(type, checksum, self._chunk_crc, self.lenient)
+            self.atchunk = None
+            if type == b'IEND':
+                # http://www.w3.org/TR/PNG/#11IEND
+                rows.extend(self._finish_rows())
+                self.done = True
+            elif type != b'IDAT':
+                method = '_process_' + type.decode('ascii')
+                m = getattr(self, method, None)
+                if m:
+                    m(bytes(self._chunk_data))
+        self.row_count += len(rows)
+        if self.keep_rows:
+            self.rows.extend(rows)
+        return rows
+
+    def close(self):
+        """
+        Check that the complete PNG data has been fed
+        (up to and including the ``IEND`` chunk).
+        """
+
+        if not self.done:
+            raise FormatError(
+                'End of data before the IEND chunk.')
+
+    def _start_rows(self):
+        """Called when the first IDAT chunk starts."""
+
+        if self.rows_started:
+            return
+        if not hasattr(self, 'width'):
+            raise FormatError('IHDR chunk is required before IDAT chunk.')
+        if self.colormap and not self.plte:
+            warnings.warn("PLTE chunk is required before IDAT chunk")
+        self.rows_started = True
+        self._decompressor = zlib.decompressobj()
+        self._decompressed_size = 0
+        self._step = self._decompress_step()
+        self._limit = self._raw_size()
+
+    def _inflate(self, piece):
+        """
+        Decompress a piece of ``IDAT`` data, a few scanlines at a time
+        (see :func:`decompress`), and return the list of rows
+        completed by it.
+        """
+
+        rows = []
+        for piece in _iter_input_pieces(piece, self._step):
+            while piece:
+                out = inflate(self._decompressor, piece, self._step)
+                piece = self._decompressor.unconsumed_tail
+                self._decompressed_size += len(out)
+                check_decompressed_size(self._decompressed_size,
+                                        self._limit)
+                rows.extend(self._unfilter_rows(out))
+        return rows
+
+    def _unfilter_rows(self, some_bytes):
+        """
+        Add decompressed bytes and return the list of
+        rows of values completed by them
+        (see :meth:`Reader._iter_straight_packed`).
+        """
+
+        a = self._scanlines
+        a.extend(some_bytes)
+        if self.interlace:
+            return []
+        rows = []
+        # length of row, in bytes
+        rb = self.row_bytes
+        if self._recon is None:
+            self._recon = bytearray(rb)
+            self._previous = bytearray(rb)
+        start = 0
+        with memoryview(a) as view:
+            while len(a) - start >= rb + 1:
+                self._recon, self._previous = self._previous, self._recon
+                self.undo_filter(a[start], view[start + 1: start + rb + 1],
+                                 self._previous, self._recon)
+                start += rb + 1
+                rows.append(self._bytes_to_values(self._recon))
+        del a[:start]
+        return rows
+
+    def _finish_rows(self):
+        """
+        Called at the IEND chunk;
+        returns the last rows (all rows of an interlaced image).
+        """
+
+        if not self.rows_started:
+            raise FormatError('This PNG file has no IDAT chunks.')
+        out = self._decompressor.flush()
+        self._decompressed_size += len(out)
+        check_decompressed_size(self._decompressed_size, self._limit)
+        rows = self._unfilter_rows(out)
+        if self.interlace:
+            arraycode = 'BH'[self.bitdepth > 8]
+            values = self._deinterlace(self._scanlines)
+            vpr = self.width * self.planes
+            rows = [array(arraycode, values[i:i+vpr])
+                    for i in range(0, len(values), vpr)]
+            self._scanlines = bytearray()
+        if len(self._scanlines) != 0:
+            # :file:format We get here with a file format error:
+            # when the available bytes (after decompressing) do not
+            # pack into exact rows.
+            raise FormatError('Wrong size for decompressed IDAT chunk.')
+        return rows
+
+    def convert_rows(self, method, rows):
+        """
+        Convert `rows`, as returned by :meth:`feed`,
+        with a conversion method of :class:`Reader`,
+        for example ``Reader.asDirect`` or ``Reader.asLuma8``.
+        Returns (*rows*, *info*): the list of converted rows,
+        and the *info* dictionary describing them.
+
+        Every row is converted on its own,
+        so the rows of each call to :meth:`feed` can be converted
+        as soon as they are returned,
+        without keeping the rows of the whole image.
+        :exc:`ProtocolError` is raised
+        when no rows have been decoded yet.
+        """
+
+        self._converting = rows
+        try:
+            width, height, converted, info = method(self)
+            return list(converted), info
+        finally:
+            self._converting = None
+
+    def preamble(self, lenient=False):
+        """
+        Check that all the data has been fed and the rows kept,
+        so the methods of :class:`Reader` can work on them.
+        """
+
+        if self._converting is not None:
+            # See convert_rows; the metadata chunks have been fed.
+            if not self.rows_started:
+                raise ProtocolError('No rows have been decoded yet.')
+            return
+        self.close()
+        if not self.keep_rows:
+            raise ProtocolError(
+                'The rows are only kept with Decoder(keep_rows=True).')
+
+    def read(self, lenient=False):
+        """
+        Returns (`width`, `height`, `rows`, `info`)
+        for the rows kept, see :meth:`Reader.read`.
+        """
+
+        self.preamble()
+        return self.width, self.height, iter(self._rows()), self._info()
+
+    def _iter_packed_rows(self, lenient=False):
+        # Only used for straightlaced 8-bit images,
+        # where the rows of values are the packed bytes.
+        assert self.bitdepth == 8 and not self.interlace
+        return iter(self._rows())
+
+    def _rows(self):
+        """The rows being converted (see :meth:`convert_rows`),
+        or else the rows kept."""
+
+        if self._converting is not None:
+            return self._converting
+        return self.rows
+
+
+def decompress(data_blocks, max_length=0, limit=None):
     """
     `data_blocks` should be an iterable that
     yields the compressed data (from the ``IDAT`` chunks).
     This yields decompressed byte strings.
+
+    When `max_length` is not 0, none of the byte strings is longer
+    than `max_length` bytes, however large the ``IDAT`` chunks are
+    and however well they compress; the compressed data that has
+    not been decompressed yet is kept by the decompressor.
+
+    When `limit` is given, a :class:`FormatError` is raised as soon as
+    the decompressed data gets longer than `limit` bytes
+    (a PNG file that inflates to far more data than its size in
+    the ``IHDR`` chunk needs is broken, or a decompression bomb).
+    Corrupt compressed data raises a :class:`FormatError` too.
     """
 
-    # Currently, with no max_length parameter to decompress,
-    # this routine will do one yield per IDAT chunk: Not very
-    # incremental.
     d = zlib.decompressobj()
-    # Each IDAT chunk is passed to the decompressor, then any
+    total = 0
+    # Each IDAT chunk is passed to the decompressor, at most
+    # max_length bytes are taken out at a time, then any
     # remaining state is decompressed out.
     for data in data_blocks:
-        # :todo: add a max_length argument here to limit output size.
-        yield bytearray(d.decompress(data))
-    yield bytearray(d.flush())
+        for piece in _iter_input_pieces(data, max_length):
+            while piece:
+                out = inflate(d, piece, max_length)
+                piece = d.unconsumed_tail
+                total += len(out)
+                check_decompressed_size(total, limit)
+                if out:
+                    yield out
+    try:
+        out = d.flush()
+    except zlib.error as e:
+        raise FormatError('Corrupt IDAT data: %s.' % e) from e
+    check_decompressed_size(total + len(out), limit)
+    yield out
+
+
+def inflate(decompressor, data, max_length):
+    """
+    Decompress `data` with `decompressor`, a ``zlib.decompressobj``,
+    into at most `max_length` bytes (0 for no limit);
+    raise a :class:`FormatError`, rather than a ``zlib.error``,
+    when the data is corrupt.
+    """
+
+    try:
+        return decompressor.decompress(data, max_length)
+    except zlib.error as e:
+        raise FormatError('Corrupt IDAT data: %s.' % e) from e
+
+
+def _iter_input_pieces(data, max_length):
+    """
+    Split `data` into ``memoryview`` pieces of `max_length` bytes
+    (all of it when `max_length` is 0) without copying it.
+    Passing a large block to a decompressor with a `max_length`
+    would copy what is left of it (``unconsumed_tail``)
+    at every step.
+    """
+
+    if not max_length or len(data) <= max_length:
+        return [data]
+    view = memoryview(data)
+    return (view[i:i + max_length] for i in range(0, len(view), max_length))
+
+
+def check_decompressed_size(size, limit):
+    """
+    Raise a :class:`FormatError` when the `size` of the
+    decompressed data is larger than `limit` (unless that is ``None``).
+    """
+
+    if limit is not None and size > limit:
+        raise FormatError(
+            'Decompressed IDAT data is larger than the image (%d bytes).'
+            % limit)
 
 
 def check_bitdepth_colortype(bitdepth, colortype):
@@ -2205,66 +3185,153 @@ def is_natural(x):
 def undo_filter_sub(filter_unit, scanline, previous, result):
     """Undo sub filter."""
 
-    ai = 0
-    # Loops starts at index fu.  Observe that the initial part
-    # of the result is already filled in correctly with
-    # scanline.
-    for i in range(filter_unit, len(result)):
-        x = scanline[i]
-        a = result[ai]
-        result[i] = (x + a) & 0xff
-        ai += 1
+    # Every byte is the running sum (modulo 256) of the bytes
+    # of its channel, that is of every filter_unit-th byte.
+    # The sums are accumulated into 64-bit integers,
+    # of which only the low byte is kept.
+    low = _LOW_BYTE
+    for i in range(filter_unit):
+        sums = array('Q', itertools.accumulate(scanline[i::filter_unit]))
+        result[i::filter_unit] = sums.tobytes()[low::sums.itemsize]
 
 
 def undo_filter_up(filter_unit, scanline, previous, result):
     """Undo up filter."""
 
-    for i in range(len(result)):
-        x = scanline[i]
-        b = previous[i]
-        result[i] = (x + b) & 0xff
+    # The row is added as one integer, with the top bit of every
+    # byte added separately so that no carry crosses a byte.
+    n = len(result)
+    x = int.from_bytes(scanline, 'little')
+    b = int.from_bytes(previous, 'little')
+    high = int.from_bytes(b'\x80' * n, 'little')
+    rest = int.from_bytes(b'\x7f' * n, 'little')
+    result[:] = (((x & rest) + (b & rest)) ^ ((x ^ b) & high)).to_bytes(
+        n, 'little')
 
 
 def undo_filter_average(filter_unit, scanline, previous, result):
-    """Undo up filter."""
+    """Undo average filter."""
 
-    ai = -filter_unit
-    for i in range(len(result)):
-        x = scanline[i]
-        if ai < 0:
-            a = 0
-        else:
-            a = result[ai]
-        b = previous[i]
-        result[i] = (x + ((a + b) >> 1)) & 0xff
-        ai += 1
+    # Each channel is done in turn, so that the byte to the left
+    # is the value computed in the previous step.
+    for i in range(filter_unit):
+        out = []
+        append = out.append
+        a = 0
+        for x, b in zip(scanline[i::filter_unit], previous[i::filter_unit]):
+            a = (x + ((a + b) >> 1)) & 0xff
+            append(a)
+        result[i::filter_unit] = bytes(out)
 
 
 def undo_filter_paeth(filter_unit, scanline, previous, result):
     """Undo Paeth filter."""
 
-    # Also used for ci.
-    ai = -filter_unit
-    for i in range(len(result)):
-        x = scanline[i]
-        if ai < 0:
-            a = c = 0
-        else:
-            a = result[ai]
-            c = previous[ai]
-        b = previous[i]
-        p = a + b - c
-        pa = abs(p - a)
-        pb = abs(p - b)
-        pc = abs(p - c)
-        if pa <= pb and pa <= pc:
-            pr = a
-        elif pb <= pc:
-            pr = b
+    # Each channel is done in turn, see undo_filter_average;
+    # c is the byte of the previous row to the left.
+    for i in range(filter_unit):
+        out = []
+        append = out.append
+        a = c = 0
+        for x, b in zip(scanline[i::filter_unit], previous[i::filter_unit]):
+            # p = a + b - c, and pa, pb, pc its distances to a, b, c.
+            pa = b - c
+            pb = a - c
+            pc = abs(pa + pb)
+            pa = abs(pa)
+            pb = abs(pb)
+            if pa <= pb and pa <= pc:
+                pr = a
+            elif pb <= pc:
+                pr = b
+            else:
+                pr = c
+            a = (x + pr) & 0xff
+            append(a)
+            c = b
+        result[i::filter_unit] = bytes(out)
+
+
+def numpy_undo_filter_sub(filter_unit, scanline, previous, result):
+    """Undo sub filter, using numpy."""
+
+    numpy = import_numpy()
+    if len(result) % filter_unit:
+        return undo_filter_sub(filter_unit, scanline, previous, result)
+    # The uint8 running sums of every channel wrap around at 256.
+    x = numpy.frombuffer(scanline, numpy.uint8).reshape(-1, filter_unit)
+    result[:] = numpy.cumsum(x, axis=0, dtype=numpy.uint8).tobytes()
+
+
+def numpy_undo_filter_up(filter_unit, scanline, previous, result):
+    """Undo up filter, using numpy."""
+
+    numpy = import_numpy()
+    result[:] = (numpy.frombuffer(scanline, numpy.uint8) +
+                 numpy.frombuffer(previous, numpy.uint8)).tobytes()
+
+
+# The byte of a native 64-bit integer that holds its lowest 8 bits.
+_LOW_BYTE = 0 if sys.byteorder == 'little' else 7
+
+# Native arrays need to be byteswapped to hold big endian PNG samples.
+_NATIVE_LITTLE_ENDIAN = sys.byteorder == 'little'
+
+# The result of import_numpy: the module, None when it is not
+# available, or False when that has not been looked at yet.
+_numpy = False
+
+
+def import_numpy():
+    """
+    Return the ``numpy`` module, or ``None`` when it is not installed.
+    It is only used to speed up some conversions, so it is imported
+    when one of them first runs rather than with this module
+    (importing numpy takes several times as long).
+    """
+
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+
+# The result of get_undo_filters, once it has been called.
+_undo_filters = None
+
+
+def get_undo_filters():
+    """
+    The functions that undo filter types 1 to 4 (the index is the
+    filter type), used by :meth:`Reader.undo_filter`;
+    chosen on the first call.
+    Only the sub and up filters have numpy versions,
+    which are used when numpy is available.
+    The average and Paeth filters are always
+    the pure Python functions:
+    each byte depends on the byte to the left
+    that has just been unfiltered, which does not vectorise.
+    """
+
+    global _undo_filters
+    if _undo_filters is None:
+        if import_numpy() is not None:
+            _undo_filters = (None,
+                             numpy_undo_filter_sub,
+                             numpy_undo_filter_up,
+                             undo_filter_average,
+                             undo_filter_paeth)
         else:
-            pr = c
-        result[i] = (x + pr) & 0xff
-        ai += 1
+            _undo_filters = (None,
+                             undo_filter_sub,
+                             undo_filter_up,
+                             undo_filter_average,
+                             undo_filter_paeth)
+    return _undo_filters
 
 
 def convert_la_to_rgba(row, result):
@@ -0,0 +1,91 @@
+import asyncio
+import io
+import os
+import random
+import sys
+import unittest
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+import QRCodeDetection
+import QRCodeDetectionAsync
+import imageIO.png
+
+# Uploads sent to QRCodeDetectionAsync in chunks of random sizes: the greyscale pixel array decoded while the chunks
+# arrive must be the one QRCodeDetection computes from the whole file.
+
+IMAGE = os.path.join(REPOSITORY, "images", "covid19QRCode", "challenging", "connecticut.png")
+
+
+# an async iterator over data, in chunks of 1 to max_chunk_size bytes
+async def iterRandomChunks(data, seed, max_chunk_size = 4096):
+    generator = random.Random(seed)
+    position = 0
+    while position < len(data):
+        size = generator.randint(1, max_chunk_size)
+        yield data[position:position + size]
+        position += size
+
+
+# small png files of the kinds the bundled images do not cover
+def writeTestImages():
+    generator = random.Random(0)
+    images = {}
+    for name, width, height, options in [("rgb16", 7, 5, dict(greyscale=False, bitdepth=16)),
+                                         ("grey2", 9, 4, dict(greyscale=True, bitdepth=2)),
+                                         ("interlaced", 11, 9, dict(greyscale=False, interlace=True)),
+                                         ("palette", 6, 6, dict(palette=[(10, 200, 30, 0), (0, 0, 0), (255, 0, 0)]))]:
+        planes = 1 if options.get("greyscale", True) else 3
+        maxval = len(options["palette"]) - 1 if "palette" in options else 2 ** options.get("bitdepth", 8) - 1
+        rows = [[generator.randint(0, maxval) for x in range(width * planes)] for y in range(height)]
+        file = io.BytesIO()
+        imageIO.png.Writer(width, height, **options).write(file, rows)
+        images[name] = file.getvalue()
+    return images
+
+
+def readGreyscale(data, exact):
+    return asyncio.run(QRCodeDetectionAsync.readGreyscaleImageFromStream(iterRandomChunks(data, len(data)), exact))
+
+
+class AsyncDecodingTest(unittest.TestCase):
+    def assertSameGreyscale(self, data):
+        (image_width, image_height, luma) = QRCodeDetection.readGreyscaleImageToPixelArray(data)
+        (image_width, image_height, px_array_r, px_array_g, px_array_b) = QRCodeDetection.readRGBImageToSeparatePixelArrays(data)
+        greyscale = QRCodeDetection.computeRGBToSingleGreyscale(px_array_r, px_array_g, px_array_b, image_width, image_height)
+        for exact, expected in ((False, luma), (True, greyscale)):
+            (width, height, pixel_array) = readGreyscale(data, exact)
+            self.assertEqual((width, height), (image_width, image_height))
+            self.assertEqual(pixel_array.typecode, expected.typecode)
+            self.assertEqual(pixel_array.data, expected.data)
+
+    def test_greyscale(self):
+        with open(IMAGE, "rb") as file:
+            self.assertSameGreyscale(file.read())
+        for name, data in writeTestImages().items():
+            with self.subTest(image=name):
+                self.assertSameGreyscale(data)
+
+    def test_detect(self):
+        with open(IMAGE, "rb") as file:
+            data = file.read()
+        detection = asyncio.run(QRCodeDetectionAsync.detect(iterRandomChunks(data, 1)))
+        self.assertEqual(tuple(detection["bounding_box"]), (298, 93, 418, 238))
+        self.assertGreaterEqual(detection["timings"]["total"], detection["timings"]["read"])
+
+    def test_truncated_upload(self):
+        with open(IMAGE, "rb") as file:
+            data = file.read()
+        with self.assertRaises(imageIO.png.FormatError):
+            readGreyscale(data[:len(data) // 2], False)
+
+    def test_too_large_upload(self):
+        with open(IMAGE, "rb") as file:
+            data = file.read()
+        with self.assertRaises(ValueError):
+            asyncio.run(QRCodeDetectionAsync.readGreyscaleImageFromStream(iterRandomChunks(data, 1), max_size=1000))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import glob
+import importlib.util
+import os
+import sys
+import unittest
+import unittest.mock
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+import QRCodeDetection
+
+# Checks the backends of the QR code detection pipeline against the pure python backend on the bundled images:
+# the masks must be identical bit for bit, and so the component statistics and bounding boxes
+# (see QRCodeDetection.computeBackendResults).
+
+IMAGES = sorted(glob.glob(os.path.join(REPOSITORY, "images", "covid19QRCode", "**", "*.png"), recursive=True))
+
+# the bounding boxes (min_x, min_y, max_x, max_y) found by the original pure python pipeline
+BOUNDING_BOXES = {
+    "poster1small.png": (135, 170, 570, 605),
+    "bch.png": (333, 128, 470, 265),
+    "bloomfield.png": (313, 180, 484, 368),
+    "connecticut.png": (298, 93, 418, 238),
+    "playground.png": (2, 2, 425, 394),
+    "poster1smallrotated.png": (232, 175, 705, 649),
+    "shanghai.png": (266, 227, 611, 571),
+}
+
+
+class BackendTest(unittest.TestCase):
+    # the results of the python backend with exact = True, by file name, shared by all tests
+    references = {}
+
+    def reference(self, filename):
+        if filename not in self.references:
+            self.references[filename] = QRCodeDetection.computeBackendResults(filename, "python", True)
+        return self.references[filename]
+
+    def assertIdenticalToPython(self, backend, workers = None):
+        for filename in IMAGES:
+            with self.subTest(image=os.path.basename(filename)):
+                reference = self.reference(filename)
+                differences = QRCodeDetection.findBackendDifferences(filename, backend, workers, reference)
+                self.assertEqual(differences, [])
+
+    def test_images_found(self):
+        self.assertEqual(sorted(os.path.basename(filename) for filename in IMAGES), sorted(BOUNDING_BOXES))
+
+    def test_python_bounding_boxes(self):
+        for filename in IMAGES:
+            expected = BOUNDING_BOXES[os.path.basename(filename)]
+            with self.subTest(image=os.path.basename(filename)):
+                self.assertEqual(tuple(self.reference(filename)["bounding_box"]), expected)
+                # read with the greyscale (luma) reader, and with exact = True from the r, g and b pixel arrays
+                for exact in (False, True):
+                    detection = QRCodeDetection.detectQRCode(filename, exact=exact)
+                    self.assertEqual(tuple(detection["bounding_box"]), expected)
+
+    def test_luma_reader(self):
+        # the fixed-point greyscale conversion differs from the floating point one by at most 1
+        for filename in IMAGES:
+            with self.subTest(image=os.path.basename(filename)):
+                (image_width, image_height, luma) = QRCodeDetection.readGreyscaleImageToPixelArray(filename)
+                (image_width, image_height, px_array_r, px_array_g, px_array_b) = QRCodeDetection.readRGBImageToSeparatePixelArrays(filename)
+                greyscale = QRCodeDetection.computeRGBToSingleGreyscale(px_array_r, px_array_g, px_array_b, image_width, image_height)
+                differences = [abs(a - b) for a, b in zip(luma.data, greyscale.data)]
+                self.assertEqual(len(differences), image_width * image_height)
+                self.assertLessEqual(max(differences), 1)
+
+    def test_region_statistics(self):
+        filename = os.path.join(REPOSITORY, "images", "covid19QRCode", "poster1small.png")
+        (image_width, image_height, px_array_r, px_array_g, px_array_b) = QRCodeDetection.readRGBImageToSeparatePixelArrays(filename)
+        detection = QRCodeDetection.detectQRCodeInPixelArrays(px_array_r, px_array_g, px_array_b, image_width, image_height,
+                                                              region_statistics=True)
+        self.assertEqual(tuple(detection["bounding_box"]), BOUNDING_BOXES["poster1small.png"])
+        self.assertEqual(sorted(detection["region_statistics"]), sorted(detection["component_sizes"]))
+
+        # the mean and variance of the largest component, computed directly from the greyscale pixels
+        greyscale = QRCodeDetection.computeRGBToSingleGreyscale(px_array_r, px_array_g, px_array_b, image_width, image_height)
+        (min_x, min_y, max_x, max_y) = detection["bounding_box"]
+        values = [v for y in range(min_y, max_y + 1) for v in greyscale.getRow(y)[min_x:max_x + 1]]
+        mean = sum(values) / len(values)
+        variance = sum((v - mean) ** 2 for v in values) / len(values)
+        (region_mean, region_variance) = detection["region_statistics"][detection["largest_component"]["label"]]
+        self.assertAlmostEqual(region_mean, mean)
+        self.assertAlmostEqual(region_variance, variance, places=6)
+
+    @unittest.skipUnless(importlib.util.find_spec("numpy"), "numpy is not installed")
+    def test_numpy(self):
+        self.assertIdenticalToPython("numpy")
+
+    def test_streaming(self):
+        self.assertIdenticalToPython("streaming")
+
+    def test_parallel_detection(self):
+        import QRCodeDetectionParallel
+
+        filename = os.path.join(REPOSITORY, "images", "covid19QRCode", "challenging", "connecticut.png")
+        reference = QRCodeDetection.detectQRCode(filename)
+        executor = QRCodeDetectionParallel.getSharedExecutor()
+        # the detections run on the shared process pool, and start no process pool of their own
+        with unittest.mock.patch("concurrent.futures.ProcessPoolExecutor", side_effect=AssertionError("new process pool")):
+            for i in range(2):
+                detection = QRCodeDetection.detectQRCode(filename, "parallel")
+                for name in ("bounding_box", "components", "component_sizes", "largest_component"):
+                    self.assertEqual(detection[name], reference[name])
+        self.assertIs(QRCodeDetectionParallel.getSharedExecutor(), executor)
+
+    def test_parallel(self):
+        # two tiles, so the components are merged across a tile border
+        self.assertIdenticalToPython("parallel", workers=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
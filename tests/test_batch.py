@@ -0,0 +1,40 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+import QRCodeDetectionBatch
+
+# Resuming a batch run from its JSON lines output file.
+
+
+class ProcessedPathsTest(unittest.TestCase):
+    def test_failed_and_broken_lines_are_processed_again(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output_filename = os.path.join(directory, "results.jsonl")
+            with open(output_filename, "w") as output_file:
+                output_file.write(json.dumps({"path": "a.png", "bounding_box": [1, 2, 3, 4]}) + "\n")
+                output_file.write(json.dumps({"path": "b.png", "error": "FormatError: not a PNG file"}) + "\n")
+                output_file.write('{"path": "c.png", "bounding_b')
+            self.assertEqual(QRCodeDetectionBatch.readProcessedPaths(output_filename), {"a.png"})
+
+    def test_missing_output_file(self):
+        self.assertEqual(QRCodeDetectionBatch.readProcessedPaths(os.path.join(REPOSITORY, "missing.jsonl")), set())
+
+    def test_process_image_files(self):
+        filename = os.path.join(REPOSITORY, "images", "covid19QRCode", "challenging", "connecticut.png")
+        output_file = io.StringIO()
+        failed = QRCodeDetectionBatch.processImageFiles([filename, __file__], output_file, workers=1)
+        results = {result["path"]: result for result in map(json.loads, output_file.getvalue().splitlines())}
+        self.assertEqual(failed, 1)
+        self.assertEqual(results[filename]["bounding_box"], [298, 93, 418, 238])
+        self.assertIn("error", results[__file__])
+
+
+if __name__ == "__main__":
+    unittest.main()
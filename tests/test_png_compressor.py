@@ -0,0 +1,100 @@
+import io
+import os
+import random
+import sys
+import unittest
+import unittest.mock
+import zlib
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+import imageIO.png
+
+# imageIO.png.ParallelCompressor, directly and through imageIO.png.Writer(workers=...): the png files it writes must
+# be read back by imageIO.png.Reader with the same rows, and its zlib streams must inflate to the data given to it.
+
+STRATEGIES = {"default": zlib.Z_DEFAULT_STRATEGY, "filtered": zlib.Z_FILTERED, "huffman only": zlib.Z_HUFFMAN_ONLY,
+              "rle": zlib.Z_RLE, "fixed": zlib.Z_FIXED}
+
+
+# rows of an rgb image with smooth gradients (which the preset dictionaries help to compress) and some noise
+def createTestRows(width, height, seed = 0):
+    generator = random.Random(seed)
+    return [[(x * (c + 1) + y + (generator.randint(0, 3) if x % 5 == 0 else 0)) % 256 for x in range(width)
+             for c in range(3)] for y in range(height)]
+
+
+def writeAndRead(rows, width, height, **options):
+    file = io.BytesIO()
+    imageIO.png.Writer(width, height, greyscale=False, **options).write(file, rows)
+    data = file.getvalue()
+    (width, height, read_rows, info) = imageIO.png.Reader(bytes=data).read()
+    return ([list(row) for row in read_rows], data.count(b"IDAT"))
+
+
+class ParallelCompressorTest(unittest.TestCase):
+    def test_round_trips(self):
+        rows = createTestRows(97, 61)
+        # with workers = 1 the Writer uses a single zlib.compressobj instead, the reference for the other cases
+        for workers in (1, 2, 3):
+            # small limits give many blocks, each with the data before it as preset dictionary
+            for chunk_limit in (1, 100, 4096, 2 ** 20):
+                for filtering in (None, "balanced"):
+                    with self.subTest(workers=workers, chunk_limit=chunk_limit, filtering=filtering):
+                        (read_rows, idat_chunks) = writeAndRead(rows, 97, 61, workers=workers,
+                                                                chunk_limit=chunk_limit, filtering=filtering)
+                        self.assertEqual(read_rows, rows)
+                        if workers > 1 and chunk_limit <= 100:
+                            self.assertGreater(idat_chunks, 10)
+
+    def test_strategies(self):
+        rows = createTestRows(50, 40, 1)
+        for name, strategy in STRATEGIES.items():
+            for compression in (None, 0, 1, 9):
+                with self.subTest(strategy=name, compression=compression):
+                    (read_rows, idat_chunks) = writeAndRead(rows, 50, 40, workers=3, chunk_limit=500,
+                                                            compression=compression, strategy=strategy)
+                    self.assertEqual(read_rows, rows)
+
+    def test_zlib_stream(self):
+        generator = random.Random(2)
+        blocks = [bytes(generator.choice(b"abc ") for i in range(generator.randint(0, 50000))) for j in range(9)]
+        for level in (None, 0, 1, 5, 6, 9):
+            with self.subTest(level=level):
+                compressor = imageIO.png.ParallelCompressor(level, workers=3)
+                stream = b"".join(compressor.compress(block) for block in blocks) + compressor.flush()
+                self.assertEqual(zlib.decompress(stream), b"".join(blocks))
+
+    def test_close_after_a_failed_block(self):
+        failure = RuntimeError("compression failed")
+        compress_block = imageIO.png.compress_block
+
+        def failSecondBlock(data, level, dictionary, strategy):
+            if dictionary:
+                raise failure
+            return compress_block(data, level, dictionary, strategy)
+
+        compressors = []
+        original_init = imageIO.png.ParallelCompressor.__init__
+
+        def keepCompressor(compressor, *args, **kwargs):
+            original_init(compressor, *args, **kwargs)
+            compressors.append(compressor)
+
+        with unittest.mock.patch("imageIO.png.compress_block", failSecondBlock), \
+                unittest.mock.patch.object(imageIO.png.ParallelCompressor, "__init__", keepCompressor):
+            with self.assertRaises(RuntimeError) as raised:
+                writeAndRead(createTestRows(40, 40), 40, 40, workers=2, chunk_limit=100)
+        self.assertIs(raised.exception, failure)
+        # the Writer closed the compressor: nothing is pending and its threads have stopped
+        (compressor,) = compressors
+        self.assertEqual(len(compressor.pending), 0)
+        with self.assertRaises(RuntimeError):
+            compressor.executor.submit(print)
+        # closing again does nothing
+        compressor.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+import glob
+import io
+import os
+import random
+import struct
+import sys
+import unittest
+import warnings
+import zlib
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+import imageIO.png
+
+# imageIO.png.Decoder, fed png data in pieces of random sizes, against imageIO.png.Reader on the whole file.
+
+IMAGES = sorted(glob.glob(os.path.join(REPOSITORY, "images", "covid19QRCode", "**", "*.png"), recursive=True))
+
+
+# small png files of every bit depth and colour type, straightlaced and interlaced
+def writeTestImages():
+    generator = random.Random(0)
+    images = {}
+    for greyscale, alpha, bitdepths in [(True, False, (1, 2, 4, 8, 16)), (False, False, (8, 16)),
+                                        (True, True, (8, 16)), (False, True, (8, 16))]:
+        for bitdepth in bitdepths:
+            for interlace in (False, True):
+                (width, height) = (generator.randint(1, 13), generator.randint(1, 11))
+                planes = (1 if greyscale else 3) + alpha
+                rows = [[generator.randint(0, 2 ** bitdepth - 1) for x in range(width * planes)] for y in range(height)]
+                file = io.BytesIO()
+                imageIO.png.Writer(width, height, greyscale=greyscale, alpha=alpha, bitdepth=bitdepth,
+                                   interlace=interlace).write(file, rows)
+                images["grey" * greyscale + "rgb" * (not greyscale) + "a" * alpha + str(bitdepth)
+                       + "i" * interlace] = file.getvalue()
+    file = io.BytesIO()
+    palette = [(10, 200, 30, 0), (0, 0, 0, 128), (255, 0, 0), (1, 2, 3)]
+    imageIO.png.Writer(5, 4, palette=palette, bitdepth=2).write(file, [[(x + y) % 4 for x in range(5)] for y in range(4)])
+    images["palette"] = file.getvalue()
+    return images
+
+
+# the pieces of data, 1 to max_piece_size bytes each
+def splitRandomly(data, generator, max_piece_size):
+    pieces = []
+    position = 0
+    while position < len(data):
+        size = generator.randint(1, max_piece_size)
+        pieces.append(data[position:position + size])
+        position += size
+    return pieces
+
+
+# data with a wrong CRC on the first chunk of chunk_type, whose data is left intact
+def corruptChunkCRC(data, chunk_type):
+    data = bytearray(data)
+    start = data.index(chunk_type)
+    (length,) = struct.unpack("!I", data[start - 4:start])
+    data[start + 4 + length] ^= 0xff
+    return bytes(data)
+
+
+def readFile(filename):
+    with open(filename, "rb") as file:
+        return file.read()
+
+
+def decodeRows(decoder, pieces):
+    rows = []
+    for piece in pieces:
+        rows.extend(decoder.feed(piece))
+    decoder.close()
+    return [list(row) for row in rows]
+
+
+class DecoderTest(unittest.TestCase):
+    images = writeTestImages()
+
+    def test_random_feed_sizes(self):
+        generator = random.Random(1)
+        sources = list(self.images.items()) + [(os.path.basename(filename), readFile(filename))
+                                               for filename in IMAGES[:2]]
+        for name, data in sources:
+            (width, height, rows, info) = imageIO.png.Reader(bytes=data).read()
+            expected = [list(row) for row in rows]
+            for max_piece_size in (1, 7, 100, 5000, len(data)):
+                with self.subTest(image=name, max_piece_size=max_piece_size):
+                    if max_piece_size == 1 and len(data) > 5000:
+                        continue
+                    decoder = imageIO.png.Decoder()
+                    self.assertEqual(decodeRows(decoder, splitRandomly(data, generator, max_piece_size)), expected)
+                    self.assertEqual((decoder.width, decoder.height, decoder.row_count), (width, height, height))
+                    self.assertEqual(decoder.rows, [])
+
+    def test_rows_arrive_before_the_end(self):
+        for name in ("rgb8", "grey16", "grey1"):
+            data = self.images[name]
+            decoder = imageIO.png.Decoder()
+            rows = decoder.feed(data[:data.index(b"IEND") - 8])
+            self.assertEqual(len(rows), decoder.height)
+            with self.assertRaises(imageIO.png.FormatError):
+                decoder.close()
+
+    def test_interlaced_rows_arrive_at_the_end(self):
+        data = self.images["rgb8i"]
+        decoder = imageIO.png.Decoder()
+        self.assertEqual(decoder.feed(data[:data.index(b"IEND") - 4]), [])
+        self.assertEqual(len(decoder.feed(data[data.index(b"IEND") - 4:])), decoder.height)
+        decoder.close()
+
+    def test_keep_rows(self):
+        for name, data in self.images.items():
+            with self.subTest(image=name):
+                decoder = imageIO.png.Decoder(keep_rows=True)
+                with self.assertRaises(imageIO.png.FormatError):
+                    decoder.read()
+                for piece in splitRandomly(data, random.Random(2), 50):
+                    decoder.feed(piece)
+                for method in ("read", "asDirect", "asRGBA8"):
+                    (width, height, rows, info) = getattr(imageIO.png.Reader(bytes=data), method)()
+                    (decoded_width, decoded_height, decoded_rows, decoded_info) = getattr(decoder, method)()
+                    self.assertEqual([list(row) for row in decoded_rows], [list(row) for row in rows])
+                    self.assertEqual(decoded_info, info)
+
+    def test_convert_rows(self):
+        for name, data in self.images.items():
+            with self.subTest(image=name):
+                (width, height, rows, info) = imageIO.png.Reader(bytes=data).asDirect()
+                expected = [list(row) for row in rows]
+                decoder = imageIO.png.Decoder()
+                converted = []
+                for piece in splitRandomly(data, random.Random(3), 30):
+                    rows = decoder.feed(piece)
+                    if rows:
+                        (direct_rows, direct_info) = decoder.convert_rows(imageIO.png.Reader.asDirect, rows)
+                        converted.extend(list(row) for row in direct_rows)
+                decoder.close()
+                self.assertEqual(converted, expected)
+                self.assertEqual(direct_info, info)
+
+    def test_read_needs_keep_rows(self):
+        decoder = imageIO.png.Decoder()
+        decoder.feed(self.images["rgb8"])
+        with self.assertRaises(imageIO.png.ProtocolError):
+            decoder.read()
+
+    def test_crc_failures(self):
+        for chunk_type in (b"IHDR", b"IDAT"):
+            data = corruptChunkCRC(self.images["greya8"], chunk_type)
+            with self.subTest(chunk=chunk_type):
+                with self.assertRaises(imageIO.png.ChunkError):
+                    (width, height, rows, info) = imageIO.png.Reader(bytes=data).read()
+                    list(rows)
+                with self.assertRaises(imageIO.png.ChunkError):
+                    decodeRows(imageIO.png.Decoder(), splitRandomly(data, random.Random(4), 9))
+
+    def test_lenient_crc_failure(self):
+        data = corruptChunkCRC(self.images["rgb16"], b"IHDR")
+        (width, height, rows, info) = imageIO.png.Reader(bytes=self.images["rgb16"]).read()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            self.assertEqual(decodeRows(imageIO.png.Decoder(lenient=True), [data]), [list(row) for row in rows])
+        self.assertEqual(len(caught), 1)
+
+    def test_invalid_data(self):
+        with self.assertRaises(imageIO.png.FormatError):
+            imageIO.png.Decoder().feed(b"this is not a png file")
+        data = bytearray(self.images["grey8"])
+        start = data.index(b"IDAT")
+        (length,) = struct.unpack("!I", data[start - 4:start])
+        data[start + 6] ^= 0xff
+        data[start + 4 + length:start + 8 + length] = struct.pack("!I", zlib.crc32(data[start:start + 4 + length]))
+        with self.assertRaises(imageIO.png.FormatError):
+            decodeRows(imageIO.png.Decoder(), [bytes(data)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import importlib.util
+import os
+import random
+import sys
+import unittest
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+import imageIO.png
+
+# The functions that undo the png filters, on random scanlines, against the definitions of the png specification
+# (http://www.w3.org/TR/PNG/#9Filters) computed one byte at a time. Only Sub and Up have numpy versions; Average and
+# Paeth are always the pure python functions (see imageIO.png.get_undo_filters).
+
+PYTHON_FILTERS = (None, imageIO.png.undo_filter_sub, imageIO.png.undo_filter_up, imageIO.png.undo_filter_average,
+                  imageIO.png.undo_filter_paeth)
+NUMPY_FILTERS = (None, imageIO.png.numpy_undo_filter_sub, imageIO.png.numpy_undo_filter_up,
+                 imageIO.png.undo_filter_average, imageIO.png.undo_filter_paeth)
+
+
+def paethPredictor(a, b, c):
+    p = a + b - c
+    (pa, pb, pc) = (abs(p - a), abs(p - b), abs(p - c))
+    if pa <= pb and pa <= pc:
+        return a
+    if pb <= pc:
+        return b
+    return c
+
+
+# the unfiltered scanline, one byte at a time
+def undoFilterReference(filter_type, filter_unit, scanline, previous):
+    result = bytearray(len(scanline))
+    for i, x in enumerate(scanline):
+        a = result[i - filter_unit] if i >= filter_unit else 0
+        b = previous[i]
+        c = previous[i - filter_unit] if i >= filter_unit else 0
+        predictor = (0, a, b, (a + b) >> 1, paethPredictor(a, b, c))[filter_type]
+        result[i] = (x + predictor) & 0xff
+    return result
+
+
+# random scanlines of whole pixels of filter_unit bytes, and a few that end in a partial pixel
+def randomScanlines(generator, filter_unit):
+    for width in (1, 2, 3, 17, 64):
+        for extra in (0, 1):
+            size = width * filter_unit + extra
+            yield (bytes(generator.getrandbits(8) for i in range(size)),
+                   bytes(generator.getrandbits(8) for i in range(size)))
+    # the first scanline of an image, or of an interlace pass, is unfiltered against a row of zeros
+    yield (bytes(generator.getrandbits(8) for i in range(5 * filter_unit)), bytes(5 * filter_unit))
+
+
+class UndoFilterTest(unittest.TestCase):
+    def assertFiltersMatchReference(self, filters):
+        generator = random.Random(0)
+        for filter_unit in range(1, 9):
+            for filter_type in range(1, 5):
+                for scanline, previous in randomScanlines(generator, filter_unit):
+                    with self.subTest(filter_type=filter_type, filter_unit=filter_unit, size=len(scanline)):
+                        expected = undoFilterReference(filter_type, filter_unit, scanline, previous)
+                        # the scanlines of imageIO.png.Decoder are memoryviews of its buffer
+                        for source in (scanline, memoryview(bytearray(scanline))):
+                            result = bytearray(len(scanline))
+                            filters[filter_type](filter_unit, source, previous, result)
+                            self.assertEqual(result, expected)
+
+    def test_python(self):
+        self.assertFiltersMatchReference(PYTHON_FILTERS)
+
+    @unittest.skipUnless(importlib.util.find_spec("numpy"), "numpy is not installed")
+    def test_numpy(self):
+        self.assertFiltersMatchReference(NUMPY_FILTERS)
+        self.assertEqual(imageIO.png.get_undo_filters(), NUMPY_FILTERS)
+
+    def test_undo_filter(self):
+        # Reader.undo_filter in place, for every filter type including None (0); psize is the filter unit
+        reader = imageIO.png.Reader(bytes=b"")
+        generator = random.Random(1)
+        for filter_unit in range(1, 9):
+            reader.psize = filter_unit
+            for filter_type in range(5):
+                for scanline, previous in randomScanlines(generator, filter_unit):
+                    with self.subTest(filter_type=filter_type, filter_unit=filter_unit, size=len(scanline)):
+                        expected = undoFilterReference(filter_type, filter_unit, scanline, previous)
+                        if not any(previous):
+                            previous = None
+                        self.assertEqual(reader.undo_filter(filter_type, bytearray(scanline), previous), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
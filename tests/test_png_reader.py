@@ -0,0 +1,337 @@
+import io
+import os
+import random
+import struct
+import sys
+import tempfile
+import tracemalloc
+import unittest
+import unittest.mock
+import weakref
+import zlib
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+import imageIO.png
+
+# imageIO.png.Reader on small png files written for each test.
+
+
+# a png file with the given IHDR values and idat_data, in IDAT chunks of at most idat_size bytes (one chunk by default)
+def createPNG(width, height, idat_data, bitdepth = 8, colortype = 0, interlace = 0, idat_size = None):
+    idat_size = idat_size or len(idat_data)
+    chunks = [(b"IHDR", struct.pack("!2I5B", width, height, bitdepth, colortype, 0, 0, interlace))]
+    chunks.extend((b"IDAT", idat_data[i:i + idat_size]) for i in range(0, len(idat_data), idat_size))
+    chunks.append((b"IEND", b""))
+    file = io.BytesIO()
+    imageIO.png.write_chunks(file, chunks)
+    return file.getvalue()
+
+
+def readRows(data):
+    (width, height, rows, info) = imageIO.png.Reader(bytes=data).read()
+    return [list(row) for row in rows]
+
+
+def paethPredictor(a, b, c):
+    p = a + b - c
+    (pa, pb, pc) = (abs(p - a), abs(p - b), abs(p - c))
+    if pa <= pb and pa <= pc:
+        return a
+    if pb <= pc:
+        return b
+    return c
+
+
+# the scanline of filter_type for the raw bytes of a row, following http://www.w3.org/TR/PNG/#9Filters one byte at a time
+def filterScanline(filter_type, filter_unit, row, previous):
+    scanline = bytearray([filter_type])
+    for i, x in enumerate(row):
+        a = row[i - filter_unit] if i >= filter_unit else 0
+        b = previous[i]
+        c = previous[i - filter_unit] if i >= filter_unit else 0
+        predictor = (0, a, b, (a + b) >> 1, paethPredictor(a, b, c))[filter_type]
+        scanline.append((x - predictor) & 0xff)
+    return scanline
+
+
+# random raw rows of row_bytes bytes, and a png file holding them with every filter type in turn (and then at random)
+def createFilteredPNG(width, height, bitdepth, colortype, seed = 0, idat_size = None):
+    generator = random.Random(seed)
+    planes = {0: 1, 2: 3, 4: 2, 6: 4}[colortype]
+    filter_unit = max(1, planes * bitdepth // 8)
+    row_bytes = (width * planes * bitdepth + 7) // 8
+    rows = [bytes(generator.getrandbits(8) for i in range(row_bytes)) for y in range(height)]
+    if bitdepth < 8:
+        # the unused bits at the end of a row are 0
+        unused = row_bytes * 8 - width * bitdepth
+        rows = [row[:-1] + bytes([row[-1] >> unused << unused]) for row in rows]
+    previous = bytes(row_bytes)
+    scanlines = bytearray()
+    for y, row in enumerate(rows):
+        filter_type = y if y < 5 else generator.randint(0, 4)
+        scanlines += filterScanline(filter_type, filter_unit, row, previous)
+        previous = row
+    return (rows, createPNG(width, height, zlib.compress(scanlines), bitdepth, colortype, idat_size=idat_size))
+
+
+# the packed rows of a straightlaced png file, as imageIO.png.Reader yields them before they are converted to values
+def iterPackedRows(data):
+    reader = imageIO.png.Reader(bytes=data)
+    reader.preamble()
+    return reader._iter_packed_rows()
+
+
+class DecompressionBombTest(unittest.TestCase):
+    # 256 MiB of zeros compress to 256 KiB, for a 16 x 16 image that needs 272 bytes
+    size = 256 * 2 ** 20
+    bomb = zlib.compress(bytes(size), 9)
+
+    def assertRaisesEarly(self, function):
+        tracemalloc.start()
+        try:
+            with self.assertRaisesRegex(imageIO.png.FormatError, "larger than the image"):
+                function()
+            (current, peak) = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        # the inflated data is never allocated in full, only a few steps of it
+        self.assertLess(peak, 2 ** 20 + 2 * len(self.bomb))
+
+    def test_reader(self):
+        for interlace in (0, 1):
+            with self.subTest(interlace=interlace):
+                data = createPNG(16, 16, self.bomb, interlace=interlace)
+                self.assertRaisesEarly(lambda: readRows(data))
+                self.assertRaisesEarly(lambda: list(imageIO.png.Reader(bytes=data).asDirect()[2]))
+
+    def test_decoder(self):
+        data = createPNG(16, 16, self.bomb)
+        self.assertRaisesEarly(lambda: imageIO.png.Decoder().feed(data))
+
+    def test_decompress(self):
+        # at most 100 bytes are inflated at a time, and the third piece would go past the limit of 272 bytes
+        pieces = []
+        with self.assertRaises(imageIO.png.FormatError):
+            for piece in imageIO.png.decompress([self.bomb], 100, 272):
+                pieces.append(len(piece))
+        self.assertEqual(pieces, [100, 100])
+
+    def test_extra_data_at_the_end(self):
+        # a single byte more than the image needs is already too much
+        raw = bytes(16 * 17 + 1)
+        with self.assertRaises(imageIO.png.FormatError):
+            readRows(createPNG(16, 16, zlib.compress(raw)))
+        self.assertEqual(readRows(createPNG(16, 16, zlib.compress(raw[:-1]))), [[0] * 16] * 16)
+
+
+class RowBufferTest(unittest.TestCase):
+    # (width, height, bitdepth, colortype): filter units 1 to 8, rows much shorter than a decompression step (so many
+    # rows come from one step), and rows longer than a step (so every row is split across steps)
+    images = [(13, 40, 8, 0), (7, 30, 8, 4), (300, 20, 8, 2), (9, 60, 8, 6), (5, 12, 16, 0), (6, 11, 16, 4),
+              (4000, 3, 16, 2), (11, 9, 16, 6), (77, 10, 1, 0)]
+
+    def test_rows_match_the_raw_data(self):
+        for width, height, bitdepth, colortype in self.images:
+            with self.subTest(width=width, bitdepth=bitdepth, colortype=colortype):
+                (rows, data) = createFilteredPNG(width, height, bitdepth, colortype)
+                # a row must be copied before the next one is asked for
+                self.assertEqual([bytes(row) for row in iterPackedRows(data)], rows)
+                # the rows of values are new objects, which do not change when the next rows come in; the Decoder is
+                # fed the whole file at once and one byte at a time
+                expected = readRows(data)
+                self.assertEqual(len(expected), height)
+                for pieces in ([data], [data[i:i + 1] for i in range(len(data))]):
+                    decoder = imageIO.png.Decoder()
+                    decoded = []
+                    for piece in pieces:
+                        decoded.extend(decoder.feed(piece))
+                    self.assertEqual(len(set(map(id, decoded))), height)
+                    self.assertEqual([list(row) for row in decoded], expected)
+
+    def test_packed_rows_are_reused(self):
+        # two row buffers take turns: the rows yielded are only valid until the next row (the one before is read
+        # while unfiltering it, and overwritten by the row after)
+        (rows, data) = createFilteredPNG(13, 40, 8, 2)
+        buffers = set()
+        previous = None
+        for y, row in enumerate(iterPackedRows(data)):
+            buffers.add(id(row))
+            self.assertEqual(bytes(row), rows[y])
+            if previous is not None:
+                self.assertIsNot(row, previous)
+            previous = row
+        self.assertEqual(len(buffers), 2)
+        kept = list(iterPackedRows(data))
+        self.assertEqual([bytes(row) for row in kept[-2:]], rows[-2:])
+        self.assertNotEqual([bytes(row) for row in kept], rows)
+
+    def test_read_copies_the_rows(self):
+        (rows, data) = createFilteredPNG(9, 60, 8, 6)
+        (width, height, values, info) = imageIO.png.Reader(bytes=data).read()
+        self.assertEqual(list(values), [bytearray(row) for row in rows])
+
+
+# the bytes of a row of samples of bitdepth (1, 2 or 4) packed most significant bits first, with the unused bits of the
+# last byte set to 0, built up as a string of bits
+def packReference(values, bitdepth):
+    bits = "".join(format(value, "0{}b".format(bitdepth)) for value in values)
+    bits += "0" * (-len(bits) % 8)
+    return bytes(int(bits[i:i + 8], 2) for i in range(0, len(bits), 8))
+
+
+class SubByteTest(unittest.TestCase):
+    def test_unpack_table(self):
+        for bitdepth in (1, 2, 4):
+            with self.subTest(bitdepth=bitdepth):
+                table = imageIO.png.unpack_table(bitdepth)
+                for byte in range(256):
+                    bits = format(byte, "08b")
+                    self.assertEqual(table[byte], bytes(int(bits[i:i + bitdepth], 2) for i in range(0, 8, bitdepth)))
+
+    def test_pack_and_unpack(self):
+        generator = random.Random(3)
+        for bitdepth in (1, 2, 4):
+            # widths that fill the last byte, and widths that leave bits unused
+            for width in (1, 2, 3, 7, 8, 9, 16, 33, 1001):
+                with self.subTest(bitdepth=bitdepth, width=width):
+                    rows = [[generator.randint(0, 2 ** bitdepth - 1) for x in range(width)] for y in range(5)]
+                    packed = [packReference(row, bitdepth) for row in rows]
+                    self.assertEqual([bytes(row) for row in imageIO.png.pack_rows(rows, bitdepth)], packed)
+                    # a png file of the reference rows, unfiltered, and the files the Writer creates
+                    data = createPNG(width, 5, zlib.compress(b"".join(b"\0" + row for row in packed)), bitdepth)
+                    self.assertEqual(readRows(data), rows)
+                    for interlace in (False, True):
+                        file = io.BytesIO()
+                        writer = imageIO.png.Writer(width, 5, greyscale=True, bitdepth=bitdepth, interlace=interlace)
+                        writer.write(file, rows)
+                        self.assertEqual(readRows(file.getvalue()), rows)
+
+
+class SixteenBitTest(unittest.TestCase):
+    # every 16 bit value once, in a greyscale image of 256 x 256 pixels
+    values = list(range(2 ** 16))
+    rows = [list(range(y * 256, (y + 1) * 256)) for y in range(256)]
+
+    def createSixteenBitPNG(self):
+        # the samples are big endian, see http://www.w3.org/TR/PNG/#7Integers-and-byte-order
+        return createPNG(256, 256, zlib.compress(b"".join(b"\0" + struct.pack("!256H", *row) for row in self.rows)),
+                         16)
+
+    def test_read(self):
+        self.assertEqual(readRows(self.createSixteenBitPNG()), self.rows)
+
+    def test_write(self):
+        self.assertEqual([bytes(row) for row in imageIO.png.unpack_rows(self.rows)],
+                         [struct.pack("!256H", *row) for row in self.rows])
+        file = io.BytesIO()
+        imageIO.png.Writer(256, 256, greyscale=True, bitdepth=16).write(file, self.rows)
+        self.assertEqual(readRows(file.getvalue()), self.rows)
+
+    def test_rescale(self):
+        # Reader._as_rescale gives int(round(x * factor)) for every value, with numpy and without it
+        expected = [int(round(x * 255 / 65535)) for x in self.values]
+        numpy_modules = [None]
+        if imageIO.png.import_numpy() is not None:
+            numpy_modules.append(imageIO.png.import_numpy())
+        for numpy in numpy_modules:
+            with self.subTest(numpy=numpy is not None), unittest.mock.patch.object(imageIO.png, "_numpy", numpy):
+                (width, height, rows, info) = imageIO.png.Reader(bytes=self.createSixteenBitPNG()).asRGB8()
+                self.assertEqual(info["bitdepth"], 8)
+                self.assertEqual([value for row in rows for value in row[::3]], expected)
+                (width, height, rows, info) = imageIO.png.Reader(bytes=self.createSixteenBitPNG()).asLuma8()
+                self.assertEqual([value for row in rows for value in row], expected)
+                # 2 bit values are scaled up
+                data = createPNG(4, 1, zlib.compress(b"\0" + packReference([0, 1, 2, 3], 2)), 2)
+                (width, height, rows, info) = imageIO.png.Reader(bytes=data).asRGBA8()
+                self.assertEqual(list(next(iter(rows))), [0, 0, 0, 255, 85, 85, 85, 255, 170, 170, 170, 255,
+                                                          255, 255, 255, 255])
+
+
+class InputTest(unittest.TestCase):
+    def setUp(self):
+        # a file of several IDAT chunks
+        (self.rows, self.data) = createFilteredPNG(40, 30, 8, 2, idat_size=500)
+        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as file:
+            file.write(self.data)
+        self.filename = file.name
+        self.addCleanup(os.remove, self.filename)
+
+    def createReaders(self):
+        return {"filename": imageIO.png.Reader(filename=self.filename),
+                "memory map": imageIO.png.Reader(filename=self.filename, memory_map=True),
+                "file": imageIO.png.Reader(file=io.BytesIO(self.data)),
+                "bytes": imageIO.png.Reader(bytes=self.data),
+                "bytearray": imageIO.png.Reader(bytes=bytearray(self.data)),
+                "memoryview": imageIO.png.Reader(bytes=memoryview(self.data)),
+                "memoryview slice": imageIO.png.Reader(bytes=memoryview(b"xx" + self.data + b"xx")[2:-2])}
+
+    def test_inputs(self):
+        for name, reader in self.createReaders().items():
+            with self.subTest(input=name), reader:
+                (width, height, rows, info) = reader.read()
+                self.assertEqual([bytes(row) for row in rows], self.rows)
+                self.assertEqual((width, height, info["bitdepth"], info["planes"]), (40, 30, 8, 3))
+
+    def test_idat_data_is_not_copied(self):
+        for name, reader in self.createReaders().items():
+            with self.subTest(input=name), reader:
+                idat = [data for chunk_type, data in reader.chunks() if chunk_type == b"IDAT"]
+                self.assertEqual(zlib.decompress(b"".join(idat))[:1], b"\0")
+                # the IDAT data of a file that is read is copied out of it, and is a view of data in memory
+                in_memory = name not in ("filename", "file")
+                self.assertEqual({isinstance(data, memoryview) for data in idat}, {in_memory})
+                del idat
+
+    def test_close(self):
+        reader = imageIO.png.Reader(filename=self.filename)
+        reader.preamble()
+        file = reader.file
+        reader.close()
+        self.assertTrue(file.closed)
+        # a file given to the reader stays open
+        file = io.BytesIO(self.data)
+        with imageIO.png.Reader(file=file) as reader:
+            reader.read()
+        self.assertFalse(file.closed)
+        # the mapping is closed, and a closed reader can be closed again
+        with imageIO.png.Reader(filename=self.filename, memory_map=True) as reader:
+            mapping = reader._mmap
+            readRows(self.data)
+        self.assertTrue(mapping.closed)
+        reader.close()
+
+    def test_close_with_exported_buffers(self):
+        # the IDAT data returned by chunk, and a row iterator that is not used up, still hold views of the mapping: close
+        # leaves the mapping to them, and it is unmapped once they are gone
+        reader = imageIO.png.Reader(filename=self.filename, memory_map=True)
+        mapping = weakref.ref(reader._mmap)
+        while True:
+            (chunk_type, data) = reader.chunk()
+            if chunk_type == b"IDAT":
+                break
+        reader.close()
+        self.assertFalse(mapping().closed)
+        self.assertEqual(zlib.decompressobj().decompress(data)[:1], b"\0")
+        del data
+        self.assertIsNone(mapping())
+
+        reader = imageIO.png.Reader(filename=self.filename, memory_map=True)
+        mapping = weakref.ref(reader._mmap)
+        (width, height, rows, info) = reader.read()
+        self.assertEqual(bytes(next(rows)), self.rows[0])
+        reader.close()
+        del rows
+        self.assertIsNone(mapping())
+
+    def test_empty_file(self):
+        with open(self.filename, "wb"):
+            pass
+        with imageIO.png.Reader(filename=self.filename, memory_map=True) as reader:
+            with self.assertRaises(imageIO.png.FormatError):
+                reader.read()
+
+
+if __name__ == "__main__":
+    unittest.main()
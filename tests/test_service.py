@@ -0,0 +1,92 @@
+import http.client
+import io
+import json
+import os
+import struct
+import sys
+import threading
+import unittest
+import zlib
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+import QRCodeDetectionService
+import imageIO.png
+
+# Requests to the detection service, over HTTP on a free local port.
+
+IMAGE = os.path.join(REPOSITORY, "images", "covid19QRCode", "challenging", "connecticut.png")
+
+
+# png data whose IDAT chunk holds corrupt deflate data (with a valid CRC, so only the decompression fails)
+def corruptDeflatePNG():
+    file = io.BytesIO()
+    imageIO.png.Writer(16, 16, greyscale=True).write(file, [[x * y for x in range(16)] for y in range(16)])
+    data = bytearray(file.getvalue())
+    start = data.index(b"IDAT")
+    (length,) = struct.unpack("!I", data[start - 4:start])
+    data[start + 6] ^= 0xff
+    data[start + 4 + length:start + 8 + length] = struct.pack("!I", zlib.crc32(data[start:start + 4 + length]))
+    return bytes(data)
+
+
+class ServiceTest(unittest.TestCase):
+    def startService(self, service):
+        server = QRCodeDetectionService.createServer("127.0.0.1:0", service)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+            service.close()
+        self.addCleanup(stop)
+        return server.server_address[1]
+
+    def request(self, port, method, path, body = None):
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        try:
+            connection.request(method, path, body)
+            response = connection.getresponse()
+            return response.status, json.loads(response.read()), response.getheader("Retry-After")
+        finally:
+            connection.close()
+
+    def test_uploads(self):
+        port = self.startService(QRCodeDetectionService.DetectionService())
+        with open(IMAGE, "rb") as file:
+            data = file.read()
+
+        (status, content, retry_after) = self.request(port, "POST", "/detect", data)
+        self.assertEqual(status, 200)
+        self.assertEqual(content["bounding_box"], [298, 93, 418, 238])
+        self.assertGreaterEqual(content["latency"]["total"], content["latency"]["detection"])
+
+        invalid_uploads = {"malformed": b"this is not a png file", "truncated": data[:len(data) // 2],
+                           "corrupt deflate": corruptDeflatePNG()}
+        for name, body in invalid_uploads.items():
+            with self.subTest(upload=name):
+                (status, content, retry_after) = self.request(port, "POST", "/detect", body)
+                self.assertEqual(status, 400)
+                self.assertRegex(content["error"], "^(Format|Chunk)Error")
+
+        (status, statistics, retry_after) = self.request(port, "GET", "/stats")
+        self.assertEqual(status, 200)
+        self.assertEqual((statistics["served"], statistics["invalid"], statistics["failed"]), (4, 3, 0))
+
+    def test_full_queue(self):
+        # without detection threads, the queued job is never taken, so the queue stays full
+        service = QRCodeDetectionService.DetectionService(workers=0, queue_size=1)
+        port = self.startService(service)
+        self.assertIsNotNone(service.submit(b""))
+
+        (status, content, retry_after) = self.request(port, "POST", "/detect", b"\x89PNG")
+        self.assertEqual(status, 503)
+        self.assertEqual(retry_after, "1")
+        (status, statistics, retry_after) = self.request(port, "GET", "/stats")
+        self.assertEqual((statistics["rejected"], statistics["queued"]), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
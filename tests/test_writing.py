@@ -0,0 +1,76 @@
+import io
+import os
+import sys
+import unittest
+import unittest.mock
+import zlib
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+import QRCodeDetection
+import imageIO.png
+
+# Round trips of greyscale pixel arrays through writeGreyscalePixelArrayToPNGFile and readGreyscaleImageToPixelArray.
+
+
+def writeAndRead(pixel_array, image_width, image_height, **options):
+    file = io.BytesIO()
+    QRCodeDetection.writeGreyscalePixelArrayToPNGFile(file, pixel_array, image_width, image_height, **options)
+    (image_width, image_height, pixel_array) = QRCodeDetection.readGreyscaleImageToPixelArray(file.getvalue())
+    return [list(row) for row in pixel_array]
+
+
+class WriteGreyscaleTest(unittest.TestCase):
+    mask = [[0, 1, 1, 0], [1, 0, 0, 1], [0, 0, 1, 1]]
+
+    def test_binary_mask_is_read_back_as_255(self):
+        expected = [[255 * v for v in row] for row in self.mask]
+        self.assertEqual(writeAndRead(self.mask, 4, 3), expected)
+        self.assertEqual(writeAndRead(self.mask, 4, 3, binary=True), expected)
+        self.assertEqual(writeAndRead(expected, 4, 3, binary=True), expected)
+
+    def test_binary_mask_strategy(self):
+        # binary masks are compressed with Z_RLE at every level, unless another strategy is asked for
+        expected = [[255 * v for v in row] for row in self.mask]
+        for options, strategy in (({}, zlib.Z_RLE), ({"compression": 9}, zlib.Z_RLE), ({"compression": 1}, zlib.Z_RLE),
+                                  ({"compression": 9, "strategy": zlib.Z_FILTERED}, zlib.Z_FILTERED)):
+            with self.subTest(**options), unittest.mock.patch.object(imageIO.png, "Writer",
+                                                                      wraps=imageIO.png.Writer) as writer:
+                self.assertEqual(writeAndRead(self.mask, 4, 3, **options), expected)
+                self.assertEqual(writer.call_args.kwargs["bitdepth"], 1)
+                self.assertEqual(writer.call_args.kwargs["strategy"], strategy)
+
+    def test_binary_false_keeps_the_values(self):
+        self.assertEqual(writeAndRead(self.mask, 4, 3, binary=False), self.mask)
+
+    def test_binary_true_rejects_other_values(self):
+        with self.assertRaises(ValueError):
+            writeAndRead([[0, 1, 2, 0]], 4, 1, binary=True)
+        with self.assertRaises(ValueError):
+            writeAndRead([[0, 1, 255, 0]], 4, 1, binary=True)
+
+    def test_greyscale(self):
+        pixel_array = [[0, 17, 128, 255], [3, 3, 3, 3]]
+        for filtering in (None, "fast", "balanced", "small"):
+            with self.subTest(filtering=filtering):
+                self.assertEqual(writeAndRead(pixel_array, 4, 2, filtering=filtering), pixel_array)
+
+    def test_rows_are_unfiltered_by_default(self):
+        pixel_array = [[(x * y) % 256 for x in range(32)] for y in range(8)]
+        for options in ({}, {"filtering": None}, {"filtering": "balanced"}):
+            with self.subTest(**options):
+                file = io.BytesIO()
+                QRCodeDetection.writeGreyscalePixelArrayToPNGFile(file, pixel_array, 32, 8, **options)
+                reader = imageIO.png.Reader(bytes=file.getvalue())
+                idat = b"".join(bytes(data) for chunk_type, data in reader.chunks() if chunk_type == b"IDAT")
+                # every scanline is its filter type followed by 32 pixels
+                filter_types = set(zlib.decompress(idat)[::33])
+                if options.get("filtering"):
+                    self.assertNotEqual(filter_types, {0})
+                else:
+                    self.assertEqual(filter_types, {0})
+
+
+if __name__ == "__main__":
+    unittest.main()